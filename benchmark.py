@@ -0,0 +1,638 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from cache_data import WRITE_BATCH_SIZE, get_parsers, get_parse_pool, parse_pages
+from database_utils import create_tables, write_to_data_base, close_connections
+from query import QuerySpec, get_argparser, process_query, process_query_line_chart, GamePage, search_names, \
+    autocomplete, export_results, EXPORT_FORMATS, make_bar_chart, make_line_chart
+from load_test import run_load_test, start_server
+from synthetic_corpus import iter_pages, iter_records, make_companies, default_companies
+import columnar
+
+BENCHMARKS = ['parse', 'load', 'queries', 'pages', 'search', 'exports', 'charts', 'flask']
+# query shapes compared between the engines
+QUERY_ARGUMENTS = [
+    '-t games',
+    '-t games -s user -o bottom -l 100',
+    '-t games -p ps4 -r E T M -d 2015-01-01 2019-12-31 -s meta -o top',
+    '-t games -d 2016-03-15 -m online -rl 10',
+    '-t games -g Action Puzzle',
+    '-t games -p switch -g Action Puzzle --genre-match all -s user',
+    '-t games --search dragon',
+    '-t games -p ps4 --search crimson kingdom -s user',
+    '-t companies',
+    '-t companies -p switch -s count -m online',
+    '-t companies -d 2015-01-01 2019-12-31 -r E T -s user',
+    '-t companies -p ps4 -d 2014-03-05 2019-11-20 -s user -o bottom',
+    '-t companies -g Action',
+    '-t companies --search studios',
+    '-t genres',
+    '-t genres -p ps4 -d 2015-01-01 2019-12-31 -s user',
+    '-t games --linechart',
+    '-t games -p ps4 -m offline -d 2016-06-10 --linechart',
+    '-t games -g Shooter --linechart',
+]
+# game queries read page by page, the first page is compared with a page deep into the results
+PAGE_ARGUMENTS = [
+    '-t games -l 50',
+    '-t games -p ps4 -s user -o bottom -l 50',
+    '-t games -g Action -rl 10 -l 50',
+]
+PAGE_DEPTH = 100
+# whole words of many games, of few games, of companies, and prefixes as typed in the search boxes
+SEARCH_TERMS = ['dragon', 'crimson kingdom', 'studios', 'dra', 'eternal dr']
+EXPORT_ARGUMENTS = '-t games'
+# charts rendered by the flask app and the command line
+CHART_ARGUMENTS = [
+    '-t games -l 100 --bar',
+    '-t companies -l 50 --bar',
+    '-t genres --bar',
+    '-t games --linechart',
+]
+
+
+def environment_info():
+    '''Describe where the benchmarks run, to tell apart the runs being compared
+
+    Returns
+    -------
+    info: dict
+        time, git commit, python, sqlite and machine
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def parse_args(argument):
+    '''Make the query of command line arguments
+
+    Parameters
+    ----------
+    argument: str
+        arguments of the query, separated by spaces
+
+    Returns
+    -------
+    spec: QuerySpec
+        the query
+    '''
+    return QuerySpec.from_args(get_argparser().parse_args(argument.split(' ')))
+
+
+def best_time(function, repeat):
+    '''Run a function several times and keep the best time
+
+    Parameters
+    ----------
+    function:
+        function without arguments
+    repeat: int
+        number of runs
+
+    Returns
+    -------
+    result:
+        result of the last run
+    seconds: float
+        time of the fastest run
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def benchmark_parsing(num_games, num_companies=None, seed=0, backends=('bs4', 'lxml'), workers=1):
+    '''Measure the parsing throughput of each kind of page of a synthetic corpus, and check the parsed records
+
+    Parameters
+    ----------
+    num_games: int
+        number of games of the corpus
+    num_companies: int
+        number of companies, default_companies if None
+    seed: int
+        random seed
+    backends: list
+        parser backends, bs4|lxml
+    workers: int
+        number of parsing processes
+
+    Returns
+    -------
+    results: dict
+        for each backend and kind of page, the pages, seconds, pages and megabytes per second, and whether the
+        records are those of the corpus
+    '''
+    if num_companies is None:
+        num_companies = default_companies(num_games)
+    pages = {'listing': [], 'detail': [], 'company': []}
+    expected = {'listing': [], 'detail': [], 'company': []}
+    review_counts = {url: count for _, url, count in make_companies(num_companies, seed)}
+    for _, kind, url, page in iter_pages(num_games, num_companies, seed):
+        if kind == 'listing' and url.endswith('metascore'):
+            # the bare url repeats the first page
+            continue
+        pages[kind].append(page)
+        if kind == 'company':
+            expected['company'].append(review_counts[url])
+    for _, game_infos in iter_records(num_games, num_companies, seed):
+        expected['listing'].extend(game_info[:5] for game_info in game_infos)
+        expected['detail'].extend(game_info[5:] for game_info in game_infos)
+    if workers > 1:
+        # start the parsing processes outside the timings
+        list(get_parse_pool(workers).map(len, [''] * workers))
+    results = {}
+    for backend in backends:
+        try:
+            parsers = get_parsers(backend)
+        except ValueError as e:
+            print(f"Skipping the {backend} parsers: {e}")
+            continue
+        for kind, kind_pages in pages.items():
+            start = time.perf_counter()
+            records = parse_pages(parsers[kind], kind_pages, workers)
+            elapsed = time.perf_counter() - start
+            if kind == 'listing':
+                records = [game for games, _ in records for game in games]
+            elif kind == 'detail':
+                records = [attributes for attributes, _ in records]
+            megabytes = sum(len(page) for page in kind_pages) / 1e6
+            results[f"{backend} {kind}"] = {
+                'pages': len(kind_pages),
+                'seconds': elapsed,
+                'pages_per_second': len(kind_pages) / elapsed,
+                'megabytes_per_second': megabytes / elapsed,
+                'identical': records == expected[kind],
+            }
+    return results
+
+
+def benchmark_load(db_path, num_games, num_companies=None, seed=0, batch_size=WRITE_BATCH_SIZE):
+    '''Measure the load rate of write_to_data_base, loading the records of a synthetic corpus batch by batch like
+    the crawler
+
+    Parameters
+    ----------
+    db_path: str
+        path to the new database
+    num_games: int
+        number of games to load
+    num_companies: int
+        number of companies, default_companies if None
+    seed: int
+        random seed
+    batch_size: int
+        number of games written by each call of write_to_data_base
+
+    Returns
+    -------
+    result: dict
+        elapsed seconds of the writes, loaded rows and rows per second
+    '''
+    create_tables(db_path)
+    rows = 0
+    elapsed = 0
+    for company_infos, game_infos in iter_records(num_games, num_companies, seed, batch_size=batch_size):
+        rows += len(company_infos) + len(game_infos) + sum(len(g[5]) + len(g[-1]) for g in game_infos)
+        start = time.perf_counter()
+        write_to_data_base(company_infos, game_infos, db_path)
+        elapsed += time.perf_counter() - start
+    return {
+        'games': num_games,
+        'rows': rows,
+        'batch_size': batch_size,
+        'seconds': elapsed,
+        'games_per_second': num_games / elapsed,
+        'rows_per_second': rows / elapsed,
+    }
+
+
+def time_query(spec, db_path, repeat):
+    '''Run a query several times and keep the best time
+
+    Parameters
+    ----------
+    spec: QuerySpec
+        the query
+    db_path: str
+        path to the database
+    repeat: int
+        number of runs
+
+    Returns
+    -------
+    result: list
+        query result
+    seconds: float
+        time of the fastest run
+    '''
+    process = process_query_line_chart if spec.linechart else process_query
+    (result, error_message), seconds = best_time(lambda: process(spec, db_path), repeat)
+    if error_message:
+        raise ValueError(error_message)
+    return result, seconds
+
+
+def benchmark_queries(db_path, repeat=5, arguments=QUERY_ARGUMENTS):
+    '''Compare the query time of the SQLite and columnar engines, and check that they give the same rows
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    repeat: int
+        number of runs of each query, the fastest is kept
+    arguments: list
+        query arguments to compare
+
+    Returns
+    -------
+    results: dict
+        for each query, the time of both engines and whether the rows are identical
+    load_seconds: float
+        time to load the database into the columnar engine
+    '''
+    start = time.perf_counter()
+    columnar.get_engine(db_path)
+    load_seconds = time.perf_counter() - start
+    results = {}
+    for argument in arguments:
+        spec = parse_args(argument)
+        sqlite_result, sqlite_seconds = time_query(spec, db_path, repeat)
+        spec.engine = 'columnar'
+        columnar_result, columnar_seconds = time_query(spec, db_path, repeat)
+        results[argument] = {
+            'rows': len(sqlite_result),
+            'sqlite_seconds': sqlite_seconds,
+            'columnar_seconds': columnar_seconds,
+            'identical': sqlite_result == columnar_result,
+        }
+    return results, load_seconds
+
+
+def benchmark_pages(db_path, repeat=5, arguments=PAGE_ARGUMENTS, depth=PAGE_DEPTH):
+    '''Measure the time of the first page of game queries and of a page deep into their results
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    repeat: int
+        number of runs of each page, the fastest is kept
+    arguments: list
+        query arguments, the limit is the size of a page
+    depth: int
+        number of the deep page, or the last page if there are fewer
+
+    Returns
+    -------
+    results: dict
+        for each query, the time of its first page and of its deep page
+    '''
+    results = {}
+    for argument in arguments:
+        spec = parse_args(argument)
+        cursors = [None]
+        while len(cursors) < depth:
+            page = GamePage(spec, db_path, cursors[-1])
+            for _ in page:
+                pass
+            if page.next_cursor is None:
+                break
+            cursors.append(page.next_cursor)
+        _, first_seconds = best_time(lambda: list(GamePage(spec, db_path)), repeat)
+        _, deep_seconds = best_time(lambda: list(GamePage(spec, db_path, cursors[-1])), repeat)
+        results[argument] = {
+            'deep_page': len(cursors),
+            'first_page_seconds': first_seconds,
+            'deep_page_seconds': deep_seconds,
+        }
+    return results
+
+
+def benchmark_search(db_path, repeat=5, terms=SEARCH_TERMS):
+    '''Measure the time of the name search and of the autocompletion of search terms
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    repeat: int
+        number of runs of each term, the fastest is kept
+    terms: list
+        search terms
+
+    Returns
+    -------
+    results: dict
+        for each term, the time of search_names and of autocomplete
+    '''
+    results = {}
+    for term in terms:
+        _, search_seconds = best_time(lambda: search_names(term, db_path), repeat)
+        _, autocomplete_seconds = best_time(lambda: autocomplete(term, db_path), repeat)
+        results[term] = {
+            'search_seconds': search_seconds,
+            'autocomplete_seconds': autocomplete_seconds,
+        }
+    return results
+
+
+def benchmark_exports(db_path, argument=EXPORT_ARGUMENTS, formats=EXPORT_FORMATS):
+    '''Measure the export rate of each file format
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    argument: str
+        arguments of the exported query, all its rows are exported
+    formats: list
+        export formats
+
+    Returns
+    -------
+    results: dict
+        for each format, the exported rows, seconds, rows per second and file size
+    '''
+    spec = parse_args(argument)
+    spec.limit = None
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for export_format in formats:
+            file_name = os.path.join(tmp_dir, f'export.{export_format}')
+            start = time.perf_counter()
+            count, error_message = export_results(spec, db_path, export_format, file_name)
+            elapsed = time.perf_counter() - start
+            if error_message:
+                print(f"Skipping the {export_format} export: {error_message}")
+                continue
+            results[export_format] = {
+                'rows': count,
+                'seconds': elapsed,
+                'rows_per_second': count / elapsed,
+                'megabytes': os.path.getsize(file_name) / 1e6,
+            }
+    return results
+
+
+def benchmark_charts(db_path, repeat=5, arguments=CHART_ARGUMENTS):
+    '''Measure the time to build the charts of query results and to render them to JSON for the flask app and to
+    html for the command line
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    repeat: int
+        number of runs of each chart, the fastest is kept
+    arguments: list
+        query arguments of the charts
+
+    Returns
+    -------
+    results: dict
+        for each chart, the time to build the figure and to render it to JSON and html
+    '''
+    results = {}
+    for argument in arguments:
+        spec = parse_args(argument)
+        rows, _ = time_query(spec, db_path, 1)
+        if spec.linechart:
+            figure, figure_seconds = best_time(lambda: make_line_chart(rows), repeat)
+        else:
+            figure, figure_seconds = best_time(lambda: make_bar_chart(rows, spec), repeat)
+        _, json_seconds = best_time(figure.to_json, repeat)
+        _, html_seconds = best_time(lambda: figure.to_html(full_html=False), repeat)
+        results[argument] = {
+            'points': len(rows),
+            'figure_seconds': figure_seconds,
+            'json_seconds': json_seconds,
+            'html_seconds': html_seconds,
+        }
+    return results
+
+
+def benchmark_flask(db_path, clients=8, num_requests=2000, distinct=200, threads=8):
+    '''Measure the end to end latency of the flask app served by serve.py, see load_test.py
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    clients: int
+        number of concurrent clients
+    num_requests: int
+        number of requests
+    distinct: int
+        number of distinct queries, the repeated ones hit the result cache
+    threads: int
+        number of server threads
+
+    Returns
+    -------
+    report: dict
+        report of the load test
+    '''
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = start_server(db_path, port, threads)
+    try:
+        return run_load_test(f'http://127.0.0.1:{port}', clients, num_requests, distinct)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def flatten(results, prefix=''):
+    '''Flatten nested results into metric names and values
+
+    Parameters
+    ----------
+    results: dict
+        nested results
+    prefix: str
+        name of the enclosing results
+
+    Returns
+    -------
+    metrics: dict
+        name, joined by /, and value of each number and of each check
+    '''
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            metrics[name] = value
+    return metrics
+
+
+def compare_results(old, new, threshold=0.2):
+    '''Find the metrics which got worse from one run to another: the times which grew and the rates which fell
+    by more than the threshold, and the results which were not identical between engines or to the corpus
+
+    Parameters
+    ----------
+    old: dict
+        results of the earlier run
+    new: dict
+        results of the later run
+    threshold: float
+        relative change ignored as noise
+
+    Returns
+    -------
+    regressions: list
+        name, old value, new value and relative change of each metric which got worse
+    failures: list
+        name of each check which failed and the runs it failed in, old|new
+    '''
+    old_metrics = flatten({key: value for key, value in old.items() if key != 'environment'})
+    new_metrics = flatten({key: value for key, value in new.items() if key != 'environment'})
+    regressions = []
+    failures = []
+    for name in dict.fromkeys(list(old_metrics) + list(new_metrics)):
+        if name.endswith('identical'):
+            runs = [run for run, metrics in (('old', old_metrics), ('new', new_metrics)) if metrics.get(name) is False]
+            if runs:
+                failures.append((name, runs))
+            continue
+        before = old_metrics.get(name)
+        value = new_metrics.get(name)
+        if not before or value is None:
+            continue
+        change = (value - before) / before
+        if name.endswith(('_seconds', '_ms')) and change > threshold or \
+                name.endswith(('_per_second', 'rps')) and change < -threshold:
+            regressions.append((name, before, value, change))
+    return regressions, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks on a synthetic metacritic corpus')
+    parser.add_argument('benchmarks', nargs='*', default=BENCHMARKS, help='benchmarks to run, ' + '|'.join(BENCHMARKS))
+    parser.add_argument('--games', default=100000, type=int, help='number of synthetic games, 1k to 1M')
+    parser.add_argument('--companies', default=None, type=int, help='number of companies, one per 50 games if unset')
+    parser.add_argument('--seed', default=0, type=int, help='random seed of the corpus')
+    parser.add_argument('--repeat', default=5, type=int, help='number of runs of each query')
+    parser.add_argument('--db', default=None,
+                        help='database of the benchmarks, loaded if it does not exist, a temporary one if unset')
+    parser.add_argument('--batch-size', default=WRITE_BATCH_SIZE, type=int,
+                        help='number of games written by each call of write_to_data_base')
+    parser.add_argument('--parse-games', default=2000, type=int, help='number of games of the parsed pages')
+    parser.add_argument('--parse-workers', default=1, type=int, help='number of parsing processes')
+    parser.add_argument('--clients', default=8, type=int, help='number of concurrent clients of the flask app')
+    parser.add_argument('--requests', default=2000, type=int, help='number of requests to the flask app')
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='JSON results of an earlier run to find regressions against')
+    parser.add_argument('--threshold', default=0.2, type=float, help='relative change reported as a regression')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {'environment': environment_info()}
+    results['environment'].update(games=args.games, companies=args.companies or default_companies(args.games),
+                                  seed=args.seed)
+    if 'parse' in args.benchmarks:
+        results['parse'] = benchmark_parsing(args.parse_games, args.companies, args.seed, workers=args.parse_workers)
+        print(f"{'parse':20} {'pages':>8} {'pages/s':>10} {'MB/s':>8}  identical")
+        for name, result in results['parse'].items():
+            print(f"{name:20} {result['pages']:8} {result['pages_per_second']:10.0f} "
+                  f"{result['megabytes_per_second']:8.2f}  {result['identical']}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db or os.path.join(tmp_dir, 'db.sqlite')
+        if set(args.benchmarks) - {'parse'}:
+            if os.path.exists(db_path):
+                print(f"Using the games in {db_path}")
+            else:
+                results['load'] = benchmark_load(db_path, args.games, args.companies, args.seed, args.batch_size)
+                result = results['load']
+                print(f"write_to_data_base: {result['games']} games, {result['rows']} rows in {result['seconds']:.2f}s"
+                      f" in batches of {result['batch_size']}")
+                print(f"    {result['games_per_second']:.0f} games/s, {result['rows_per_second']:.0f} rows/s")
+        if 'queries' in args.benchmarks:
+            queries, load_seconds = benchmark_queries(db_path, args.repeat)
+            results['queries'] = {'columnar_load_seconds': load_seconds, 'queries': queries}
+            print(f"columnar engine loaded in {load_seconds:.2f}s")
+            print(f"{'query':70} {'sqlite ms':>10} {'columnar ms':>12} {'speedup':>8}  identical")
+            for argument, result in queries.items():
+                print(f"{argument:70} {result['sqlite_seconds'] * 1000:10.2f} "
+                      f"{result['columnar_seconds'] * 1000:12.2f} "
+                      f"{result['sqlite_seconds'] / result['columnar_seconds']:8.1f}  {result['identical']}")
+        if 'pages' in args.benchmarks:
+            results['pages'] = benchmark_pages(db_path, args.repeat)
+            print(f"{'page query':70} {'first ms':>10} {'deep ms':>10}  deep page")
+            for argument, result in results['pages'].items():
+                print(f"{argument:70} {result['first_page_seconds'] * 1000:10.2f} "
+                      f"{result['deep_page_seconds'] * 1000:10.2f}  {result['deep_page']}")
+        if 'search' in args.benchmarks:
+            results['search'] = benchmark_search(db_path, args.repeat)
+            print(f"{'search term':20} {'search ms':>10} {'autocomplete ms':>16}")
+            for term, result in results['search'].items():
+                print(f"{term:20} {result['search_seconds'] * 1000:10.2f} "
+                      f"{result['autocomplete_seconds'] * 1000:16.2f}")
+        if 'exports' in args.benchmarks:
+            results['exports'] = benchmark_exports(db_path)
+            for export_format, result in results['exports'].items():
+                print(f"export {export_format:8} {result['rows']} rows in {result['seconds']:.2f}s, "
+                      f"{result['rows_per_second']:.0f} rows/s, {result['megabytes']:.1f} MB")
+        if 'charts' in args.benchmarks:
+            results['charts'] = benchmark_charts(db_path, args.repeat)
+            print(f"{'chart':70} {'figure ms':>10} {'json ms':>8} {'html ms':>8}")
+            for argument, result in results['charts'].items():
+                print(f"{argument:70} {result['figure_seconds'] * 1000:10.2f} "
+                      f"{result['json_seconds'] * 1000:8.2f} {result['html_seconds'] * 1000:8.2f}")
+        if 'flask' in args.benchmarks:
+            # the server opens the database in its own process
+            close_connections(db_path)
+            results['flask'] = benchmark_flask(db_path, args.clients, args.requests)
+            report = results['flask']
+            print(f"flask: {report['requests']} requests from {report['clients']} clients, "
+                  f"{report['rps']} requests per second")
+            for endpoint, stats in report['endpoints'].items():
+                print(f"    {endpoint:20} errors {stats['errors']:4}  p50 {stats['p50_ms']} ms  "
+                      f"p99 {stats['p99_ms']} ms")
+        close_connections(db_path)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions, failures = compare_results(json.load(f), results, args.threshold)
+        print(f"{len(regressions)} regressions and {len(failures)} failed checks against {args.compare}")
+        for name, before, value, change in regressions:
+            print(f"    {name}: {before:.4g} -> {value:.4g} ({change:+.0%})")
+        for name, runs in failures:
+            print(f"    {name}: not identical in the {' and '.join(runs)} run")
+        if regressions or failures:
+            sys.exit(1)
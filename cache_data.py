@@ -1,37 +1,255 @@
 import requests
 import time
-import json
 from bs4 import BeautifulSoup
 import re
 import datetime
 from tqdm import tqdm
 from database_utils import write_to_data_base, create_tables,query_db
+from page_cache import PageCache, import_json_cache
+try:
+    import fast_parsers
+except ImportError:
+    # lxml is optional, BeautifulSoup is used without it
+    fast_parsers = None
+import asyncio
+import multiprocessing
 import os
+import random
 import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import partial
+from itertools import islice
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 
 BASE_URL = "https://www.metacritic.com/browse/games/release-date/available/{}/metascore"
+REFRESH_URL = "https://www.metacritic.com/browse/games/release-date/available/{}/date"
 GAME_BASE_URL = "https://www.metacritic.com"
 headers = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
 
 verbose_cache = False
+MAX_WORKERS = 8
+REQUEST_INTERVAL = 0.25
+CHECKPOINT_EVERY = 50
+# statuses worth asking again, the server is throttling us or failing for a moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+MAX_BACKOFF = 30
+PARSER_BACKEND = 'bs4' if fast_parsers is None else 'lxml'
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_CHUNK_SIZE = 16
+# developer pages waiting to be fetched, the game crawl waits when the developer crawl falls this far behind
+COMPANY_QUEUE_SIZE = 64
+# games fetched and written to the database together, memory use of a crawl depends on this and not on the platform
+WRITE_BATCH_SIZE = 500
+METASCORE_CLASS = re.compile('metascore_w large.*')
+USER_SCORE_CLASS = re.compile('metascore_w user large.*')
 
 
-def load_cache(cache_file_name):
-    '''Load cache file
+class RateLimiter:
+    '''
+        Limit the request rate to each host, shared by all the fetching threads
+    '''
+    def __init__(self, interval=REQUEST_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        '''Block until a request to the host of the url is allowed
+
+        Parameters
+        ----------
+        url: str
+            url to request
+
+        Returns
+        -------
+        None
+        '''
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+rate_limiter = RateLimiter()
+# only one loader writes to the database at a time, SQLite takes a single writer anyway
+database_lock = threading.Lock()
+# progress bar of the platform crawled by this thread, when several platforms are crawled at the same time
+crawl_progress = threading.local()
+# the parsing processes, by number of processes, shared by every crawl and batch of the program
+parse_pools = {}
+parse_pools_lock = threading.Lock()
+
+
+def progress_bar(iterable=None, **kwargs):
+    '''Progress bar of a crawl step, hidden when the crawl shows its progress in the bar of its platform
+
+    Parameters
+    ----------
+    iterable: iterable
+        items to iterate over
+    kwargs:
+        arguments of tqdm
+
+    Returns
+    -------
+    tqdm
+        progress bar
+    '''
+    return tqdm(iterable, disable=getattr(crawl_progress, 'bar', None) is not None, **kwargs)
+
+
+def report(message):
+    '''Print a message of the crawl, or show it next to the bar of the platform crawled by this thread
+
+    Parameters
+    ----------
+    message: str
+        message to show
+
+    Returns
+    -------
+    None
+    '''
+    bar = getattr(crawl_progress, 'bar', None)
+    if bar is None:
+        print(message)
+    else:
+        bar.set_postfix_str(message)
+
+
+class Fetcher:
+    '''
+        Fetch pages over a pooled keep-alive session, shared by all the fetching threads.
+        Compressed responses are negotiated (br only if brotli is installed), throttled and failing responses are
+        retried with exponential backoff and jitter, and conditional requests let unchanged pages come back as 304.
+    '''
+    def __init__(self, limiter=rate_limiter, pool_size=2 * MAX_WORKERS, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def retry_delay(self, attempt, response):
+        '''Seconds to wait before the next attempt
+
+        Parameters
+        ----------
+        attempt: int
+            number of attempts made so far
+        response: Response
+            the failed response, None if the request raised
+
+        Returns
+        -------
+        delay: float
+            seconds to wait, the Retry-After of the server if it is longer than the backoff
+        '''
+        # full jitter, so the threads that failed together do not retry together
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+        retry_after = None if response is None else response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                try:
+                    delay = max(delay, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return min(delay, MAX_BACKOFF)
+
+    def fetch(self, url, validators=None):
+        '''Get a page, respecting the rate limit of the host
+
+        Parameters
+        ----------
+        url: str
+            url to get
+        validators: tuple
+            ETag and Last-Modified of the cached page, to get a 304 if it did not change
+
+        Returns
+        -------
+        html: str
+            html content, None if the page did not change since the validators
+        etag: str
+            ETag of the response, None if not sent
+        last_modified: str
+            Last-Modified of the response, None if not sent
+        '''
+        conditions = {}
+        etag, last_modified = validators or (None, None)
+        if etag:
+            conditions['If-None-Match'] = etag
+        if last_modified:
+            conditions['If-Modified-Since'] = last_modified
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(url)
+            try:
+                response = self.session.get(url, headers=conditions)
+            except requests.ConnectionError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay(attempt, None))
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                break
+            if attempt == self.retries:
+                response.raise_for_status()
+            time.sleep(self.retry_delay(attempt, response))
+        if response.status_code == 304:
+            return None, etag, last_modified
+        return response.text, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def close(self):
+        '''Close the pooled connections
+
+        Returns
+        -------
+        None
+        '''
+        self.session.close()
+
+
+fetcher = Fetcher()
+
+
+def load_cache(cache_file_name, checkpoint_every=CHECKPOINT_EVERY):
+    '''Load cache file, pages of a legacy json cache with the same name are imported on first use
+
+    Parameters
+    ----------
+    cache_file_name: str
+        path to the cache file
+    checkpoint_every: int
+        number of fetched pages between two commits of the cache
 
     Returns
     -------
-    dict
+    PageCache
         cache file
     '''
-    try:
-        cache_file = open(cache_file_name, 'r')
-        cache_file_contents = cache_file.read()
-        cache = json.loads(cache_file_contents)
-        cache_file.close()
-    except:
-        cache = {}
+    cache = PageCache(cache_file_name, checkpoint_every)
+    if len(cache) == 0:
+        json_path = os.path.splitext(cache_file_name)[0] + '.json'
+        if json_path != cache_file_name and import_json_cache(cache, json_path) > 0:
+            print("Imported cache from", json_path)
     return cache
 
 
@@ -40,17 +258,16 @@ def save_cache(cache, cache_file_name):
 
     Parameters
     ----------
-    cache: dict
+    cache: PageCache
         cache file
+    cache_file_name: str
+        path to the cache file
 
     Returns
     -------
     none
     '''
-    cache_file = open(cache_file_name, 'w')
-    contents_to_write = json.dumps(cache)
-    cache_file.write(contents_to_write)
-    cache_file.close()
+    cache.commit()
 
 
 def make_url_request_using_cache(url, cache):
@@ -60,7 +277,7 @@ def make_url_request_using_cache(url, cache):
     ----------
     url: string
         url to get
-    cache: dict
+    cache: PageCache
         cache file
 
     Returns
@@ -68,19 +285,106 @@ def make_url_request_using_cache(url, cache):
     string
         html content
     '''
-    if (url in cache.keys()):  # the url is our unique key
+    if url in cache:  # the url is our unique key
         if verbose_cache:
             print("Using cache")
         return cache[url]
     else:
         if verbose_cache:
             print("Fetching")
-        time.sleep(0.25)
-        response = requests.get(url, headers=headers)
-        cache[url] = response.text
+        store_page(cache, url, fetch_url(url))
         return cache[url]
 
 
+def fetch_url(url, validators=None):
+    '''Get html from the url, respecting the rate limit of the host
+
+    Parameters
+    ----------
+    url: string
+        url to get
+    validators: tuple
+        ETag and Last-Modified of the cached page, to skip the download if it did not change
+
+    Returns
+    -------
+    page: tuple
+        html content, ETag and Last-Modified, html is None if the page did not change since the validators
+    '''
+    return fetcher.fetch(url, validators)
+
+
+def store_page(cache, url, page):
+    '''Store a fetched page with its validators, an unchanged page keeps the cached html
+
+    Parameters
+    ----------
+    cache: PageCache
+        cache file
+    url: str
+        url of the page
+    page: tuple
+        html content, ETag and Last-Modified, as returned by fetch_url
+
+    Returns
+    -------
+    None
+    '''
+    html, etag, last_modified = page
+    if html is not None:
+        cache.store(url, html, etag, last_modified)
+
+
+def fetch_urls_using_cache(urls, cache, workers=MAX_WORKERS, ignore_errors=False, refresh=False):
+    '''Get html for a list of urls using cache, fetch the missing ones concurrently
+
+    Parameters
+    ----------
+    urls: list
+        urls to get
+    cache: PageCache
+        cache file
+    workers: int
+        number of fetching threads
+    ignore_errors: bool
+        if true, a failed url gives None instead of raising the error
+    refresh: bool
+        if true, the urls are fetched again even if they are in the cache
+
+    Returns
+    -------
+    pages: list
+        html content of each url, in the same order as urls
+    '''
+    missing = [url for url in dict.fromkeys(urls) if refresh or url not in cache]
+    failed = set()
+    if missing:
+        # the cache is only used from this thread, the validators are read before fetching
+        validators = {url: cache.validators(url) for url in missing} if refresh else {}
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {executor.submit(fetch_url, url, validators.get(url)): url for url in missing}
+        try:
+            # store each page as soon as it arrives, so an interruption only loses the pages in flight
+            for future in progress_bar(as_completed(futures), total=len(missing), desc="Fetching"):
+                url = futures[future]
+                try:
+                    store_page(cache, url, future.result())
+                except Exception:
+                    if not ignore_errors:
+                        raise
+                    failed.add(url)
+        except BaseException:
+            # stop fetching, but keep the pages that already arrived
+            executor.shutdown(cancel_futures=True)
+            for future, url in futures.items():
+                if not future.cancelled() and future.exception() is None and url not in cache:
+                    store_page(cache, url, future.result())
+            raise
+        finally:
+            executor.shutdown(cancel_futures=True)
+    return [None if url in failed else cache[url] for url in urls]
+
+
 def get_games_single_page(page_context):
     '''Get listed games from a html page
 
@@ -102,7 +406,7 @@ def get_games_single_page(page_context):
     game_urls = []
     for title in titles:
         try:
-            score = title.find('div', class_=re.compile('metascore_w large.*')).text
+            score = title.find('div', class_=METASCORE_CLASS).text
             score = int(score)
         except:
             score = None
@@ -114,7 +418,7 @@ def get_games_single_page(page_context):
         launch_date = datetime.datetime.strptime(launch_date, "%B %d, %Y").date()
         platform = details.find('span', class_='data', ).text.strip()
         try:
-            user_score = title.find('div', class_=re.compile('metascore_w user large.*')).text
+            user_score = title.find('div', class_=USER_SCORE_CLASS).text
             user_score = float(user_score)
         except:
             user_score = None
@@ -123,13 +427,15 @@ def get_games_single_page(page_context):
     return game_list, game_urls
 
 
-def get_game_detail_info(game_page_context):
+def get_game_detail_info(game_page_context, base_url=None):
     '''Get detail game record on a game page
 
     Parameters
     ----------
     game_page_context: str
         html of that game page
+    base_url: str
+        url the developer links are relative to, GAME_BASE_URL if None
 
     Returns
     -------
@@ -138,12 +444,14 @@ def get_game_detail_info(game_page_context):
     developers: dict
         dict of developer names and their url
     '''
+    if base_url is None:
+        base_url = GAME_BASE_URL
     soup = BeautifulSoup(game_page_context, 'html.parser')
     try:
         developer = soup.find('li', class_="summary_detail developer").find("span", class_='data')
         developers=developer.find_all('a',class_='button')
         developer_names = [dev.text.strip() for dev in developers]
-        developers={dev.text.strip():GAME_BASE_URL+dev['href'] for dev in developers}
+        developers={dev.text.strip():base_url+dev['href'] for dev in developers}
     except:
         developer_names = []
         developers={}
@@ -191,46 +499,354 @@ def get_game_detail_info(game_page_context):
             genres],developers
 
 
-def get_game_infos_by_platform(url, cache):
-    '''Get the game infos on a platform
+def get_page_count(page_context):
+    '''Get the number of listing pages from the first listing page
+
+    Parameters
+    ----------
+    page_context: str
+        html content of the first listing page
+
+    Returns
+    -------
+    page_num: int
+        number of listing pages
+    '''
+    soup = BeautifulSoup(page_context, 'html.parser')
+    last_page = soup.find('li', class_="page last_page")
+    try:
+        return int(last_page.find('a').text)
+    except:
+        return 1
+
+
+def get_company_review_count(page_context):
+    '''Get the number of reviews on a developer page
+
+    Parameters
+    ----------
+    page_context: str
+        html of the developer page
+
+    Returns
+    -------
+    count: int
+        number of reviews, None if not found
+    '''
+    try:
+        soup=BeautifulSoup(page_context,'html.parser')
+        count=soup.find("div",class_='reviews_total').find('span',class_='count').text
+        count=count.replace(",","")
+        return int(count)
+    except:
+        return None
+
+
+def get_parsers(backend=None):
+    '''Get the page parsers of a backend, both backends give the same records
+
+    Parameters
+    ----------
+    backend: str
+        'bs4' or 'lxml', PARSER_BACKEND if None
+
+    Returns
+    -------
+    parsers: dict
+        parser of each kind of page: page_count, listing, detail and company
+    '''
+    if backend is None:
+        backend = PARSER_BACKEND
+    if backend == 'lxml':
+        if fast_parsers is None:
+            raise ValueError("the lxml parser backend needs lxml installed")
+        module = fast_parsers
+    elif backend == 'bs4':
+        module = sys.modules[__name__]
+    else:
+        raise ValueError(f"unknown parser backend: {backend}")
+    return {
+        'page_count': module.get_page_count,
+        'listing': module.get_games_single_page,
+        # bind the base url here, worker processes may not see a changed GAME_BASE_URL
+        'detail': partial(module.get_game_detail_info, base_url=GAME_BASE_URL),
+        'company': module.get_company_review_count,
+    }
+
+
+def get_parse_pool(workers=PARSE_WORKERS):
+    '''Get the shared pool of parsing processes, started on first use
+
+    The crawl fetches with threads and forking it could copy the locks they hold into the processes, so the
+    processes are started by a fork server, or spawned where there is none.
+
+    Parameters
+    ----------
+    workers: int
+        number of parsing processes
+
+    Returns
+    -------
+    ProcessPoolExecutor
+        the pool of the given number of processes
+    '''
+    with parse_pools_lock:
+        if workers not in parse_pools:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            parse_pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                       mp_context=multiprocessing.get_context(method))
+        return parse_pools[workers]
+
+
+def parse_pages(parser, pages, workers=PARSE_WORKERS):
+    '''Parse pages across the shared process pool
+
+    Parameters
+    ----------
+    parser:
+        function parsing one page
+    pages: list
+        html of the pages
+    workers: int
+        number of parsing processes, pages are parsed in this process if 1
+
+    Returns
+    -------
+    results: list
+        parsed records, in the same order as pages
+    '''
+    if workers <= 1 or len(pages) <= PARSE_CHUNK_SIZE:
+        return [parser(page) for page in progress_bar(pages, desc="Parsing")]
+    executor = get_parse_pool(workers)
+    return list(progress_bar(executor.map(parser, pages, chunksize=PARSE_CHUNK_SIZE), total=len(pages),
+                             desc="Parsing"))
+
+
+async def _get_page(url, cache, executor, refresh=False):
+    '''Get the html of a url from the cache, or fetch it in a thread of the executor and cache it
+
+    Parameters
+    ----------
+    url: str
+        url to get
+    cache: PageCache
+        cache file
+    executor: ThreadPoolExecutor
+        threads fetching the pages
+    refresh: bool
+        if true, the url is fetched again even if it is in the cache
+
+    Returns
+    -------
+    page: str
+        html content
+    '''
+    if not refresh and url in cache:
+        return cache[url]
+    validators = cache.validators(url) if refresh else None
+    page = await asyncio.get_running_loop().run_in_executor(executor, fetch_url, url, validators)
+    store_page(cache, url, page)
+    return cache[url]
+
+
+async def _crawl_game_details(game_urls, cache, known_developers, workers, refresh):
+    '''Fetch and parse the game detail pages, and the pages of the developers as soon as a game names them
+
+    Games and developers are two stages joined by a bounded queue: developer pages are fetched while game pages are
+    still being fetched, and the game stage waits whenever the queue is full.
+
+    Parameters
+    ----------
+    game_urls: list
+        urls of the game detail pages
+    cache: PageCache
+        cache file
+    known_developers: iterable
+        names of the developers whose pages are not needed
+    workers: int
+        number of pages fetched at the same time by each stage
+    refresh: bool
+        if true, the game pages are fetched again even if they are in the cache
+
+    Returns
+    -------
+    details: list
+        game details and developers of each game, in the same order as game_urls
+    company_counts: dict
+        urls of the fetched developer pages and their review counts
+    '''
+    parsers = get_parsers()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=COMPANY_QUEUE_SIZE)
+    fetch_slots = asyncio.Semaphore(workers)
+    queued = set(known_developers)
+    company_counts = {}
+    game_bar = progress_bar(total=len(game_urls), desc="Games")
+    platform_bar = getattr(crawl_progress, 'bar', None)
+    company_bar = progress_bar(desc="Developers")
+    executor = ThreadPoolExecutor(max_workers=2 * workers)
+    parse_workers = PARSE_WORKERS if len(game_urls) > PARSE_CHUNK_SIZE else 1
+    parse_executor = get_parse_pool(parse_workers) if parse_workers > 1 else None
+
+    async def parse(parser, page):
+        if parse_executor is None:
+            return parser(page)
+        return await loop.run_in_executor(parse_executor, parser, page)
+
+    async def get_game_detail(url):
+        async with fetch_slots:
+            page = await _get_page(url, cache, executor, refresh)
+        detail = await parse(parsers['detail'], page)
+        game_bar.update()
+        if platform_bar is not None:
+            platform_bar.update()
+        for developer, developer_url in detail[1].items():
+            if developer not in queued:
+                queued.add(developer)
+                await queue.put(developer_url)
+        return detail
+
+    async def get_company_counts():
+        while True:
+            url = await queue.get()
+            if url is None:
+                return
+            try:
+                page = await _get_page(url, cache, executor)
+            except Exception:
+                # pages that failed to download are parsed as empty pages, giving no count
+                page = ''
+            company_counts[url] = await parse(parsers['company'], page)
+            company_bar.update()
+
+    company_tasks = [asyncio.create_task(get_company_counts()) for _ in range(workers)]
+    game_tasks = {url: asyncio.create_task(get_game_detail(url)) for url in dict.fromkeys(game_urls)}
+    try:
+        await asyncio.gather(*game_tasks.values())
+        for _ in company_tasks:
+            await queue.put(None)
+        await asyncio.gather(*company_tasks)
+    except BaseException:
+        # stop fetching, the pages that already arrived are in the cache
+        for task in list(game_tasks.values()) + company_tasks:
+            task.cancel()
+        raise
+    finally:
+        # the parsing pool is shared with the other crawls, the parses of the cancelled tasks are cancelled with them
+        executor.shutdown(cancel_futures=True)
+        game_bar.close()
+        company_bar.close()
+    return [game_tasks[url].result() for url in game_urls], company_counts
+
+
+def crawl_game_details(game_urls, cache, known_developers=(), workers=MAX_WORKERS, refresh=False):
+    '''Fetch and parse the game detail pages, fetching the pages of new developers along the way
+
+    Parameters
+    ----------
+    game_urls: list
+        urls of the game detail pages
+    cache: PageCache
+        cache file
+    known_developers: iterable
+        names of the developers whose pages are not needed
+    workers: int
+        number of pages fetched at the same time by each stage
+    refresh: bool
+        if true, the game pages are fetched again even if they are in the cache
+
+    Returns
+    -------
+    details: list
+        game details and developers of each game, in the same order as game_urls
+    company_counts: dict
+        urls of the fetched developer pages and their review counts
+    '''
+    return asyncio.run(_crawl_game_details(game_urls, cache, known_developers, workers, refresh))
+
+
+def batched(iterable, size):
+    '''Split an iterable into lists of size items, the last one may be shorter
+
+    Parameters
+    ----------
+    iterable: iterable
+        items to split
+    size: int
+        number of items in a batch
+
+    Returns
+    -------
+    batches: generator
+        lists of items
+    '''
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def iter_listed_games(url, cache, workers=MAX_WORKERS):
+    '''Get the games listed on the listing pages of a platform, fetching the pages a few at a time
 
     Parameters
     ----------
     url: str
         url to the platform page
-    cache: dict
+    cache: PageCache
         cache file
+    workers: int
+        number of fetching threads
 
     Returns
     -------
-    all_games: list
-        all the games and info on that platform
-    all_developers: list
-        all relevant developers on that platform
+    games: generator
+        game info from the listing and url to the detail page of each game
     '''
+    parsers = get_parsers()
     first_page = make_url_request_using_cache(url, cache)
-    soup = BeautifulSoup(first_page, 'html.parser')
-    last_page = soup.find('li', class_="page last_page")
-    try:
-        page_num = last_page.find('a').text
-    except:
-        page_num = 1
-    all_games = []
-    all_games_urls = []
-    for page in range(int(page_num)):
-        page_url = url + f"?page={page}"
-        page_context = make_url_request_using_cache(page_url, cache)
-        games_single_page, games_single_page_urls = get_games_single_page(page_context)
-        all_games.extend(games_single_page)
-        all_games_urls.extend(games_single_page_urls)
-    all_developers=dict()
-    for i in tqdm(range(len(all_games))):
-        game_url = GAME_BASE_URL + all_games_urls[i]
-        game_page_context = make_url_request_using_cache(game_url, cache)
-        game_detail_info,developers=get_game_detail_info(game_page_context)
-        all_games[i].extend(game_detail_info)
-        all_developers.update(developers)
-    return all_games,all_developers
+    page_num = parsers['page_count'](first_page)
+    page_urls = [url + f"?page={page}" for page in range(page_num)]
+    for chunk in batched(page_urls, max(workers, PARSE_CHUNK_SIZE)):
+        for games_single_page, games_single_page_urls in parse_pages(parsers['listing'],
+                                                                      fetch_urls_using_cache(chunk, cache, workers)):
+            yield from zip(games_single_page, games_single_page_urls)
+
+
+def iter_game_infos_by_platform(url, cache, workers=MAX_WORKERS, known_developers=(), batch_size=WRITE_BATCH_SIZE):
+    '''Get the game infos on a platform batch by batch, with the review counts of the developers not known yet
+
+    Parameters
+    ----------
+    url: str
+        url to the platform page
+    cache: PageCache
+        cache file
+    workers: int
+        number of fetching threads
+    known_developers: iterable
+        names of the developers already in the database
+    batch_size: int
+        number of games in a batch
+
+    Returns
+    -------
+    batches: generator
+        games and their info, their developers and the review counts of the fetched developer pages, for each batch
+    '''
+    known_developers = set(known_developers)
+    for batch in batched(iter_listed_games(url, cache, workers), batch_size):
+        games = [game for game, _ in batch]
+        game_urls = [GAME_BASE_URL + game_url for _, game_url in batch]
+        details, company_counts = crawl_game_details(game_urls, cache, known_developers, workers)
+        developers = dict()
+        for game, (game_detail_info, game_developers) in zip(games, details):
+            game.extend(game_detail_info)
+            developers.update(game_developers)
+        known_developers.update(developers)
+        yield games, developers, company_counts
 
 
 def get_existing_companies(db_path):
@@ -255,35 +871,104 @@ def get_existing_companies(db_path):
         developers={}
     return developers
 
-def get_info_companies(developers,cache):
+def get_existing_games(db_path):
+    '''Get existed games in the database
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    Returns
+    -------
+    games: dict
+        name and platform of the games and their meta and user scores
+
+    '''
+    if not os.path.isfile(db_path):
+        return {}
+    try:
+        response=query_db("SELECT GameName,Platform,MetaScore,UserScore From Games",db_path)
+        games={(r[0],r[1]):(r[2],r[3]) for r in response}
+    except sqlite3.OperationalError:
+        games={}
+    return games
+
+
+def find_new_developers(all_developers,db_path):
+    '''Find the developers not in the database yet
+
+    Parameters
+    ----------
+    all_developers: dict
+        developer names and their urls
+    db_path: str
+        path to the database
+
+    Returns
+    -------
+    new_developers: list
+        names and urls of the new developers
+    '''
+    existing_developers=get_existing_companies(db_path)
+    return [[developer,url] for developer,url in all_developers.items() if developer not in existing_developers]
+
+
+def get_info_companies(developers,cache,workers=MAX_WORKERS,company_counts=None):
     '''Get company info
 
     Parameters
     ----------
     developers: list
         develop names and their urls
-    cache: dict
+    cache: PageCache
         cache file
+    workers: int
+        number of fetching threads
+    company_counts: dict
+        urls of the developer pages fetched during the game crawl and their review counts
 
     Returns
     -------
     result: list
         fetched results
     '''
-    result=[]
-    for dev,url in tqdm(developers):
-        try:
-            page=make_url_request_using_cache(url,cache)
-            soup=BeautifulSoup(page,'html.parser')
-            count=soup.find("div",class_='reviews_total').find('span',class_='count').text
-            count=count.replace(",","")
-            count=int(count)
-        except:
-            count=None
-        result.append([dev,url,count])
-    return result
+    counts=dict(company_counts or {})
+    missing=[url for _,url in developers if url not in counts]
+    if missing:
+        pages=fetch_urls_using_cache(missing,cache,workers,ignore_errors=True)
+        # pages that failed to download are parsed as empty pages, giving no count
+        counts.update(zip(missing,parse_pages(get_parsers()['company'],[page or '' for page in pages])))
+    return [[dev,url,counts[url]] for dev,url in developers]
+
+def load_games(game_infos,all_developers,company_counts,cache,db_path,workers=MAX_WORKERS):
+    '''Write games and their new developers to the database
+
+    Parameters
+    ----------
+    game_infos: list
+        games and their info
+    all_developers: dict
+        developer names and their urls
+    company_counts: dict
+        urls of the developer pages fetched already and their review counts
+    cache: PageCache
+        cache file
+    db_path: str
+        path to the database
+    workers: int
+        number of fetching threads
+
+    Returns
+    -------
+    None
+    '''
+    new_developers_records=get_info_companies(find_new_developers(all_developers,db_path),cache,workers,company_counts)
+    with database_lock:
+        # company ids come from the database, the lock only keeps the loaders from waiting on each other's writes
+        write_to_data_base(new_developers_records,game_infos,db_path)
+
 
-def cache_result_by_platform(platform,cache_path,db_path):
+def cache_result_by_platform(platform,cache_path,db_path,workers=MAX_WORKERS,resume=True):
     '''Cach result by platform
 
     Parameters
@@ -294,32 +979,170 @@ def cache_result_by_platform(platform,cache_path,db_path):
         path to the cache file
     db_path:
         path to the database file
+    workers: int
+        number of fetching threads
+    resume: bool
+        if true, pages already in the cache are not fetched again, otherwise the cache is cleared first
 
     Returns
     -------
     None
     '''
     cache=load_cache(cache_path)
-    url=BASE_URL.format(platform)
-    print("Fetching data for games")
-    game_infos,all_developers=get_game_infos_by_platform(url,cache)
-    #add new developers into database
-    existing_developers=get_existing_companies(db_path)
-    new_developers=[]
-    count=len(existing_developers)
-    for developer in all_developers:
-        if developer not in existing_developers:
-            count+=1
-            existing_developers[developer]=count
-            new_developers.append([developer,all_developers[developer]])
-    print("Fetching data for developers")
-    new_developers_records=get_info_companies(new_developers,cache)
-    save_cache(cache,cache_path)
-    create_tables(db_path)
-    write_to_data_base(new_developers_records,game_infos,existing_developers,db_path)
-    print("Success")
+    if not resume:
+        cache.clear()
+    elif len(cache)>0:
+        report(f"Resuming with {len(cache)} cached pages")
+    with database_lock:
+        create_tables(db_path)
+    loaded=0
+    try:
+        url=BASE_URL.format(platform)
+        report("Fetching data for games and developers")
+        # each batch is written as soon as it is fetched, queries see the games loaded so far during the crawl
+        for game_infos,all_developers,company_counts in iter_game_infos_by_platform(url,cache,workers,
+                                                                                   get_existing_companies(db_path)):
+            load_games(game_infos,all_developers,company_counts,cache,db_path,workers)
+            loaded+=len(game_infos)
+            report(f"Loaded {loaded} games")
+    finally:
+        # keep the pages fetched so far, the next run resumes from them
+        save_cache(cache,cache_path)
+        cache.close()
+    report("Success")
 
 
+def get_changed_games_by_platform(url, cache, existing_games, workers=MAX_WORKERS, known_developers=()):
+    '''Get the new games and the games with changed scores on a platform, newest first
 
+    Listing pages are fetched from the newest until a page only lists known games with unchanged scores,
+    detail pages are fetched again for the new and changed games only.
 
+    Parameters
+    ----------
+    url: str
+        url to the platform page sorted by release date
+    cache: PageCache
+        cache file
+    existing_games: dict
+        name and platform of the known games and their meta and user scores
+    workers: int
+        number of fetching threads
+    known_developers: iterable
+        names of the developers already in the database
+
+    Returns
+    -------
+    all_games: list
+        the new and changed games and their info
+    all_developers: list
+        all relevant developers of those games
+    company_counts: dict
+        urls of the fetched developer pages and their review counts
+    '''
+    parsers = get_parsers()
+    all_games = []
+    all_games_urls = []
+    page = 0
+    page_num = 1
+    while page < page_num:
+        page_url = url + f"?page={page}"
+        store_page(cache, page_url, fetch_url(page_url, cache.validators(page_url)))
+        page_context = cache[page_url]
+        if page == 0:
+            page_num = parsers['page_count'](page_context)
+        games_single_page, games_single_page_urls = parsers['listing'](page_context)
+        changed = [i for i, game in enumerate(games_single_page)
+                   if existing_games.get((game[0], game[2])) != (game[3], game[4])]
+        if len(changed) == 0:
+            break
+        all_games.extend(games_single_page[i] for i in changed)
+        all_games_urls.extend(games_single_page_urls[i] for i in changed)
+        page += 1
+    game_urls = [GAME_BASE_URL + game_url for game_url in all_games_urls]
+    details, company_counts = crawl_game_details(game_urls, cache, known_developers, workers, refresh=True)
+    all_developers = dict()
+    for i, (game_detail_info, developers) in enumerate(details):
+        all_games[i].extend(game_detail_info)
+        all_developers.update(developers)
+    return all_games, all_developers, company_counts
+
+
+def refresh_platform(platform,cache_path,db_path,workers=MAX_WORKERS):
+    '''Refresh the games of a platform in the database instead of crawling it again
+
+    Parameters
+    ----------
+    platform: str
+        platform name
+    cache_path: str
+        path to the cache file
+    db_path:
+        path to the database file
+    workers: int
+        number of fetching threads
+
+    Returns
+    -------
+    None
+    '''
+    cache=load_cache(cache_path)
+    with database_lock:
+        create_tables(db_path)
+    try:
+        url=REFRESH_URL.format(platform)
+        report("Fetching new and changed games")
+        game_infos,all_developers,company_counts=get_changed_games_by_platform(
+            url,cache,get_existing_games(db_path),workers,get_existing_companies(db_path))
+        report(f"Found {len(game_infos)} new or changed games")
+        load_games(game_infos,all_developers,company_counts,cache,db_path,workers)
+    finally:
+        save_cache(cache,cache_path)
+        cache.close()
+    report("Success")
+
+
+def cache_results_by_platforms(platforms,cache_dir,db_path,workers=MAX_WORKERS):
+    '''Crawl several platforms at the same time, with one progress bar per platform
+
+    The platforms share the rate limit of the host and the company table, each platform has its own cache file.
+
+    Parameters
+    ----------
+    platforms: list
+        platform names
+    cache_dir: str
+        directory of the cache files, cache_<platform>.sqlite
+    db_path: str
+        path to the database file
+    workers: int
+        number of fetching threads of each platform
+
+    Returns
+    -------
+    failed: dict
+        platforms whose crawl failed and their errors
+    '''
+    with database_lock:
+        create_tables(db_path)
+    bars={platform:tqdm(desc=platform,unit=' games',position=i) for i,platform in enumerate(platforms)}
+
+    def crawl(platform):
+        crawl_progress.bar=bars[platform]
+        try:
+            cache_result_by_platform(platform,os.path.join(cache_dir,f'cache_{platform}.sqlite'),db_path,workers)
+        except Exception as e:
+            report(f"Failed: {e}")
+            raise
+        finally:
+            crawl_progress.bar=None
 
+    failed={}
+    with ThreadPoolExecutor(max_workers=len(platforms)) as executor:
+        futures={executor.submit(crawl,platform):platform for platform in platforms}
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                failed[futures[future]]=future.exception()
+    for bar in bars.values():
+        bar.close()
+    return failed
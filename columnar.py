@@ -0,0 +1,597 @@
+import datetime
+import threading
+from functools import reduce
+import numpy as np
+from database_utils import get_connection, get_data_version
+
+# engines of the databases and the data version they were loaded at
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def categorical(values):
+    '''Encode text values as codes into their sorted distinct values
+
+    Parameters
+    ----------
+    values: list
+        text values, may contain None
+
+    Returns
+    -------
+    categories: np.ndarray
+        distinct values, sorted like SQLite compares text
+    codes: np.ndarray
+        index of each value in categories, -1 for None
+    '''
+    categories = sorted({value for value in values if value is not None})
+    index = {value: i for i, value in enumerate(categories)}
+    codes = np.array([-1 if value is None else index[value] for value in values], dtype=np.int32)
+    return np.array(categories, dtype=str), codes
+
+
+def numeric(values):
+    '''Convert numbers to a float column
+
+    Parameters
+    ----------
+    values: list
+        numbers, may contain None
+
+    Returns
+    -------
+    column: np.ndarray
+        float values, NaN for None
+    '''
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def top_k(values, ids, k, descending):
+    '''Positions of the first k values in the order of ORDER BY <values>, <ids> LIMIT k
+
+    Parameters
+    ----------
+    values: np.ndarray
+        sort keys, NaN for NULL which SQLite sorts before any number
+    ids: np.ndarray
+        ids breaking the ties, in ascending order
+    k: int
+        number of positions to return
+    descending: bool
+        whether the values are sorted in descending order
+
+    Returns
+    -------
+    positions: np.ndarray
+        positions of the first k values
+    '''
+    key = np.where(np.isnan(values), -np.inf, values)
+    if descending:
+        key = -key
+    if k < len(key):
+        # keep every value tied with the k-th one, the ids decide which of them make it
+        kth = key[np.argpartition(key, k - 1)[k - 1]]
+        candidates = np.flatnonzero(key <= kth)
+    else:
+        candidates = np.arange(len(key))
+    order = np.lexsort((ids[candidates], key[candidates]))[:k]
+    return candidates[order]
+
+
+def round_like_sqlite(values):
+    '''Round to one decimal like ROUND(x, 1) of SQLite, which prints x with %.1f after adding 0.05 and 3e-16 * x,
+    so halves stored just below their decimal value round up where Python and NumPy round them down
+
+    Parameters
+    ----------
+    values: np.ndarray
+        non-negative scores, NaN for NULL
+
+    Returns
+    -------
+    rounded: np.ndarray
+        rounded values, NaN for NULL
+    '''
+    return np.floor((values + (0.05 + values * 3e-16)) * 10) / 10
+
+
+def _equals(codes, categories, value):
+    '''Mask of the codes of a text value
+
+    Parameters
+    ----------
+    codes: np.ndarray
+        codes of a categorical column
+    categories: np.ndarray
+        distinct values of the column
+    value: str
+        value to look for
+
+    Returns
+    -------
+    mask: np.ndarray
+        whether each row has the value
+    '''
+    position = np.searchsorted(categories, value)
+    if position == len(categories) or categories[position] != value:
+        return np.zeros(len(codes), dtype=bool)
+    return codes == position
+
+
+def _in_range(codes, categories, low, high=None):
+    '''Mask of the codes of text values in a range, like <column> >= low or <column> BETWEEN low AND high
+
+    Parameters
+    ----------
+    codes: np.ndarray
+        codes of a categorical column
+    categories: np.ndarray
+        distinct values of the column
+    low: str
+        lower bound
+    high: str
+        upper bound, None for no upper bound
+
+    Returns
+    -------
+    mask: np.ndarray
+        whether the value of each row is in the range, False for NULL
+    '''
+    mask = codes >= np.searchsorted(categories, low, 'left')
+    if high is not None:
+        mask &= codes < np.searchsorted(categories, high, 'right')
+    return mask
+
+
+class ColumnarEngine:
+    '''
+        An in-memory copy of the Games, Game2Company, Companies, Genres and CompanyStats tables kept as NumPy columns.
+        Launch dates are day numbers, platforms and ratings are categorical codes and scores are floats with NaN
+        for missing values. The games of each genre are kept as a sorted array of game positions, an inverted index
+        the genre filters intersect or unite, the full-text searches are looked up in the indexes of SQLite.
+        Answers the game, company and line chart queries of query.py with vectorized masks and returns the same rows
+        as SQLite.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        connection = get_connection(db_path)
+        rows = connection.execute('''
+            SELECT Id, GameName, Platform, MetaScore, UserScore, Developer, NumOfPlayers, Ratings, Genres,
+                LaunchDate, CriticTotal, UserTotal
+            FROM Games ORDER BY Id
+        ''').fetchall()
+        # the result rows, exactly as SQLite returns them
+        self.game_rows = [row[1:10] for row in rows]
+        self.game_id = np.array([row[0] for row in rows], dtype=np.int64)
+        self.platforms, self.platform = categorical([row[2] for row in rows])
+        self.ratings, self.rating = categorical([row[7] for row in rows])
+        self.columns = {
+            'MetaScore': numeric([row[3] for row in rows]),
+            'UserScore': numeric([row[4] for row in rows]),
+            'NumOfPlayers': numeric([row[6] for row in rows]),
+            'CriticTotal': numeric([row[10] for row in rows]),
+            'UserTotal': numeric([row[11] for row in rows]),
+        }
+        dates = [row[9] for row in rows]
+        self.dates, date_codes = categorical(dates)
+        self.days = np.array([datetime.date.fromisoformat(date).toordinal() for date in self.dates], dtype=np.int32)
+        self.launch_day = np.where(date_codes >= 0, self.days[date_codes] if len(self.days) else -1, -1)
+        self.months, self.launch_month = categorical([None if date is None else date[:7] for date in dates])
+
+        rows = connection.execute('SELECT CompanyId, CompanyName FROM Companies ORDER BY CompanyId').fetchall()
+        self.company_id = np.array([row[0] for row in rows], dtype=np.int64)
+        self.company_names = [row[1] for row in rows]
+
+        rows = connection.execute('''
+            SELECT GameId, CompanyId FROM Game2Company
+        ''').fetchall()
+        link_game = np.array([row[0] for row in rows], dtype=np.int64)
+        link_company = np.array([row[1] for row in rows], dtype=np.int64)
+        link_game, known_game = self._positions(self.game_id, link_game)
+        link_company, known_company = self._positions(self.company_id, link_company)
+        self.link_game = link_game[known_game & known_company]
+        self.link_company = link_company[known_game & known_company]
+
+        rows = connection.execute('SELECT GenreId, Genre FROM GenreNames ORDER BY GenreId').fetchall()
+        self.genre_id = np.array([row[0] for row in rows], dtype=np.int64)
+        self.genre_names = [row[1] for row in rows]
+        # in key order, the games of each genre come sorted by id, which is their position
+        rows = connection.execute('SELECT GameId, GenreId FROM Genres ORDER BY GenreId, GameId').fetchall()
+        genre_game, known_game = self._positions(self.game_id, np.array([row[0] for row in rows], dtype=np.int64))
+        genre, known_genre = self._positions(self.genre_id, np.array([row[1] for row in rows], dtype=np.int64))
+        self.genre_link_game = genre_game[known_game & known_genre]
+        self.genre_link_genre = genre[known_game & known_genre]
+        bounds = np.searchsorted(self.genre_link_genre, np.arange(len(self.genre_id) + 1))
+        self.genre_postings = {name: self.genre_link_game[bounds[i]:bounds[i + 1]]
+                               for i, name in enumerate(self.genre_names)}
+
+        # in primary key order, the order SQLite sums the aggregates in
+        rows = connection.execute('''
+            SELECT CompanyId, Platform, Ratings, Mode, LaunchMonth,
+                GameCount, MetaScoreSum, MetaScoreCount, UserScoreSum, UserScoreCount
+            FROM CompanyStats ORDER BY CompanyId, Platform, Ratings, Mode, LaunchMonth
+        ''').fetchall()
+        stats_company, known_company = self._positions(self.company_id,
+                                                       np.array([row[0] for row in rows], dtype=np.int64))
+        rows = [row for row, known in zip(rows, known_company) if known]
+        self.stats_company = stats_company[known_company]
+        self.stats_platforms, self.stats_platform = categorical([row[1] for row in rows])
+        self.stats_ratings, self.stats_rating = categorical([row[2] for row in rows])
+        self.stats_modes, self.stats_mode = categorical([row[3] for row in rows])
+        self.stats_months, self.stats_month = categorical([row[4] for row in rows])
+        self.stats_columns = {
+            'GameCount': np.array([row[5] for row in rows], dtype=np.int64),
+            'MetaScoreSum': numeric([row[6] for row in rows]),
+            'MetaScoreCount': np.array([row[7] for row in rows], dtype=np.int64),
+            'UserScoreSum': numeric([row[8] for row in rows]),
+            'UserScoreCount': np.array([row[9] for row in rows], dtype=np.int64),
+        }
+
+    @staticmethod
+    def _positions(ids, values):
+        '''Find the positions of ids in a sorted id column
+
+        Parameters
+        ----------
+        ids: np.ndarray
+            sorted ids
+        values: np.ndarray
+            ids to look for
+
+        Returns
+        -------
+        positions: np.ndarray
+            position of each value in ids
+        found: np.ndarray
+            whether each value is in ids
+        '''
+        positions = np.searchsorted(ids, values)
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == values[found]
+        return np.where(found, positions, 0), found
+
+    def genre_games(self, genres, genre_match='any'):
+        '''Positions of the games with any or all of the genres, from the sorted game positions of each genre
+
+        Parameters
+        ----------
+        genres: list
+            genre names
+        genre_match: str
+            any|all
+
+        Returns
+        -------
+        positions: np.ndarray
+            sorted positions of the games
+        '''
+        postings = [self.genre_postings.get(genre, np.empty(0, dtype=np.int64)) for genre in genres]
+        if genre_match == 'all':
+            return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), postings)
+        return reduce(np.union1d, postings)
+
+    def search_positions(self, table, search, ids):
+        '''Positions of the rows found by a full-text search, looked up in the index of SQLite
+
+        Parameters
+        ----------
+        table: str
+            GameSearch|CompanySearch
+        search: str
+            FTS5 query, see query.search_expression
+        ids: np.ndarray
+            sorted ids of the rows, the rowids of the index
+
+        Returns
+        -------
+        positions: np.ndarray
+            positions of the rows found
+        '''
+        rows = get_connection(self.db_path).execute(f'SELECT rowid FROM {table} WHERE {table} MATCH ?',
+                                                    (search,)).fetchall()
+        positions, found = self._positions(ids, np.array([row[0] for row in rows], dtype=np.int64))
+        return positions[found]
+
+    def game_mask(self, platform=None, launchdate=None, mode=None, ratings=None, genres=None, genre_match='any',
+                  review_column=None, record=0, search=None):
+        '''Mask of the games matching the filters of a query
+
+        Parameters
+        ----------
+        platform: str
+            full platform name, None for all
+        launchdate: list
+            one or two dates, format: yyyy-mm-dd, None for all
+        mode: str
+            online|offline, None for all
+        ratings: list
+            age groups, None for all
+        genres: list
+            genre names, None for all
+        genre_match: str
+            any|all, whether games need any or all of the genres
+        review_column: str
+            CriticTotal|UserTotal, None for no review filter
+        record: int
+            minimum number of reviews
+        search: str
+            FTS5 query of the names, developers and genres of the games, None for all
+
+        Returns
+        -------
+        mask: np.ndarray
+            whether each game matches
+        '''
+        mask = np.ones(len(self.game_rows), dtype=bool)
+        if platform is not None:
+            mask &= _equals(self.platform, self.platforms, platform)
+        if launchdate is not None:
+            # bounds on the day numbers of the dates stored in the database, compared like SQLite compares text
+            low = np.searchsorted(self.dates, launchdate[0], 'left')
+            mask &= self.launch_day >= (self.days[low] if low < len(self.days) else np.iinfo(np.int32).max)
+            if len(launchdate) == 2:
+                high = np.searchsorted(self.dates, launchdate[1], 'right')
+                if high < len(self.days):
+                    mask &= self.launch_day < self.days[high]
+        if mode == 'online':
+            mask &= self.columns['NumOfPlayers'] > 0
+        elif mode == 'offline':
+            mask &= self.columns['NumOfPlayers'] == 0
+        if ratings is not None:
+            rating_mask = np.zeros(len(mask), dtype=bool)
+            for rating in ratings:
+                rating_mask |= _equals(self.rating, self.ratings, rating)
+            mask &= rating_mask
+        if genres is not None:
+            genre_mask = np.zeros(len(mask), dtype=bool)
+            genre_mask[self.genre_games(genres, genre_match)] = True
+            mask &= genre_mask
+        if search is not None:
+            search_mask = np.zeros(len(mask), dtype=bool)
+            search_mask[self.search_positions('GameSearch', search, self.game_id)] = True
+            mask &= search_mask
+        if review_column is not None:
+            mask &= self.columns[review_column] >= record
+        return mask
+
+    def query_games(self, platform, launchdate, mode, ratings, review_column, record, sort_column, descending, limit,
+                    genres=None, genre_match='any', search=None):
+        '''Filter, sort and limit the games, same result as the SQL of query.compile_query
+
+        Parameters
+        ----------
+        platform, launchdate, mode, ratings, review_column, record, genres, genre_match, search:
+            filters, see game_mask
+        sort_column: str
+            MetaScore|UserScore
+        descending: bool
+            whether to list the highest scores first
+        limit: int
+            number of games to return
+
+        Returns
+        -------
+        result: list[tuple]
+            rows of the games
+        '''
+        positions = np.flatnonzero(self.game_mask(platform, launchdate, mode, ratings, genres, genre_match,
+                                                  review_column, record, search))
+        order = top_k(self.columns[sort_column][positions], self.game_id[positions], limit, descending)
+        return [self.game_rows[i] for i in positions[order]]
+
+    def query_companies(self, platform, launchdate, mode, ratings, record, sortby, descending, limit, by_month,
+                        genres=None, genre_match='any', search=None):
+        '''Aggregate the games by company, filter, sort and limit, same result as the SQL of query.compile_query
+
+        Parameters
+        ----------
+        platform, launchdate, mode, ratings, genres, genre_match:
+            filters, see game_mask
+        record: int
+            minimum number of games
+        sortby: str
+            meta|user|count
+        descending: bool
+            whether to list the highest values first
+        limit: int
+            number of companies to return
+        search: str
+            FTS5 query of the company names, None for all
+        by_month: bool
+            whether the launch dates cover whole months and there is no genre filter, the query is then answered
+            from the per company aggregates
+
+        Returns
+        -------
+        result: list[tuple]
+            company name, game count, average meta score and average user score
+        '''
+        n = len(self.company_id)
+        if by_month:
+            mask = np.ones(len(self.stats_company), dtype=bool)
+            if platform is not None:
+                mask &= _equals(self.stats_platform, self.stats_platforms, platform)
+            if launchdate is not None:
+                high = launchdate[1][:7] if len(launchdate) == 2 else None
+                mask &= _in_range(self.stats_month, self.stats_months, launchdate[0][:7], high)
+            if mode is not None:
+                mask &= _equals(self.stats_mode, self.stats_modes, mode)
+            if ratings is not None:
+                rating_mask = np.zeros(len(mask), dtype=bool)
+                for rating in ratings:
+                    rating_mask |= _equals(self.stats_rating, self.stats_ratings, rating)
+                mask &= rating_mask
+            companies = self.stats_company[mask]
+            columns = {name: column[mask] for name, column in self.stats_columns.items()}
+            counts = np.bincount(companies, weights=columns['GameCount'], minlength=n)
+            sums = []
+            totals = []
+            for name, scale in (('MetaScore', 1), ('UserScore', 10)):
+                # user scores are summed in tenths
+                sums.append(np.bincount(companies, weights=columns[name + 'Sum'], minlength=n) / scale)
+                totals.append(np.bincount(companies, weights=columns[name + 'Count'], minlength=n))
+        else:
+            mask = self.game_mask(platform, launchdate, mode, ratings, genres, genre_match)
+            counts, sums, totals = self._link_aggregates(self.link_company, self.link_game, mask, n)
+        if search is not None:
+            found = np.zeros(n, dtype=bool)
+            found[self.search_positions('CompanySearch', search, self.company_id)] = True
+            counts = np.where(found, counts, 0)
+        return self._aggregate_rows(self.company_names, self.company_id, counts, sums, totals,
+                                    record, sortby, descending, limit)
+
+    def query_genres(self, platform, launchdate, mode, ratings, record, sortby, descending, limit,
+                     genres=None, genre_match='any', search=None):
+        '''Aggregate the games by genre, filter, sort and limit, same result as the SQL of query.compile_query
+
+        Parameters
+        ----------
+        platform, launchdate, mode, ratings, genres, genre_match, search:
+            filters, see game_mask
+        record: int
+            minimum number of games
+        sortby: str
+            meta|user|count
+        descending: bool
+            whether to list the highest values first
+        limit: int
+            number of genres to return
+
+        Returns
+        -------
+        result: list[tuple]
+            genre, game count, average meta score and average user score
+        '''
+        mask = self.game_mask(platform, launchdate, mode, ratings, genres, genre_match, search=search)
+        counts, sums, totals = self._link_aggregates(self.genre_link_genre, self.genre_link_game, mask,
+                                                     len(self.genre_id))
+        return self._aggregate_rows(self.genre_names, self.genre_id, counts, sums, totals,
+                                    record, sortby, descending, limit)
+
+    def _link_aggregates(self, link_group, link_game, mask, n):
+        '''Count the games and sum their scores by group, over the links of the games matching a mask
+
+        Parameters
+        ----------
+        link_group: np.ndarray
+            position of the group of each link
+        link_game: np.ndarray
+            position of the game of each link
+        mask: np.ndarray
+            whether each game matches
+        n: int
+            number of groups
+
+        Returns
+        -------
+        counts: np.ndarray
+            number of games of each group
+        sums: list
+            sums of the known meta and user scores of each group
+        totals: list
+            numbers of the known meta and user scores of each group
+        '''
+        links = mask[link_game]
+        groups = link_group[links]
+        games = link_game[links]
+        counts = np.bincount(groups, minlength=n)
+        sums = []
+        totals = []
+        for name in ('MetaScore', 'UserScore'):
+            scores = self.columns[name][games]
+            known = ~np.isnan(scores)
+            totals.append(np.bincount(groups, weights=known, minlength=n))
+            if name == 'UserScore':
+                # summed in tenths like the SQL, the sums of whole numbers are exact in any order
+                tenths = np.where(known, np.round(scores * 10), 0)
+                sums.append(np.bincount(groups, weights=tenths, minlength=n) / 10)
+            else:
+                sums.append(np.bincount(groups, weights=np.where(known, scores, 0), minlength=n))
+        return counts, sums, totals
+
+    def _aggregate_rows(self, names, ids, counts, sums, totals, record, sortby, descending, limit):
+        '''Average, filter, sort and limit the aggregates of the groups
+
+        Parameters
+        ----------
+        names: list
+            name of each group
+        ids: np.ndarray
+            id of each group, ties are listed in id order
+        counts, sums, totals:
+            aggregates of each group, see _link_aggregates
+        record: int
+            minimum number of games
+        sortby: str
+            meta|user|count
+        descending: bool
+            whether to list the highest values first
+        limit: int
+            number of groups to return
+
+        Returns
+        -------
+        result: list[tuple]
+            name, game count, average meta score and average user score
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages = [np.where(total > 0, total_sum / total, np.nan) for total_sum, total in zip(sums, totals)]
+        positions = np.flatnonzero((counts > 0) & (counts >= record))
+        if sortby == 'count':
+            values = counts[positions].astype(np.float64)
+        elif sortby == 'user':
+            values = averages[1][positions]
+        else:
+            values = averages[0][positions]
+        positions = positions[top_k(values, ids[positions], limit, descending)]
+        scores = [[None if np.isnan(score) else float(score) for score in round_like_sqlite(average[positions])]
+                  for average in averages]
+        return [(names[i], int(counts[i]), meta_score, user_score)
+                for i, meta_score, user_score in zip(positions, *scores)]
+
+    def query_month_counts(self, platform, launchdate, mode, ratings, review_column, record,
+                           genres=None, genre_match='any', search=None):
+        '''Count the games launched in each month, same result as the SQL of query.compile_query
+
+        Parameters
+        ----------
+        platform, launchdate, mode, ratings, review_column, record, genres, genre_match, search:
+            filters, see game_mask
+
+        Returns
+        -------
+        result: list[tuple]
+            month, format: yyyy-mm, and number of games, in order of month
+        '''
+        months = self.launch_month[self.game_mask(platform, launchdate, mode, ratings, genres, genre_match,
+                                                  review_column, record, search)]
+        result = []
+        unknown = int(np.count_nonzero(months < 0))
+        if unknown > 0:
+            result.append((None, unknown))
+        counts = np.bincount(months[months >= 0], minlength=len(self.months))
+        for i in np.flatnonzero(counts):
+            result.append((str(self.months[i]), int(counts[i])))
+        return result
+
+
+def get_engine(db_path):
+    '''Get the columnar engine of a database, loaded on first use and again whenever the data changes
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+
+    Returns
+    -------
+    engine: ColumnarEngine
+        engine with the current data
+    '''
+    version = get_data_version(db_path)
+    with _engines_lock:
+        entry = _engines.get(db_path)
+        if entry is None or entry[0] != version:
+            entry = (version, ColumnarEngine(db_path))
+            _engines[db_path] = entry
+        return entry[1]
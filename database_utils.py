@@ -1,4 +1,24 @@
+import os
 import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+READ_PRAGMAS = [
+    'PRAGMA query_only=ON',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-32768',
+]
+
+# bounds of the review count buckets of the monthly game counts, a line chart whose review filter is one of
+# them is answered from the counts
+REVIEW_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+_local = threading.local()
+_generations = {}
+_generations_lock = threading.Lock()
+_company_registries = {}
+_company_registries_lock = threading.Lock()
 
 
 def create_tables(filename):
@@ -64,12 +84,531 @@ def create_tables(filename):
     cur.execute(create_genre_table)
     cur.execute(create_company_table)
     cur.execute(create_game2company_table)
+    migrate(cur)
     connection.commit()
     connection.close()
 
 
-def write_to_data_base(company_infos, game_infos,company2id,filename):
-    '''Write records to the database
+def _add_filter_indexes(cur):
+    '''Migration 1: indexes for the filters, sorting and joins used by query.py
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    # ordered scans for the sorted game lists, with or without a platform filter
+    cur.execute('CREATE INDEX IF NOT EXISTS "GamesPlatformMetaScore" ON "Games" ("Platform", "MetaScore")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GamesPlatformUserScore" ON "Games" ("Platform", "UserScore")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GamesMetaScore" ON "Games" ("MetaScore")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GamesUserScore" ON "Games" ("UserScore")')
+    # covering indexes for the company aggregates and the line chart, which only read filter and score columns
+    filter_columns = '"Ratings", "NumOfPlayers", "CriticTotal", "UserTotal", "MetaScore", "UserScore"'
+    cur.execute(f'CREATE INDEX IF NOT EXISTS "GamesPlatformLaunchDate" ON "Games" ("Platform", "LaunchDate", {filter_columns})')
+    cur.execute(f'CREATE INDEX IF NOT EXISTS "GamesLaunchDate" ON "Games" ("LaunchDate", "Platform", {filter_columns})')
+    cur.execute('CREATE INDEX IF NOT EXISTS "Game2CompanyCompany" ON "Game2Company" ("CompanyId", "GameId")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "Game2CompanyGame" ON "Game2Company" ("GameId", "CompanyId")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GenresGame" ON "Genres" ("GameId", "Genre")')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GenresGenre" ON "Genres" ("Genre", "GameId")')
+
+
+def _add_company_stats_table(cur):
+    '''Migration 2: per company aggregates by platform, rating, mode and launch month
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    # unknown ratings, modes and launch months are stored as '' so they still conflict on the primary key,
+    # user scores have one decimal and are summed in tenths, so the sums stay exact through the updates
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS "CompanyStats" (
+            "CompanyId"	INTEGER NOT NULL,
+            "Platform"	TEXT NOT NULL,
+            "Ratings"	TEXT NOT NULL,
+            "Mode"	TEXT NOT NULL,
+            "LaunchMonth"	TEXT NOT NULL,
+            "GameCount"	INTEGER NOT NULL,
+            "MetaScoreSum"	REAL NOT NULL,
+            "MetaScoreCount"	INTEGER NOT NULL,
+            "UserScoreSum"	INTEGER NOT NULL,
+            "UserScoreCount"	INTEGER NOT NULL,
+            PRIMARY KEY("CompanyId", "Platform", "Ratings", "Mode", "LaunchMonth")
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('DELETE FROM CompanyStats')
+    add_company_stats(cur)
+
+
+def _games_filter(cur, game_ids):
+    '''Stage the ids of the games an aggregate is updated for
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    game_ids: list
+        ids of the games, all the games if None
+
+    Returns
+    -------
+    game_filter: str
+        WHERE clause on Games selecting those games
+    '''
+    if game_ids is None:
+        return ''
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS "StatsGames" ("Id" INTEGER PRIMARY KEY)')
+    cur.execute('DELETE FROM temp.StatsGames')
+    cur.executemany('INSERT OR IGNORE INTO temp.StatsGames VALUES (?)', ((game_id,) for game_id in game_ids))
+    return 'WHERE Games.Id IN temp.StatsGames'
+
+
+def _company_stats_select(game_filter):
+    '''SQL computing the rows of the per company aggregates from the games
+
+    Parameters
+    ----------
+    game_filter: str
+        WHERE clause on Games
+
+    Returns
+    -------
+    sql: str
+        the select, the aggregates are multiplied by the :sign parameter
+    '''
+    return f'''
+        SELECT Game2Company.CompanyId,
+            COALESCE(Games.Platform, ''),
+            COALESCE(Games.Ratings, ''),
+            CASE WHEN Games.NumOfPlayers > 0 THEN 'online' WHEN Games.NumOfPlayers = 0 THEN 'offline' ELSE '' END,
+            COALESCE(SUBSTR(Games.LaunchDate, 1, 7), ''),
+            :sign*COUNT(*), :sign*TOTAL(Games.MetaScore), :sign*COUNT(Games.MetaScore),
+            :sign*CAST(TOTAL(ROUND(Games.UserScore*10)) AS INTEGER), :sign*COUNT(Games.UserScore)
+        FROM Game2Company
+            JOIN Games ON Game2Company.GameId=Games.Id
+        {game_filter}
+        GROUP BY 1, 2, 3, 4, 5
+    '''
+
+
+def add_company_stats(cur, game_ids=None, sign=1):
+    '''Add games to the per company aggregates, or remove them before they are changed
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    game_ids: list
+        ids of the games to add, all the games if None
+    sign: int
+        1 to add the games, -1 to remove them
+
+    Returns
+    -------
+    None
+    '''
+    game_filter = _games_filter(cur, game_ids)
+    cur.execute(f'''
+        INSERT INTO CompanyStats
+        {_company_stats_select(game_filter)}
+        ON CONFLICT DO UPDATE SET
+            GameCount=GameCount+excluded.GameCount,
+            MetaScoreSum=MetaScoreSum+excluded.MetaScoreSum,
+            MetaScoreCount=MetaScoreCount+excluded.MetaScoreCount,
+            UserScoreSum=UserScoreSum+excluded.UserScoreSum,
+            UserScoreCount=UserScoreCount+excluded.UserScoreCount
+    ''', {'sign': sign})
+    if sign < 0:
+        cur.execute('DELETE FROM CompanyStats WHERE GameCount <= 0')
+
+
+def _add_game_key(cur):
+    '''Migration 3: make (GameName, Platform) unique, removing the duplicates of platforms added twice
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    duplicates = 'SELECT Id FROM Games WHERE Id NOT IN (SELECT MIN(Id) FROM Games GROUP BY GameName, Platform)'
+    if cur.execute(duplicates + ' LIMIT 1').fetchone() is not None:
+        cur.execute(f'DELETE FROM Genres WHERE GameId IN ({duplicates})')
+        cur.execute(f'DELETE FROM Game2Company WHERE GameId IN ({duplicates})')
+        cur.execute(f'DELETE FROM Games WHERE Id IN ({duplicates})')
+        cur.execute('DELETE FROM CompanyStats')
+        add_company_stats(cur)
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS "GamesNamePlatform" ON "Games" ("GameName", "Platform")')
+
+
+def _add_data_version(cur):
+    '''Migration 4: a data version changed by every write, so caches of query results can tell they are stale
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS "Metadata" (
+            "Key"	TEXT NOT NULL UNIQUE,
+            "Value"	INTEGER,
+            PRIMARY KEY("Key")
+        )
+    ''')
+    # start from the current time, so a deleted and recreated database does not reuse old versions
+    cur.execute("INSERT OR IGNORE INTO Metadata VALUES ('DataVersion', ?)", (time.time_ns(),))
+
+
+def year_month(launch_date):
+    '''Get the year and month of a launch date as an integer
+
+    Parameters
+    ----------
+    launch_date: datetime.date or str
+        launch date, format: yyyy-mm-dd
+
+    Returns
+    -------
+    year_month: int
+        year*100+month, e.g. 202104, None if there is no date
+    '''
+    if launch_date is None:
+        return None
+    launch_date = str(launch_date)
+    return int(launch_date[:4]) * 100 + int(launch_date[5:7])
+
+
+def _add_year_month(cur):
+    '''Migration 5: the launch month of the games as an integer, so the line chart groups games without slicing dates
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    columns = [row[1] for row in cur.execute('PRAGMA table_info(Games)')]
+    if 'YearMonth' not in columns:
+        cur.execute('ALTER TABLE Games ADD COLUMN "YearMonth" INTEGER')
+    cur.execute('''
+        UPDATE Games
+        SET YearMonth=CAST(SUBSTR(LaunchDate, 1, 4) AS INTEGER)*100+CAST(SUBSTR(LaunchDate, 6, 2) AS INTEGER)
+        WHERE LaunchDate IS NOT NULL
+    ''')
+
+
+def _review_bucket(column):
+    '''SQL of the review count bucket of a column
+
+    Parameters
+    ----------
+    column: str
+        CriticTotal or UserTotal
+
+    Returns
+    -------
+    sql: str
+        the largest bucket bound not above the count, -1 if the count is unknown
+    '''
+    cases = ' '.join(f'WHEN Games.{column} >= {bound} THEN {bound}' for bound in reversed(REVIEW_BUCKETS))
+    return f'CASE {cases} ELSE -1 END'
+
+
+def _add_monthly_games_table(cur):
+    '''Migration 6: game counts by platform, rating, mode, review count buckets and launch month for the line chart
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    # unknown platforms, ratings, modes and months are stored as '' and 0 so they still conflict on the primary key
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS "MonthlyGames" (
+            "Platform"	TEXT NOT NULL,
+            "Ratings"	TEXT NOT NULL,
+            "Mode"	TEXT NOT NULL,
+            "CriticBucket"	INTEGER NOT NULL,
+            "UserBucket"	INTEGER NOT NULL,
+            "YearMonth"	INTEGER NOT NULL,
+            "GameCount"	INTEGER NOT NULL,
+            PRIMARY KEY("Platform", "Ratings", "Mode", "CriticBucket", "UserBucket", "YearMonth")
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('DELETE FROM MonthlyGames')
+    add_monthly_games(cur)
+
+
+def _add_genre_ids(cur):
+    '''Migration 7: genre names get integer ids, the genres of the games are stored as ids
+
+    Genres is rebuilt as (GenreId, GameId) pairs keyed in that order, so the games of a genre are a sorted run of the
+    table, an inverted index the genre filters intersect or unite.
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS "GenreNames" (
+            "GenreId"	INTEGER PRIMARY KEY,
+            "Genre"	TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cur.execute('INSERT OR IGNORE INTO GenreNames (Genre) SELECT DISTINCT Genre FROM Genres ORDER BY Genre')
+    cur.execute('''
+        CREATE TABLE "GenreIds" (
+            "GameId"	INTEGER NOT NULL,
+            "GenreId"	INTEGER NOT NULL,
+            PRIMARY KEY("GenreId", "GameId"),
+            FOREIGN KEY("GameId") REFERENCES "Games"("Id"),
+            FOREIGN KEY("GenreId") REFERENCES "GenreNames"("GenreId")
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        INSERT OR IGNORE INTO GenreIds
+        SELECT GameId, GenreId FROM Genres JOIN GenreNames ON Genres.Genre=GenreNames.Genre
+    ''')
+    cur.execute('DROP TABLE Genres')
+    cur.execute('ALTER TABLE GenreIds RENAME TO Genres')
+    cur.execute('CREATE INDEX IF NOT EXISTS "GenresGame" ON "Genres" ("GameId", "GenreId")')
+
+
+def _add_search_index(cur):
+    '''Migration 8: full-text indexes of the game names, developers and genres, and of the company names
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    # prefix indexes of 2 and 3 characters keep the autocomplete of short prefixes fast
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS "GameSearch" USING fts5(
+            GameName, Developer, Genres, tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS "CompanySearch" USING fts5(
+            CompanyName, tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cur.execute('DELETE FROM GameSearch')
+    cur.execute('DELETE FROM CompanySearch')
+    add_search_index(cur)
+
+
+def add_search_index(cur, game_ids=None):
+    '''Index games and the companies not indexed yet for the full-text search, games indexed before are replaced
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    game_ids: list
+        ids of the games to index, all the games if None
+
+    Returns
+    -------
+    None
+    '''
+    game_filter = _games_filter(cur, game_ids)
+    if game_ids is not None:
+        cur.execute('DELETE FROM GameSearch WHERE rowid IN temp.StatsGames')
+    # rowids of the index are the game and company ids
+    cur.execute(f'''
+        INSERT INTO GameSearch (rowid, GameName, Developer, Genres)
+        SELECT Id, GameName, Developer, Genres FROM Games {game_filter}
+    ''')
+    # company ids only grow and companies are never renamed, the new ones are those above the indexed ids
+    cur.execute('''
+        INSERT INTO CompanySearch (rowid, CompanyName)
+        SELECT CompanyId, CompanyName FROM Companies
+        WHERE CompanyId > (SELECT IFNULL(MAX(rowid), 0) FROM CompanySearch)
+    ''')
+
+
+def _monthly_games_select(game_filter):
+    '''SQL computing the cells of the monthly game counts from the games
+
+    Parameters
+    ----------
+    game_filter: str
+        WHERE clause on Games
+
+    Returns
+    -------
+    sql: str
+        the select, the count is multiplied by the :sign parameter
+    '''
+    return f'''
+        SELECT COALESCE(Games.Platform, ''),
+            COALESCE(Games.Ratings, ''),
+            CASE WHEN Games.NumOfPlayers > 0 THEN 'online' WHEN Games.NumOfPlayers = 0 THEN 'offline' ELSE '' END,
+            {_review_bucket('CriticTotal')},
+            {_review_bucket('UserTotal')},
+            COALESCE(Games.YearMonth, 0),
+            :sign*COUNT(*)
+        FROM Games
+        {game_filter}
+        GROUP BY 1, 2, 3, 4, 5, 6
+    '''
+
+
+def add_monthly_games(cur, game_ids=None, sign=1):
+    '''Add games to the monthly game counts, or remove them before they are changed
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    game_ids: list
+        ids of the games to add, all the games if None
+    sign: int
+        1 to add the games, -1 to remove them
+
+    Returns
+    -------
+    None
+    '''
+    game_filter = _games_filter(cur, game_ids)
+    cur.execute(f'''
+        INSERT INTO MonthlyGames
+        {_monthly_games_select(game_filter)}
+        ON CONFLICT DO UPDATE SET GameCount=GameCount+excluded.GameCount
+    ''', {'sign': sign})
+    if sign < 0:
+        cur.execute('DELETE FROM MonthlyGames WHERE GameCount <= 0')
+
+
+def check_monthly_games(file_name):
+    '''Check the monthly game counts against a count over the games
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    mismatches: list
+        cells missing from the counts or with a wrong count, empty if the counts are consistent
+    '''
+    expected = _monthly_games_select('')
+    return query_db(f'''
+        SELECT * FROM ({expected} EXCEPT SELECT * FROM MonthlyGames)
+        UNION ALL
+        SELECT * FROM (SELECT * FROM MonthlyGames EXCEPT {expected})
+    ''', file_name, {'sign': 1})
+
+
+def check_company_stats(file_name):
+    '''Check the per company aggregates against the aggregates over the games
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    mismatches: list
+        rows missing from the aggregates or with a wrong aggregate, empty if the aggregates are consistent
+    '''
+    expected = _company_stats_select('')
+    return query_db(f'''
+        SELECT * FROM ({expected} EXCEPT SELECT * FROM CompanyStats)
+        UNION ALL
+        SELECT * FROM (SELECT * FROM CompanyStats EXCEPT {expected})
+    ''', file_name, {'sign': 1})
+
+
+def _sum_user_scores_in_tenths(cur):
+    '''Migration 9: rebuild the per company aggregates with the user scores summed in tenths
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    None
+    '''
+    # the float sums carried rounding errors, updated games also left residues of their removal
+    cur.execute('DROP TABLE IF EXISTS CompanyStats')
+    _add_company_stats_table(cur)
+
+
+# schema migrations in order, the number of applied migrations is the schema version stored in user_version
+MIGRATIONS = [
+    _add_filter_indexes,
+    _add_company_stats_table,
+    _add_game_key,
+    _add_data_version,
+    _add_year_month,
+    _add_monthly_games_table,
+    _add_genre_ids,
+    _add_search_index,
+    _sum_user_scores_in_tenths,
+]
+
+
+def migrate(cur):
+    '''Apply the schema migrations newer than the schema version of the database
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    version: int
+        schema version after the migration
+    '''
+    version = cur.execute('PRAGMA user_version').fetchone()[0]
+    for version, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration(cur)
+        cur.execute(f'PRAGMA user_version={version}')
+    return version
+
+
+def write_to_data_base(company_infos, game_infos, filename):
+    '''Write records to the database, games already in the database with the same name and platform are updated
 
     Parameters
     ----------
@@ -77,8 +616,6 @@ def write_to_data_base(company_infos, game_infos,company2id,filename):
         list of company info
     game_infos: list
         list of game info
-    company2id: dict
-        new company to save and their ids
     filename: str
         path to the database
 
@@ -88,44 +625,329 @@ def write_to_data_base(company_infos, game_infos,company2id,filename):
     '''
     connection = sqlite3.connect(filename)
     cur = connection.cursor()
-    #write company record
-    for row in company_infos:
-        insert_command = '''
-            INSERT INTO Companies
-            VALUES (NULL, ?, ?, ?)
-        '''
-        cur.execute(insert_command, row)
+    # the whole load is one transaction, a crash leaves the database as it was before
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute('PRAGMA synchronous=OFF')
+    cur.execute('PRAGMA temp_store=MEMORY')
+    cur.execute('PRAGMA cache_size=-65536')
+    #write company record, companies written by an earlier or concurrent load keep their id
+    cur.executemany('''
+        INSERT INTO Companies (CompanyName, URL, TotalGames)
+        VALUES (?, ?, ?)
+        ON CONFLICT(CompanyName) DO NOTHING
+    ''', company_infos)
+    registry = get_company_registry(filename)
+    company2id = registry.lookup(cur, [developer for row in game_infos for developer in row[5]])
 
-    #write game record
-    for row in game_infos:
+    #write game record, games already in the database are updated, a game is identified by its name and platform
+    game_ids = _get_game_ids(cur, game_infos)
+    updated_ids = list(game_ids.values())
+    rows = {(row[0], row[2]): row for row in game_infos}
+    next_id = _next_game_id(cur)
+    for key in rows:
+        if key not in game_ids:
+            # ids are allocated here so the genre and company links can be written in bulk
+            game_ids[key] = next_id
+            next_id += 1
+    genre2id = _get_genre_ids(cur, {genre for row in rows.values() for genre in row[-1]})
+    game_rows = []
+    genre_rows = []
+    link_rows = []
+    for key, row in rows.items():
+        game_id = game_ids[key]
+        developers = row[5]
         genres = row[-1]
-        developers=row[5]
-        row[-1]=', '.join(genres)
-        row[5]=', '.join(developers)
-        insert_command = '''
-            INSERT INTO Games
-            VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-        cur.execute(insert_command, row)
-        last_id = cur.lastrowid
-        for g in genres:
-            insert_command = f'''
-                INSERT INTO Genres
-                VALUES ({last_id}, "{g}")
-            '''
-            cur.execute(insert_command)
-
-        for dev in developers:
-            dev_id=company2id[dev]
-            insert_command= f'''
-                INSERT INTO Game2Company
-                VALUES ({last_id}, {dev_id})
-            '''
-            cur.execute(insert_command)
+        game_rows.append([game_id] + row[:5] + [', '.join(developers)] + row[6:-1]
+                         + [', '.join(genres), year_month(row[1])])
+        genre_rows.extend((game_id, genre2id[g]) for g in dict.fromkeys(genres))
+        link_rows.extend((game_id, company2id[dev]) for dev in developers)
+    add_company_stats(cur, updated_ids, -1)
+    add_monthly_games(cur, updated_ids, -1)
+    cur.executemany('DELETE FROM Genres WHERE GameId=?', ((game_id,) for game_id in updated_ids))
+    cur.executemany('DELETE FROM Game2Company WHERE GameId=?', ((game_id,) for game_id in updated_ids))
+    cur.executemany('''
+        INSERT INTO Games
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(GameName, Platform) DO UPDATE SET
+            LaunchDate=excluded.LaunchDate, MetaScore=excluded.MetaScore, UserScore=excluded.UserScore,
+            Developer=excluded.Developer, NumOfPlayers=excluded.NumOfPlayers, Ratings=excluded.Ratings,
+            CriticTotal=excluded.CriticTotal, CriticPositive=excluded.CriticPositive,
+            UserTotal=excluded.UserTotal, UserPositive=excluded.UserPositive, Genres=excluded.Genres,
+            YearMonth=excluded.YearMonth
+    ''', game_rows)
+    cur.executemany('''
+        INSERT INTO Genres (GameId, GenreId)
+        VALUES (?, ?)
+    ''', genre_rows)
+    cur.executemany('''
+        INSERT INTO Game2Company
+        VALUES (?, ?)
+    ''', link_rows)
+    add_company_stats(cur, [game_row[0] for game_row in game_rows])
+    add_monthly_games(cur, [game_row[0] for game_row in game_rows])
+    add_search_index(cur, [game_row[0] for game_row in game_rows])
+    cur.execute("UPDATE Metadata SET Value=Value+1 WHERE Key='DataVersion'")
     connection.commit()
+    registry.remember(company2id)
+    # refresh the statistics the query planner uses to pick the indexes
+    cur.execute('PRAGMA optimize')
     connection.close()
 
-def query_db(query,file_name):
+
+class CompanyRegistry:
+    '''
+        Ids of the companies of a database by name, kept in memory across loads and shared by all the loaders.
+        Names not seen yet are looked up in the database with a single query, and only ids of committed companies
+        are remembered, so a rolled back load leaves nothing behind.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+
+    def lookup(self, cur, names):
+        '''Get the ids of companies
+
+        Parameters
+        ----------
+        cur: sqlite3.Cursor
+            cursor of the database, in the transaction that wrote the companies
+        names: list
+            company names
+
+        Returns
+        -------
+        company2id: dict
+            company names and their ids, names not in the database are left out
+        '''
+        names = set(names)
+        with self.lock:
+            company2id = {name: self.ids[name] for name in names if name in self.ids}
+        missing = names.difference(company2id)
+        if missing:
+            cur.execute('CREATE TEMP TABLE IF NOT EXISTS "CompanyNames" ("CompanyName" TEXT PRIMARY KEY)')
+            cur.execute('DELETE FROM temp.CompanyNames')
+            cur.executemany('INSERT INTO temp.CompanyNames VALUES (?)', ((name,) for name in missing))
+            company2id.update(cur.execute('''
+                SELECT CompanyName, CompanyId FROM Companies
+                WHERE CompanyName IN temp.CompanyNames
+            '''))
+        return company2id
+
+    def remember(self, company2id):
+        '''Remember the ids of committed companies
+
+        Parameters
+        ----------
+        company2id: dict
+            company names and their ids
+
+        Returns
+        -------
+        None
+        '''
+        with self.lock:
+            self.ids.update(company2id)
+
+    def clear(self):
+        '''Forget all the ids, e.g. when the database is deleted
+
+        Returns
+        -------
+        None
+        '''
+        with self.lock:
+            self.ids.clear()
+
+
+def get_company_registry(file_name):
+    '''Get the company registry of a database, made on first use
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    CompanyRegistry
+        ids of the companies of the database
+    '''
+    with _company_registries_lock:
+        return _company_registries.setdefault(os.path.abspath(file_name), CompanyRegistry())
+
+
+def _get_genre_ids(cur, genres):
+    '''Get the ids of genres, genres not in the database yet are added
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    genres: set
+        genre names
+
+    Returns
+    -------
+    genre2id: dict
+        genre names and their ids
+    '''
+    cur.executemany('INSERT INTO GenreNames (Genre) VALUES (?) ON CONFLICT(Genre) DO NOTHING',
+                    ((genre,) for genre in sorted(genres)))
+    # there are few genres, all of them are read at once
+    return dict(cur.execute('SELECT Genre, GenreId FROM GenreNames'))
+
+
+def _get_game_ids(cur, game_infos):
+    '''Look up the ids of the games already in the database
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+    game_infos: list
+        list of game info
+
+    Returns
+    -------
+    game_ids: dict
+        name and platform of the existing games and their ids
+    '''
+    keys = {(row[0], row[2]) for row in game_infos}
+    if len(keys) == 0:
+        return {}
+    # only the games of the batch are looked up, through the unique index of the name and platform, CROSS JOIN keeps
+    # the keys in the outer loop instead of a scan of the games
+    cur.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS "GameKeys" (
+            "GameName" TEXT NOT NULL, "Platform" TEXT NOT NULL, PRIMARY KEY("GameName", "Platform")
+        )
+    ''')
+    cur.execute('DELETE FROM temp.GameKeys')
+    cur.executemany('INSERT INTO temp.GameKeys VALUES (?, ?)', keys)
+    response = cur.execute('''
+        SELECT Games.GameName, Games.Platform, Games.Id FROM temp.GameKeys AS Keys
+        CROSS JOIN Games ON Games.GameName=Keys.GameName AND Games.Platform=Keys.Platform
+    ''')
+    return {(name, platform): game_id for name, platform, game_id in response}
+
+
+def _next_game_id(cur):
+    '''Get the next unused game id, never reusing the id of a deleted game like AUTOINCREMENT
+
+    Parameters
+    ----------
+    cur: sqlite3.Cursor
+        cursor of the database
+
+    Returns
+    -------
+    int
+        the next game id
+    '''
+    max_id = cur.execute('SELECT MAX(Id) FROM Games').fetchone()[0] or 0
+    seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name='Games'").fetchone()
+    if seq is not None:
+        max_id = max(max_id, seq[0])
+    return max_id + 1
+
+
+def get_connection(file_name):
+    '''Get the read-only connection of the current thread to the database, opened on first use
+
+    Each thread keeps its own connection, so sqlite3 can keep checking that a connection is only used by
+    the thread that created it. Prepared statements are reused through the statement cache of the connection.
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    connection: sqlite3.Connection
+        read-only connection
+    '''
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+    generation = _generations.get(file_name, 0)
+    entry = _local.connections.get(file_name)
+    if entry is not None and entry[1] != generation:
+        entry[0].close()
+        entry = None
+    if entry is None:
+        uri = 'file:' + pathname2url(os.path.abspath(file_name)) + '?mode=ro'
+        connection = sqlite3.connect(uri, uri=True, cached_statements=256)
+        for pragma in READ_PRAGMAS:
+            connection.execute(pragma)
+        entry = (connection, generation)
+        _local.connections[file_name] = entry
+    return entry[0]
+
+
+def close_connections(file_name):
+    '''Close the connections to the database, e.g. before deleting it
+
+    The connection of the current thread is closed now, those of other threads are closed and reopened
+    on their next use.
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    None
+    '''
+    with _generations_lock:
+        _generations[file_name] = _generations.get(file_name, 0) + 1
+    entry = getattr(_local, 'connections', {}).pop(file_name, None)
+    if entry is not None:
+        entry[0].close()
+
+
+def delete_database(file_name):
+    '''Close the connections to the database and delete it, with its write-ahead log
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    None
+    '''
+    close_connections(file_name)
+    get_company_registry(file_name).clear()
+    for path in [file_name, file_name + '-wal', file_name + '-shm']:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def get_data_version(file_name):
+    '''Get the data version of the database, it changes whenever the data is written
+
+    Parameters
+    ----------
+    file_name: str
+        database filename
+
+    Returns
+    -------
+    version: int
+        data version, None if there is no database
+    '''
+    if not os.path.isfile(file_name):
+        return None
+    try:
+        response = query_db("SELECT Value FROM Metadata WHERE Key='DataVersion'", file_name)
+    except sqlite3.OperationalError:
+        return None
+    return response[0][0] if response else None
+
+
+def query_db(query,file_name,params=()):
     '''Query the database
 
     Parameters
@@ -134,13 +956,11 @@ def query_db(query,file_name):
         the query SQL
     file_name: str
         database filename
+    params: tuple
+        values bound to the placeholders of the query
     Returns
     -------
     result: list[tuple]
         the returned query result
     '''
-    connection = sqlite3.connect(file_name)
-    cursor = connection.cursor()
-    result = cursor.execute(query).fetchall()
-    connection.close()
-    return result
\ No newline at end of file
+    return get_connection(file_name).execute(query, params).fetchall()
@@ -0,0 +1,265 @@
+import datetime
+import sys
+import lxml.html
+from lxml import etree
+
+# a class token, matched like BeautifulSoup matches class_='token'
+HAS_CLASS = 'contains(concat(" ", normalize-space(@class), " "), " {} ")'
+# a whole class attribute, matched like BeautifulSoup matches class_='token token'
+IS_CLASS = 'normalize-space(@class)="{}"'
+
+SUMMARIES = etree.XPath('//td[' + HAS_CLASS.format('clamp-summary-wrap') + ']')
+META_SCORE = etree.XPath('.//div[contains(normalize-space(@class), "metascore_w large")]')
+USER_SCORE = etree.XPath('.//div[contains(normalize-space(@class), "metascore_w user large")]')
+TITLE = etree.XPath('.//a[' + HAS_CLASS.format('title') + ']')
+DETAILS = etree.XPath('.//div[' + HAS_CLASS.format('clamp-details') + ']')
+DATA = etree.XPath('.//span[' + HAS_CLASS.format('data') + ']')
+LAST_PAGE = etree.XPath('//li[' + IS_CLASS.format('page last_page') + ']')
+DEVELOPER = etree.XPath('//li[' + IS_CLASS.format('summary_detail developer') + ']')
+BUTTON = etree.XPath('.//a[' + HAS_CLASS.format('button') + ']')
+GENRE = etree.XPath('//li[' + IS_CLASS.format('summary_detail product_genre') + ']')
+PLAYERS = etree.XPath('//li[' + IS_CLASS.format('summary_detail product_players') + ']')
+RATING = etree.XPath('//li[' + IS_CLASS.format('summary_detail product_rating') + ']')
+CRITIC_REVIEWS = etree.XPath('//div[' + IS_CLASS.format('module reviews_module critic_reviews_module') + ']')
+USER_REVIEWS = etree.XPath('//div[' + IS_CLASS.format('module reviews_module user_reviews_module') + ']')
+COUNT = etree.XPath('.//span[' + HAS_CLASS.format('count') + ']')
+REVIEWS_TOTAL = etree.XPath('//div[' + HAS_CLASS.format('reviews_total') + ']')
+
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def parse_html(page_context):
+    '''Parse a html page with lxml
+
+    Parameters
+    ----------
+    page_context: str
+        html content
+
+    Returns
+    -------
+    root:
+        root element of the page
+    '''
+    try:
+        return lxml.html.fromstring(page_context.encode('utf-8'), parser=HTML_PARSER)
+    except etree.ParserError:
+        # empty page
+        return lxml.html.fromstring('<html></html>')
+
+
+def first(elements):
+    '''First element of a search result, like BeautifulSoup.find
+
+    Parameters
+    ----------
+    elements: list
+        search result
+
+    Returns
+    -------
+    element:
+        the first element, None if not found
+    '''
+    return elements[0] if elements else None
+
+
+def get_page_count(page_context):
+    '''Get the number of listing pages from the first listing page, same result as cache_data.get_page_count
+
+    Parameters
+    ----------
+    page_context: str
+        html content of the first listing page
+
+    Returns
+    -------
+    page_num: int
+        number of listing pages
+    '''
+    last_page = first(LAST_PAGE(parse_html(page_context)))
+    try:
+        return int(last_page.find('.//a').text_content())
+    except:
+        return 1
+
+
+def get_games_single_page(page_context):
+    '''Get listed games from a html page, same result as cache_data.get_games_single_page
+
+    Parameters
+    ----------
+    page_context: str
+        html content of the game page
+
+    Returns
+    -------
+    game_list: list
+        list of game on that page
+    game_urls: list
+        urls to detail of games
+    '''
+    game_list = []
+    game_urls = []
+    for title in SUMMARIES(parse_html(page_context)):
+        try:
+            score = int(first(META_SCORE(title)).text_content())
+        except:
+            score = None
+        game_title = first(TITLE(title))
+        name = game_title.text_content().strip()
+        game_url = game_title.attrib['href']
+        details = first(DETAILS(title))
+        launch_date = details.find('span').text_content()
+        launch_date = datetime.datetime.strptime(launch_date, "%B %d, %Y").date()
+        platform = first(DATA(details)).text_content().strip()
+        try:
+            user_score = float(first(USER_SCORE(title)).text_content())
+        except:
+            user_score = None
+        game_list.append([name, launch_date, platform, score, user_score])
+        game_urls.append(game_url)
+    return game_list, game_urls
+
+
+def get_review_counts(module, thousands_separator):
+    '''Get the positive, mixed and negative review counts of a review module
+
+    Parameters
+    ----------
+    module:
+        element of the review module
+    thousands_separator: bool
+        whether the counts may contain commas
+
+    Returns
+    -------
+    total: int
+        number of reviews
+    positive: float
+        ratio of positive reviews
+    '''
+    try:
+        counts = [x.text_content().strip() for x in COUNT(module)]
+        if thousands_separator:
+            counts = [x.replace(",", "") for x in counts]
+        counts = [int(x) for x in counts]
+        total = sum(counts)
+        return total, counts[0] / total
+    except:
+        return None, None
+
+
+def get_game_detail_info(game_page_context, base_url):
+    '''Get detail game record on a game page, same result as cache_data.get_game_detail_info
+
+    Parameters
+    ----------
+    game_page_context: str
+        html of that game page
+    base_url: str
+        url the developer links are relative to
+
+    Returns
+    -------
+    attributes: list
+        list of attributes of the game
+    developers: dict
+        dict of developer names and their url
+    '''
+    root = parse_html(game_page_context)
+    try:
+        developer = first(DATA(first(DEVELOPER(root))))
+        developers = BUTTON(developer)
+        developer_names = [dev.text_content().strip() for dev in developers]
+        developers = {dev.text_content().strip(): base_url + dev.attrib['href'] for dev in developers}
+    except:
+        developer_names = []
+        developers = {}
+    try:
+        genres = [x.text_content().strip() for x in DATA(first(GENRE(root)))]
+    except:
+        genres = []
+    try:
+        num_of_players = first(DATA(first(PLAYERS(root)))).text_content().strip()
+        if num_of_players == 'No Online Multiplayer':
+            num_of_players = 0
+        else:
+            num_of_players = int(num_of_players.split(' ')[-1])
+    except:
+        num_of_players = None
+    try:
+        ratings = first(DATA(first(RATING(root)))).text_content().strip()
+    except:
+        ratings = None
+    critic_reviews_count_total, critic_reviews_count_pos_percentage = get_review_counts(
+        first(CRITIC_REVIEWS(root)), False)
+    user_reviews_count_total, user_reviews_count_pos_percentage = get_review_counts(
+        first(USER_REVIEWS(root)), True)
+
+    return [developer_names, num_of_players, ratings,
+            critic_reviews_count_total, critic_reviews_count_pos_percentage,
+            user_reviews_count_total, user_reviews_count_pos_percentage,
+            genres], developers
+
+
+def get_company_review_count(page_context):
+    '''Get the number of reviews on a developer page, same result as cache_data.get_company_review_count
+
+    Parameters
+    ----------
+    page_context: str
+        html of the developer page
+
+    Returns
+    -------
+    count: int
+        number of reviews, None if not found
+    '''
+    try:
+        count = first(COUNT(first(REVIEWS_TOTAL(parse_html(page_context))))).text_content()
+        return int(count.replace(",", ""))
+    except:
+        return None
+
+
+def compare_backends(cache):
+    '''Check that the lxml and BeautifulSoup parsers give the same records for every cached page
+
+    Parameters
+    ----------
+    cache: PageCache
+        cache file
+
+    Returns
+    -------
+    mismatches: list
+        urls of the pages parsed differently
+    '''
+    import cache_data
+    mismatches = []
+    for url, page in cache.items():
+        if '/browse/' in url:
+            same = (get_games_single_page(page) == cache_data.get_games_single_page(page)
+                    and get_page_count(page) == cache_data.get_page_count(page))
+        elif '/company/' in url:
+            same = get_company_review_count(page) == cache_data.get_company_review_count(page)
+        else:
+            base_url = cache_data.GAME_BASE_URL
+            same = get_game_detail_info(page, base_url) == cache_data.get_game_detail_info(page, base_url)
+        if not same:
+            mismatches.append(url)
+    return mismatches
+
+
+if __name__ == '__main__':
+    # golden check of the two parser backends on the pages of cache files
+    from page_cache import PageCache
+    failed = False
+    for cache_file in sys.argv[1:]:
+        mismatches = compare_backends(PageCache(cache_file))
+        for url in mismatches:
+            print("Mismatch:", url)
+        print(cache_file, "identical" if len(mismatches) == 0 else f"{len(mismatches)} mismatches")
+        failed = failed or len(mismatches) > 0
+    sys.exit(1 if failed else 0)
@@ -1,45 +1,99 @@
-from flask import Flask, render_template, request
-import sqlite3
-from query import process_query_games, process_query_companies, get_argparser, draw_line_chart, draw_bar_chart
+import os
+import plotly
+from urllib.parse import urlencode
+from flask import Flask, render_template, request, jsonify, send_file, url_for, stream_with_context
+from query import QuerySpec, GamePage, process_query_companies, process_query_line_chart, \
+    bar_chart_json, line_chart_json, search_names, autocomplete, query_batches, ndjson_lines, TARGET2FIELD
+from database_utils import get_data_version
+from result_cache import ResultCache
 
 app = Flask(__name__)
-DB_PATH='cache/db.sqlite'
+# the database served, set by serve.py or through the environment when the app is served by another server
+DB_PATH = os.environ.get('GAMES_DB_PATH', 'cache/db.sqlite')
+result_cache = ResultCache(maxsize=256, ttl=300)
+# bytes of rendered rows sent at once when a table is streamed
+STREAM_BUFFER = 8192
+# the plotly.js bundle of the plotly package, served once and cached by the browser instead of inlined in every chart
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
 
-def form_to_argument(form):
-    '''Conver the form to argument for query
+
+def query_key(spec):
+    '''Normalize a query to a key of the result cache
+
+    Parameters
+    ----------
+    spec:
+        the query
+
+    Returns
+    -------
+    key: tuple
+        the query parameters, the order of ratings and genres does not matter
+    '''
+    return (spec.target, spec.platform, spec.launchdate, spec.mode, tuple(sorted(set(spec.ratings or ()))),
+            None if spec.genres is None else tuple(sorted(set(spec.genres))), spec.genre_match, spec.search,
+            spec.record, spec.sortby, spec.order, spec.limit, spec.bar, spec.linechart, spec.engine)
+
+
+def next_page_url(cursor):
+    '''Url of the next page of the current game query
 
     Parameters
     ----------
-    form: request.Form
-        form get from POST
+    cursor: str
+        cursor of the next page, see query.encode_cursor
+
+    Returns
+    -------
+    url: str
+        the results url with the options of the query and the cursor
+    '''
+    options = [(name, value) for name, value in request.values.items(multi=True) if name != 'after']
+    return url_for('result_games') + '?' + urlencode(options + [('after', cursor)])
+
+
+def stream_page(template_name, key, version, **context):
+    '''Render a template while it is sent, and put the whole page in the result cache once it is sent
+
+    Parameters
+    ----------
+    template_name: str
+        the template
+    key: tuple
+        key of the page in the result cache
+    version: int
+        data version of the database the page is rendered from
+    context:
+        variables of the template
+
+    Returns
+    -------
+    response:
+        the streamed response
+    '''
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+
+    def generate():
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        result_cache.put(key, version, ''.join(chunks))
+
+    return app.response_class(stream_with_context(generate()), mimetype='text/html')
+
+
+def plotly_url():
+    '''Url of the plotly.js bundle, versioned so browsers can cache it for good
 
     Returns
     -------
-    argument: str
-        argument used for lateral query
+    url: str
+        url of the bundle
     '''
-    argument = ''
-    platform = form['platform']
-    argument += f"-p {platform} "
-    start_date = form['start_date']
-    if start_date == '':
-        start_date = '2000-01-01'
-    end_date = form['end_date']
-    argument += f"-d {start_date} {end_date} "
-    argument += f"-m {form['mode']} "
-    ratings = form.getlist('ratings')
-    if len(ratings) > 0:
-        argument += f"-r {' '.join(ratings)} "
-    argument += f"-rl {form['record']} "
-    argument += f"-s {form['sortby']} "
-    argument += f"-o {form['order']} "
-    argument += f"-l {form['limit']} "
-    if form['plots'] == 'bar':
-        argument += '--bar'
-    elif form['plots'] == 'line':
-        argument += '--linechart'
-    # print(argument)
-    return argument
+    return url_for('plotly_js', v=plotly.__version__)
 
 
 @app.route('/')
@@ -57,46 +111,115 @@ def companies_search_page():
     return render_template("index_company.html")
 
 
-@app.route('/results/games', methods=['POST'])
+@app.route('/results/games', methods=['GET', 'POST'])
 def result_games():
-    argument = ("-t games " + form_to_argument(request.form).strip()).split(' ')
-    parser = get_argparser()
+    # the form is posted for the first page, the links to the next pages carry the same options in the url
+    after = request.values.get('after')
     try:
-        args = parser.parse_args(argument)
-    except:
+        spec = QuerySpec.from_form('games', request.values)
+        game_page = GamePage(spec, DB_PATH, after)
+    except (KeyError, ValueError):
         return render_template("invalid.html")
-    if parser.error_message:
-        return render_template("invalid.html")
-    results, error_message = process_query_games(args, DB_PATH)
-    if error_message:
-        return render_template("invalid.html")
-    add_plot = False
-    plot = None
-    if args.bar:
-        plot, _ = draw_bar_chart(results, args, True)
-        add_plot = True
-    return render_template('table_games.html', results=results, add_plot=add_plot, plot_div=plot)
+    key = query_key(spec) + (after,)
+    version = get_data_version(DB_PATH)
+    page = result_cache.get(key, version)
+    if page is not None:
+        return page
+    results = game_page
+    figure = None
+    if spec.bar:
+        # the chart needs the whole page, the rows are only streamed without it
+        results = list(game_page)
+        figure = bar_chart_json(results, spec)
+    elif spec.linechart:
+        months, error_message = process_query_line_chart(spec, DB_PATH)
+        if error_message:
+            return render_template("invalid.html")
+        figure = line_chart_json(months)
+    return stream_page('table_games.html', key, version, results=results, page=game_page, figure=figure,
+                       plotly_url=plotly_url(), next_page_url=next_page_url)
 
 
 @app.route('/results/companies', methods=['POST'])
 def result_companies():
-    argument = ("-t companies " + form_to_argument(request.form).strip()).split(' ')
-    parser = get_argparser()
     try:
-        args = parser.parse_args(argument)
-    except:
-        return render_template("invalid.html")
-    if parser.error_message:
+        spec = QuerySpec.from_form('companies', request.form)
+    except (KeyError, ValueError):
         return render_template("invalid.html")
-    results, error_message = process_query_companies(args, DB_PATH)
+    key = query_key(spec)
+    version = get_data_version(DB_PATH)
+    page = result_cache.get(key, version)
+    if page is not None:
+        return page
+    results, error_message = process_query_companies(spec, DB_PATH)
     if error_message:
         return render_template("invalid.html")
-    add_plot = False
-    plot = None
-    if args.bar:
-        plot, _ = draw_bar_chart(results, args, True)
-        add_plot = True
-    return render_template('table_companies.html', results=results, add_plot=add_plot, plot_div=plot)
+    figure = None
+    if spec.bar:
+        figure = bar_chart_json(results, spec)
+    page = render_template('table_companies.html', results=results, figure=figure, plotly_url=plotly_url())
+    result_cache.put(key, version, page)
+    return page
+
+
+def api_response(target):
+    '''Stream the results of a query given by the url parameters as newline delimited JSON
+
+    Parameters
+    ----------
+    target: str
+        games|companies
+
+    Returns
+    -------
+    response:
+        one JSON object per row, sent batch by batch as they are read from the database, or the error and a 400
+    '''
+    try:
+        spec = QuerySpec.from_api(target, request.args)
+    except ValueError:
+        return jsonify(error="invalid arguments"), 400
+    batches, error_message = query_batches(spec, DB_PATH)
+    if error_message:
+        return jsonify(error=error_message), 400
+    fields = TARGET2FIELD[target]
+    lines = (ndjson_lines(rows, fields) for rows in batches)
+    return app.response_class(stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+@app.route('/api/games')
+def api_games():
+    return api_response('games')
+
+
+@app.route('/api/companies')
+def api_companies():
+    return api_response('companies')
+
+
+@app.route('/search')
+def search():
+    games, companies = search_names(request.args.get('q', ''), DB_PATH, request.args.get('limit', 10, type=int))
+    fields = ['name', 'platform', 'meta_score', 'user_score', 'developer', 'players', 'rating', 'genres',
+              'launch_date']
+    return jsonify(games=[dict(zip(fields, row)) for row in games],
+                   companies=[{'name': name, 'url': url} for name, url in companies])
+
+
+@app.route('/autocomplete')
+def suggest():
+    games, companies = autocomplete(request.args.get('q', ''), DB_PATH, request.args.get('limit', 10, type=int))
+    return jsonify(games=games, companies=companies)
+
+
+@app.route('/plotly.min.js')
+def plotly_js():
+    return send_file(PLOTLY_JS, mimetype='text/javascript', max_age=31536000)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
 
 
 if __name__ == '__main__':
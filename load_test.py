@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+PLATFORMS = ['none', 'ps4', 'ps5', 'switch', 'xboxone', 'xbox-series-x']
+ENDPOINTS = ['/results/games', '/results/companies']
+
+
+def make_forms(count, seed=0):
+    '''Make distinct forms of the result pages, like those posted by the search pages of the flask app
+
+    Parameters
+    ----------
+    count: int
+        number of forms
+    seed: int
+        random seed
+
+    Returns
+    -------
+    forms: list
+        endpoint and form of each query
+    '''
+    rng = random.Random(seed)
+    forms = []
+    for i in range(count):
+        endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+        year = rng.randint(2013, 2020)
+        form = {'platform': rng.choice(PLATFORMS), 'start_date': f'{year}-01-01',
+                'end_date': f'{rng.randint(year, 2021)}-12-31', 'mode': rng.choice(['none', 'online', 'offline']),
+                'genres': '', 'genre_match': 'any', 'search': '', 'record': str(rng.choice([0, 5, 20])),
+                'sortby': rng.choice(['meta', 'user']), 'order': rng.choice(['top', 'bottom']),
+                'limit': str(rng.choice([10, 50, 100])), 'plots': 'table'}
+        ratings = rng.sample(['E', 'E10+', 'T', 'M'], rng.randint(0, 2))
+        if ratings:
+            form['ratings'] = ratings
+        forms.append((endpoint, form))
+    return forms
+
+
+def percentile(values, q):
+    '''Percentile of sorted values, the value below which q percent of them are
+
+    Parameters
+    ----------
+    values: list
+        sorted values
+    q: float
+        percent
+
+    Returns
+    -------
+    value: float
+        the percentile, None if there is no value
+    '''
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def run_load_test(url, clients=8, num_requests=2000, distinct=200, seed=0):
+    '''Post the result forms from concurrent clients and measure the latencies
+
+    Parameters
+    ----------
+    url: str
+        url of the flask app
+    clients: int
+        number of clients sending requests at the same time, each with its keep-alive session
+    num_requests: int
+        number of requests in total
+    distinct: int
+        number of distinct queries, the others are answered from the result cache
+    seed: int
+        random seed
+
+    Returns
+    -------
+    report: dict
+        requests per second, and count, errors, p50 and p99 latencies in milliseconds of each endpoint and of all
+    '''
+    forms = make_forms(distinct, seed)
+    rng = random.Random(seed)
+    plan = [rng.choice(forms) for _ in range(num_requests)]
+    sessions = threading.local()
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+    lock = threading.Lock()
+
+    def send(query):
+        endpoint, form = query
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = sessions.session.post(url + endpoint, data=form)
+            ok = response.status_code == 200 and b'Invalid' not in response.content[:200]
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[endpoint].append(elapsed)
+            if not ok:
+                errors[endpoint] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(send, plan))
+    elapsed = time.perf_counter() - start
+    report = {'url': url, 'clients': clients, 'requests': num_requests, 'distinct': distinct,
+              'seconds': round(elapsed, 3), 'rps': round(num_requests / elapsed, 1), 'endpoints': {}}
+    latencies['all'] = [latency for endpoint in ENDPOINTS for latency in latencies[endpoint]]
+    errors['all'] = sum(errors.values())
+    for endpoint in ENDPOINTS + ['all']:
+        values = sorted(latencies[endpoint])
+        report['endpoints'][endpoint] = {
+            'count': len(values),
+            'errors': errors[endpoint],
+            'p50_ms': None if not values else round(percentile(values, 50) * 1000, 2),
+            'p99_ms': None if not values else round(percentile(values, 99) * 1000, 2),
+        }
+    return report
+
+
+def start_server(db_path, port, threads):
+    '''Start serve.py in another process, so the clients do not share its interpreter
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+    port: int
+        port to listen on
+    threads: int
+        number of server threads
+
+    Returns
+    -------
+    process: subprocess.Popen
+        the server process, once it answers
+    '''
+    serve = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+    process = subprocess.Popen([sys.executable, serve, '--db', db_path, '--port', str(port),
+                                '--threads', str(threads)])
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("the server did not start")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the result pages of the flask app')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='url of a running flask app')
+    parser.add_argument('--db', default=None,
+                        help='start serve.py on this database instead of testing a running app')
+    parser.add_argument('--port', default=5057, type=int, help='port of the server started with --db')
+    parser.add_argument('--threads', default=8, type=int, help='threads of the server started with --db')
+    parser.add_argument('--clients', default=8, type=int, help='number of concurrent clients')
+    parser.add_argument('--requests', default=2000, type=int, help='number of requests')
+    parser.add_argument('--distinct', default=200, type=int,
+                        help='number of distinct queries, the repeated ones hit the result cache')
+    parser.add_argument('--seed', default=0, type=int, help='random seed')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    server = None
+    url = args.url
+    if args.db is not None:
+        server = start_server(args.db, args.port, args.threads)
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        report = run_load_test(url, args.clients, args.requests, args.distinct, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['requests']} requests from {report['clients']} clients in {report['seconds']}s, "
+              f"{report['rps']} requests per second")
+        for endpoint, stats in report['endpoints'].items():
+            print(f"{endpoint:20} count {stats['count']:6}  errors {stats['errors']:4}  "
+                  f"p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms")
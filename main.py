@@ -1,9 +1,11 @@
-from cache_data import cache_result_by_platform
+from cache_data import cache_result_by_platform, cache_results_by_platforms, refresh_platform
 import os
-from database_utils import query_db
-from query import get_argparser, process_query, draw_bar_chart, print_results, draw_line_chart
+from database_utils import query_db, delete_database, create_tables, check_monthly_games, check_company_stats
+from query import QuerySpec, get_argparser, process_query, draw_bar_chart, print_results, draw_line_chart, check_query_plans, \
+    export_results
 import argparse
-from flask_app import app
+import shlex
+from serve import GameServer
 
 CACHE_DIR = "./cache/"
 VALID_PLATFORM = {'ps4', 'ps5', 'switch', 'xboxone', 'xbox-series-x'}
@@ -59,6 +61,9 @@ def load_help_text(path):
 if __name__ == '__main__':
     print("Hello!")
     print("Checking database")
+    if os.path.isfile(CACHE_DIR + 'db.sqlite'):
+        # bring databases made by older versions to the current schema
+        create_tables(CACHE_DIR + 'db.sqlite')
     cached_platforms, game_platform_count = check_database(CACHE_DIR + 'db.sqlite')
     if len(cached_platforms) > 0:
         print("Cached game platforms:", cached_platforms)
@@ -67,6 +72,8 @@ if __name__ == '__main__':
     state = 0
     help_text_step1 = load_help_text("help_step1.txt")
     data_base_path = CACHE_DIR + 'db.sqlite'
+    # the flask app served in the background while the prompt stays usable
+    server = None
     parser = get_argparser()
     while True:
         if state == 0:
@@ -85,8 +92,7 @@ if __name__ == '__main__':
                 confirm = input("Will delete the database, press y to confirm:")
                 if confirm != 'y':
                     continue
-                if os.path.isfile(CACHE_DIR + 'db.sqlite'):
-                    os.remove(CACHE_DIR + 'db.sqlite')
+                delete_database(CACHE_DIR + 'db.sqlite')
                 game_count = -1
                 print("Deleted the database")
             elif response == 'status':
@@ -95,12 +101,58 @@ if __name__ == '__main__':
                     print("Cached game platforms:", cached_platforms)
                     print("Cached games:", game_platform_count)
                 game_count = sum(game_platform_count)
+            elif response == 'check':
+                if not os.path.isfile(CACHE_DIR + 'db.sqlite'):
+                    print("Database not found")
+                    continue
+                full_scans = check_query_plans(CACHE_DIR + 'db.sqlite')
+                for argument, step in full_scans:
+                    print(f"{argument}: {step}")
+                if len(full_scans) == 0:
+                    print("All queries use indexes")
+                mismatches = check_monthly_games(CACHE_DIR + 'db.sqlite')
+                for cell in mismatches:
+                    print("Monthly game count mismatch:", cell)
+                if len(mismatches) == 0:
+                    print("Monthly game counts match the games")
+                mismatches = check_company_stats(CACHE_DIR + 'db.sqlite')
+                for row in mismatches:
+                    print("Company aggregate mismatch:", row)
+                if len(mismatches) == 0:
+                    print("Company aggregates match the games")
+            elif response == 'add-all' or (len(response.split()) > 2 and response.split()[0] == 'add'
+                                           and all(p in VALID_PLATFORM for p in response.split()[1:])):
+                # crawl several platforms at the same time
+                if response == 'add-all':
+                    platforms = sorted(VALID_PLATFORM)
+                else:
+                    platforms = list(dict.fromkeys(response.split()[1:]))
+                print("Fetching data for", ', '.join(platforms))
+                failed = cache_results_by_platforms(platforms, CACHE_DIR, CACHE_DIR + 'db.sqlite')
+                for platform, error in failed.items():
+                    print(f"Failed to fetch {platform}: {error}")
+                cached_platforms, game_platform_count = check_database(CACHE_DIR + 'db.sqlite')
+                if len(cached_platforms) > 0:
+                    print("Cached game platforms:", cached_platforms)
+                    print("Cached games:", game_platform_count)
+                game_count = sum(game_platform_count)
             elif len(response.split(' ')) == 2 and response.split(' ')[0] == 'add' and response.split(' ')[
                 1] in VALID_PLATFORM:
                 # add new platforms
                 platform = response.split(' ')[1]
                 print("Fetching data for", platform)
-                cache_result_by_platform(platform, CACHE_DIR + f'cache_{platform}.json', CACHE_DIR + 'db.sqlite')
+                cache_result_by_platform(platform, CACHE_DIR + f'cache_{platform}.sqlite', CACHE_DIR + 'db.sqlite')
+                cached_platforms, game_platform_count = check_database(CACHE_DIR + 'db.sqlite')
+                if len(cached_platforms) > 0:
+                    print("Cached game platforms:", cached_platforms)
+                    print("Cached games:", game_platform_count)
+                game_count = sum(game_platform_count)
+            elif len(response.split(' ')) == 2 and response.split(' ')[0] == 'refresh' and response.split(' ')[
+                1] in VALID_PLATFORM:
+                # fetch new and changed games of a platform
+                platform = response.split(' ')[1]
+                print("Refreshing data for", platform)
+                refresh_platform(platform, CACHE_DIR + f'cache_{platform}.sqlite', CACHE_DIR + 'db.sqlite')
                 cached_platforms, game_platform_count = check_database(CACHE_DIR + 'db.sqlite')
                 if len(cached_platforms) > 0:
                     print("Cached game platforms:", cached_platforms)
@@ -114,7 +166,8 @@ if __name__ == '__main__':
                 print("No data in database, go to step 1")
                 state = 0
                 continue
-            response = input("Type 'back' to last step,'help' for help,'flask' to launch a flask app, or 'exit':")
+            response = input("Type 'back' to last step,'help' for help,'flask [threads]' to serve the flask app,"
+                             "'stop' to stop it, or 'exit':")
             response = response.strip()
             if response == 'exit':
                 break
@@ -126,11 +179,32 @@ if __name__ == '__main__':
                     parser.parse_args(['--help'])
                 except SystemExit:
                     continue
-            elif response == 'flask':
-                app.run(debug=False)
+            elif response.split(' ')[0] == 'flask' and len(response.split()) <= 2:
+                if server is not None:
+                    print("The flask app is already served on", server.url)
+                    continue
+                threads = response.split()[1] if len(response.split()) == 2 else '8'
+                if not threads.isdigit() or int(threads) <= 0:
+                    print("invalid number of threads:", threads)
+                    continue
+                try:
+                    server = GameServer(data_base_path, threads=int(threads))
+                except (RuntimeError, OSError) as error:
+                    print(error)
+                    continue
+                server.start()
+                print(f"Serving the flask app on {server.url} with {threads} threads, type 'stop' to stop it")
+            elif response == 'stop':
+                if server is None:
+                    print("The flask app is not served")
+                    continue
+                server.stop()
+                server = None
+                print("Stopped the flask app")
             else:
                 try:
-                    args = parser.parse_args(response.split(' '))
+                    # quotes keep a genre with spaces in one argument, e.g. -g 'Action Adventure'
+                    args = parser.parse_args(shlex.split(response))
                 except:
                     print("invalid input detected please retry")
                     continue
@@ -138,18 +212,27 @@ if __name__ == '__main__':
                     print(parser.error_message)
                     parser.error_message = ''
                     continue
-                if args.linechart:
-                    draw_line_chart(args, data_base_path)
+                spec = QuerySpec.from_args(args)
+                if args.export:
+                    count, error = export_results(spec, data_base_path, *args.export)
+                    if error:
+                        print(error)
+                    else:
+                        print(f"Exported {count} records to {args.export[1]}")
+                elif spec.linechart:
+                    draw_line_chart(spec, data_base_path)
                 else:
-                    result, error = process_query(args, data_base_path)
+                    result, error = process_query(spec, data_base_path)
                     if error:
                         print(error)
                         continue
-                    if args.bar:
-                        draw_bar_chart(result, args)
+                    if spec.bar:
+                        draw_bar_chart(result, spec)
                     else:
                         if len(result) > 0:
-                            print_results(result, args)
+                            print_results(result, spec)
                         else:
                             print("No records found")
+    if server is not None:
+        server.stop()
     print("Bye!")
\ No newline at end of file
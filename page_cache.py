@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import zlib
+
+
+class PageCache:
+    '''
+        An on-disk cache of html pages keyed by url, backed by SQLite.
+        Pages are compressed with zlib, read only when requested and written as soon as they are stored.
+        Stored pages are committed every <commit_every> pages, each commit is atomic so an interrupted crawl
+        keeps everything up to the last checkpoint.
+        The ETag and Last-Modified of the response are kept next to each page for conditional refreshes.
+        Supports the dict operations used by the crawler: in, [], []= and len.
+    '''
+    def __init__(self, path, commit_every=1):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS "Pages" (
+                "Url"	TEXT NOT NULL UNIQUE,
+                "Body"	BLOB NOT NULL,
+                "ETag"	TEXT,
+                "LastModified"	TEXT
+            )
+        ''')
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(Pages)')}
+        if 'ETag' not in columns:
+            # caches written before the validators were stored
+            self.connection.execute('ALTER TABLE Pages ADD COLUMN "ETag" TEXT')
+            self.connection.execute('ALTER TABLE Pages ADD COLUMN "LastModified" TEXT')
+        self.connection.commit()
+
+    def __contains__(self, url):
+        return self.connection.execute('SELECT 1 FROM Pages WHERE Url=?', (url,)).fetchone() is not None
+
+    def __getitem__(self, url):
+        row = self.connection.execute('SELECT Body FROM Pages WHERE Url=?', (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def __setitem__(self, url, html):
+        self.store(url, html)
+
+    def store(self, url, html, etag=None, last_modified=None):
+        '''Store a page with the validators of the response it came from
+
+        Parameters
+        ----------
+        url: str
+            url of the page
+        html: str
+            html content
+        etag: str
+            ETag header of the response, None if not sent
+        last_modified: str
+            Last-Modified header of the response, None if not sent
+
+        Returns
+        -------
+        None
+        '''
+        self.connection.execute('INSERT OR REPLACE INTO Pages (Url, Body, ETag, LastModified) VALUES (?, ?, ?, ?)',
+                                (url, zlib.compress(html.encode('utf-8')), etag, last_modified))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def validators(self, url):
+        '''Validators of a cached page, to ask the server whether the page changed
+
+        Parameters
+        ----------
+        url: str
+            url of the page
+
+        Returns
+        -------
+        etag: str
+            ETag of the cached page, None if unknown
+        last_modified: str
+            Last-Modified of the cached page, None if unknown
+        '''
+        row = self.connection.execute('SELECT ETag, LastModified FROM Pages WHERE Url=?', (url,)).fetchone()
+        return (None, None) if row is None else row
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM Pages').fetchone()[0]
+
+    def keys(self):
+        '''Urls of the cached pages
+
+        Returns
+        -------
+        urls: generator
+            cached urls
+        '''
+        return (row[0] for row in self.connection.execute('SELECT Url FROM Pages'))
+
+    def items(self):
+        '''Urls and html of the cached pages
+
+        Returns
+        -------
+        pages: generator
+            cached urls and their html
+        '''
+        for url, body in self.connection.execute('SELECT Url, Body FROM Pages'):
+            yield url, zlib.decompress(body).decode('utf-8')
+
+    def update(self, pages):
+        '''Store many pages in a single transaction
+
+        Parameters
+        ----------
+        pages: iterable
+            urls and their html
+
+        Returns
+        -------
+        None
+        '''
+        self.connection.executemany('INSERT OR REPLACE INTO Pages (Url, Body) VALUES (?, ?)',
+                                    ((url, zlib.compress(html.encode('utf-8'))) for url, html in pages))
+        self.commit()
+
+    def clear(self):
+        '''Remove all the cached pages
+
+        Returns
+        -------
+        None
+        '''
+        self.connection.execute('DELETE FROM Pages')
+        self.commit()
+
+    def commit(self):
+        '''Commit the stored pages to disk
+
+        Returns
+        -------
+        None
+        '''
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        '''Commit and close the cache
+
+        Returns
+        -------
+        None
+        '''
+        self.commit()
+        self.connection.close()
+
+
+def import_json_cache(cache, json_path):
+    '''Import pages from a legacy json cache file
+
+    Parameters
+    ----------
+    cache: PageCache
+        cache to import into
+    json_path: str
+        path to the json cache file
+
+    Returns
+    -------
+    count: int
+        number of imported pages
+    '''
+    if not os.path.isfile(json_path):
+        return 0
+    with open(json_path) as f:
+        pages = json.load(f)
+    cache.update(pages.items())
+    return len(pages)
@@ -1,7 +1,23 @@
-import sqlite3
 import argparse
+import csv
+import datetime
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from database_utils import get_connection, year_month, REVIEW_BUCKETS
 import plotly.graph_objects as go
 from prettytable import PrettyTable
+try:
+    import columnar
+except ImportError:
+    columnar = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow is only needed for the parquet exports
+    pyarrow = None
 
 ABBR2PLATFORM={
     'ps4': "PlayStation 4",
@@ -11,9 +27,100 @@ ABBR2PLATFORM={
     'xbox-series-x': 'Xbox Series X'
 }
 
+# representative queries whose plans are checked for full table scans
+PLAN_CHECK_ARGUMENTS=[
+    '-t games',
+    '-t games -s user -o bottom',
+    '-t games -p ps4',
+    '-t games -p switch -s user -rl 10',
+    '-t games -r E T M -d 2015-01-01 2019-12-31 -p ps4 -s meta -o top',
+    '-t games -d 2016-01-01 2016-12-31 -m online',
+    '-t companies',
+    '-t companies -p switch -s count -m online',
+    '-t companies -d 2015-01-01 2019-12-31 -r E T -s user',
+    '-t companies -d 2013-01-01 2021-04-29',
+    '-t games --linechart',
+    '-t games -p ps4 -m offline --linechart',
+    '-t games -d 2015-01-01 2019-12-31 -r M --linechart',
+    '-t games -d 2013-01-01 2021-04-29 --linechart',
+    '-t games -g Action Puzzle',
+    '-t games -p switch -g Action Puzzle --genre-match all',
+    '-t companies -g Action',
+    '-t genres -p ps4 -s user',
+    '-t games --search mario',
+    '-t companies --search nin',
+]
+
+TABLES={'Games','Genres','GenreNames','Companies','Game2Company','GameSearch','CompanySearch'}
+
+RATINGS=['E','E10+','T','M']
+
+MODES=['none','online','offline']
+
+ORDERS={'top':'DESC','bottom':'ASC'}
+
+# how the games of several genres are combined: games with any of the genres, or with all of them
+GENRE_MATCHES={'any':'UNION','all':'INTERSECT'}
+# the games of a genre, read in game id order from the (GenreId, GameId) key of Genres
+GENRE_POSTINGS='SELECT GameId FROM Genres WHERE GenreId=(SELECT GenreId FROM GenreNames WHERE Genre=?)'
+# the games and companies found by the full-text indexes, whose rowids are the game and company ids
+GAME_SEARCH='SELECT rowid FROM GameSearch WHERE GameSearch MATCH ?'
+COMPANY_SEARCH='SELECT rowid FROM CompanySearch WHERE CompanySearch MATCH ?'
+# matches ranked by search_names, ranking every match of a common word would take tens of milliseconds
+SEARCH_CANDIDATES=200
+
+# keyset filters read in turn to fill a page of games, by order and by whether the page starts after a NULL score,
+# NULL scores come last in descending order and first in ascending order
+PAGE_SEGMENTS={
+    ('DESC',False):['after_value','nulls'],
+    ('DESC',True):['after_null'],
+    ('ASC',False):['after_value'],
+    ('ASC',True):['after_null','values'],
+}
+# rows read from the database at once when a page is streamed
+FETCH_SIZE=100
+# rows read from the database and written at once by the exports and the api
+EXPORT_BATCH_SIZE=10000
+EXPORT_FORMATS=['csv','ndjson','parquet']
+
+SORT_COLUMNS={
+    'games':{'none':'MetaScore','meta':'MetaScore','user':'UserScore'},
+    'companies':{'none':'[AVG(MetaScore)]','meta':'[AVG(MetaScore)]','user':'[AVG(UserScore)]','count':'[COUNT(*)]'},
+    'genres':{'none':'[AVG(MetaScore)]','meta':'[AVG(MetaScore)]','user':'[AVG(UserScore)]','count':'[COUNT(*)]'},
+}
+
+# columns of the filters on games and on the per company aggregates
+GAME_COLUMNS={
+    'platform':'Platform',
+    'date':'LaunchDate',
+    'mode':{'online':'NumOfPlayers > 0','offline':'NumOfPlayers = 0'},
+    'rating':'Ratings',
+    'id':'Id',
+}
+STATS_COLUMNS={
+    'platform':'Platform',
+    'date':'LaunchMonth',
+    'mode':{'online':"Mode='online'",'offline':"Mode='offline'"},
+    'rating':'Ratings',
+}
+MONTHLY_COLUMNS={
+    'platform':'Platform',
+    'date':'YearMonth',
+    'mode':{'online':"Mode='online'",'offline':"Mode='offline'"},
+    'rating':'Ratings',
+}
+REVIEW_BUCKET_COLUMNS={'CriticTotal':'CriticBucket','UserTotal':'UserBucket'}
+
 TARGET2FIELD={
     'games':['GameName','Platform','MetaScore','UserScore','Developer','NumOfOnlinePlayers','Ratings','Genres','LaunchDate'],
     'companies':['CompanyName','GameCount','AverageMetaScore','AverageUserScore'],
+    'genres':['Genre','GameCount','AverageMetaScore','AverageUserScore'],
+}
+# arrow types of the fields, for the parquet exports
+TARGET2TYPE={
+    'games':['string','string','float64','float64','string','int64','string','string','string'],
+    'companies':['string','int64','float64','float64'],
+    'genres':['string','int64','float64','float64'],
 }
 
 class MyArgumentParser(argparse.ArgumentParser):
@@ -49,7 +156,7 @@ def get_argparser():
     '''
     parser = MyArgumentParser()
     parser.add_argument('--target','-t',type=str,
-                        help='The target to list, games or companies')
+                        help='The target to list, games, companies or genres')
     parser.add_argument('--platform','-p',default='none',type=str,
                         help='Platform of games, options=ps4|ps5|switch|xboxone|xbox-series-x')
     parser.add_argument('--launchdate','-d',default=None,nargs='+',type=str,
@@ -58,21 +165,172 @@ def get_argparser():
                         help='Mode of the game, options=none|online|offline')
     parser.add_argument('--ratings','-r',default=None,nargs='+',type=str,
                         help='Age Group of the game can input multiple options, options=E|E10+|T|M')
+    parser.add_argument('--genre','-g',default=None,nargs='+',type=str,
+                        help='Genres of the game can input multiple options, e.g. Action Puzzle')
+    parser.add_argument('--genre-match',default='any',type=str,
+                        help='Whether games need any or all of the genres, options=any|all')
+    parser.add_argument('--search',default=None,nargs='+',type=str,
+                        help='Words of the name, developer or genres of the games, or of the name of the companies, the last word may be a prefix')
     parser.add_argument('--record','-rl',default=0,type=int,
                         help='Filter results with less than <recordlimit> number of reviews(games) or game counts(companies)')
     parser.add_argument('--sortby','-s',default='meta',type=str,
                         help='Whether to sort/aggregate, count are intended for companies, options=meta|user|count')
     parser.add_argument('--order','-o',default='top',type=str,
                         help='List results in descending(top) or ascending(bottom) order, options=top|bottom')
-    parser.add_argument('--limit','-l',default=10,type=int,
-                        help='Number of results to show')
+    parser.add_argument('--limit','-l',default=None,type=int,
+                        help='Number of results to show, 10 by default')
     parser.add_argument('--bar',action='store_true',
                         help='whether to show a bar chart of the result')
     parser.add_argument('--linechart',action='store_true',
                         help='whether to draw a line chart of game count in each month, will override sort options')
+    parser.add_argument('--export',default=None,nargs=2,type=str,metavar=('FORMAT','FILE'),
+                        help='Write every result to a file instead of printing it, unless -l is given, format: csv|ndjson|parquet')
+    parser.add_argument('--engine',default='sqlite',type=str,
+                        help='Engine answering the query, columnar keeps the data in memory and needs numpy, options=sqlite|columnar')
     return parser
 
-def query_db(query,db_path):
+
+@dataclass(slots=True)
+class QuerySpec:
+    '''
+        A query on the games or companies, with the options of the command line.
+        Built from the parsed command line or from the form of the flask app, then compiled to SQL by compile_query.
+    '''
+    target: str = None
+    platform: str = 'none'
+    launchdate: tuple = None
+    mode: str = 'none'
+    ratings: tuple = None
+    genres: tuple = None
+    genre_match: str = 'any'
+    search: str = None
+    record: int = 0
+    sortby: str = 'meta'
+    order: str = 'top'
+    limit: int = 10
+    bar: bool = False
+    linechart: bool = False
+    engine: str = 'sqlite'
+
+    @classmethod
+    def from_args(cls,args):
+        '''Make the query from the parsed command line
+
+        Parameters
+        ----------
+        args:
+            parsed argument
+
+        Returns
+        -------
+        spec: QuerySpec
+            the query
+        '''
+        return cls(target=args.target,platform=args.platform,
+                   launchdate=None if args.launchdate is None else tuple(args.launchdate),
+                   mode=args.mode,ratings=None if args.ratings is None else tuple(args.ratings),
+                   genres=None if args.genre is None else tuple(args.genre),genre_match=args.genre_match,
+                   search=None if args.search is None else ' '.join(args.search),
+                   record=args.record,sortby=args.sortby,order=args.order,
+                   limit=args.limit if args.limit is not None else None if args.export else 10,
+                   bar=args.bar,linechart=args.linechart,engine=args.engine)
+
+    @classmethod
+    def from_form(cls,target,form):
+        '''Make the query from the form of the flask app
+
+        Parameters
+        ----------
+        target: str
+            games, companies or genres
+        form: request.Form
+            form get from POST
+
+        Returns
+        -------
+        spec: QuerySpec
+            the query, raises KeyError or ValueError if the form is incomplete
+        '''
+        start_date=form['start_date'] or '2000-01-01'
+        end_date=form['end_date']
+        ratings=form.getlist('ratings')
+        genres=[genre.strip() for genre in form.get('genres','').split(',') if genre.strip()]
+        return cls(target=target,platform=form['platform'],
+                   launchdate=(start_date,end_date) if end_date else (start_date,),
+                   mode=form['mode'],ratings=tuple(ratings) if ratings else None,
+                   genres=tuple(genres) if genres else None,genre_match=form.get('genre_match','any'),
+                   search=form.get('search','').strip() or None,
+                   record=int(form['record']),sortby=form['sortby'],order=form['order'],limit=int(form['limit']),
+                   bar=form['plots']=='bar',linechart=form['plots']=='line')
+
+    @classmethod
+    def from_api(cls,target,args):
+        '''Make the query from the url parameters of the api, every parameter is optional
+
+        Parameters
+        ----------
+        target: str
+            games, companies or genres
+        args: request.args
+            url parameters, launchdate, rating and genre may be repeated
+
+        Returns
+        -------
+        spec: QuerySpec
+            the query, with every result if there is no limit, raises ValueError if a number is malformed
+        '''
+        launchdate=args.getlist('launchdate')
+        ratings=args.getlist('rating')
+        genres=args.getlist('genre')
+        return cls(target=target,platform=args.get('platform','none'),
+                   launchdate=tuple(launchdate) if launchdate else None,
+                   mode=args.get('mode','none'),ratings=tuple(ratings) if ratings else None,
+                   genres=tuple(genres) if genres else None,genre_match=args.get('genre_match','any'),
+                   search=args.get('search'),record=int(args.get('record',0)),
+                   sortby=args.get('sortby','meta'),order=args.get('order','top'),
+                   limit=int(args['limit']) if 'limit' in args else None)
+
+    def validate(self,kind):
+        '''Check the options of the query
+
+        Parameters
+        ----------
+        kind: str
+            games|companies|genres|linechart, the sort options are not used by the line chart
+
+        Returns
+        -------
+        error_message:
+            error message, if is empty, the query is valid
+        '''
+        if self.platform!='none' and self.platform not in ABBR2PLATFORM:
+            return f"invalid arguments for: -p {self.platform}"
+        if self.launchdate is not None and len(self.launchdate) not in (1,2):
+            return f"invalid arguments for: -d {list(self.launchdate)}"
+        if self.mode not in MODES:
+            return f"invalid arguments for: -m {self.mode}"
+        if self.ratings is not None and any(rating not in RATINGS for rating in self.ratings):
+            return f"invalid arguments for: -r {list(self.ratings)}"
+        if self.genres is not None and len(self.genres)==0:
+            return f"invalid arguments for: -g {list(self.genres)}"
+        if self.genre_match not in GENRE_MATCHES:
+            return f"invalid arguments for: --genre-match {self.genre_match}"
+        if self.search is not None and search_expression(self.search) is None:
+            return f"invalid arguments for: --search {self.search}"
+        if kind!='linechart' and self.sortby not in SORT_COLUMNS[kind]:
+            return f"invalid arguments for: -s {self.sortby}"
+        if self.record<0:
+            return f"invalid arguments for: -rl {self.record}"
+        if kind=='linechart':
+            return ""
+        if self.order not in ORDERS:
+            return f"invalid arguments for: -o {self.order}"
+        if self.limit is not None and self.limit<=0:
+            return f"invalid arguments for: -l {self.limit}"
+        return ""
+
+
+def query_db(query,db_path,params=()):
     '''Query the database
 
     Parameters
@@ -81,301 +339,952 @@ def query_db(query,db_path):
         the query SQL
     db_path: str
         the path to database
+    params: tuple
+        values bound to the placeholders of the query
     Returns
     -------
     result: list[tuple]
         the returned query result
     '''
-    connection = sqlite3.connect(db_path)
-    cursor = connection.cursor()
-    result = cursor.execute(query).fetchall()
-    return result
+    return get_connection(db_path).execute(query, params).fetchall()
 
 
-def process_query_games(args,db_path):
-    '''Process the query for games
+def search_expression(text,prefix=True,columns=None):
+    '''Convert the words of a text to a full-text query, the words are quoted so they are never read as operators
 
     Parameters
     ----------
-    args:
-        parsed argument
+    text: str
+        words to look for
+    prefix: bool
+        whether the last word may be the beginning of a word, for search as you type
+    columns: list
+        columns of the index to look in, all of them if None
+
+    Returns
+    -------
+    expression: str
+        FTS5 query matching all the words, None if the text has no words
+    '''
+    words=re.findall(r'\w+',text or '')
+    if len(words)==0:
+        return None
+    terms=['"'+word+'"' for word in words]
+    if prefix:
+        terms[-1]+='*'
+    expression=' '.join(terms)
+    if columns is not None:
+        expression='{'+' '.join(columns)+'} : ('+expression+')'
+    return expression
+
+
+def get_columnar_engine(spec,db_path):
+    '''Get the columnar engine if the query asks for it
+
+    Parameters
+    ----------
+    spec:
+        the query
     db_path:
         path to the database
 
     Returns
     -------
-    result:
-        A list of query result
+    engine:
+        the columnar engine, None if the query goes to SQLite
     error_message:
-        error message, if is empty, the query is successful
+        error message, if is empty, the engine is valid
     '''
-    if args.platform=='none':
-        platform_filter=''
-    elif args.platform in ABBR2PLATFORM:
-        platform_filter=f'Platform="{ABBR2PLATFORM[args.platform]}"'
-    else:
-        return [],f"invalid arguments for: -p {args.platform}"
+    if spec.engine=='sqlite':
+        return None,""
+    if spec.engine!='columnar':
+        return None,f"invalid arguments for: --engine {spec.engine}"
+    if columnar is None:
+        return None,"numpy is required for: --engine columnar"
+    return columnar.get_engine(db_path),""
 
-    if args.launchdate is None:
-        date_filter=''
-    elif isinstance(args.launchdate,list) and (len(args.launchdate)==1 or len(args.launchdate)==2):
-        if len(args.launchdate)==1:
-            date_filter=f'LaunchDate >= "{args.launchdate[0]}"'
-        else:
-            date_filter=f'LaunchDate BETWEEN "{args.launchdate[0]}" AND "{args.launchdate[1]}"'
-    else:
-        return [],f"invalid arguments for: -d {args.launchdate}"
-
-    if args.mode=='none':
-        mode_filter=''
-    elif args.mode=='online':
-        mode_filter='NumOfPlayers > 0'
-    elif args.mode=='offline':
-        mode_filter='NumOfPlayers = 0'
-    else:
-        return [],f"invalid arguments for: -m {args.mode}"
 
+def columnar_filters(spec):
+    '''Convert the filters of a valid query to the arguments of the columnar engine
 
-    if args.ratings is None:
-        rating_filter=''
-    else:
-        rating_filters = []
-        for rating in args.ratings:
-            if rating in ['E','E10+','T','M']:
-                rating_filters.append(f'Ratings = "{rating}"')
-            else:
-                return [],f"invalid arguments for: -r {args.ratings}"
-        rating_filter='('+' OR '.join(rating_filters)+')'
+    Parameters
+    ----------
+    spec:
+        the query
 
-    if args.sortby in ['none','meta']:
-        sortby_arg='ORDER BY MetaScore'
-    elif args.sortby=='user':
-        sortby_arg='ORDER BY UserScore'
-    else:
-        return [],f"invalid arguments for: -s {args.sortby}"
+    Returns
+    -------
+    filters: dict
+        platform, launchdate, mode, ratings, genres and search, None for no filter, and how the genres are combined
+    '''
+    return {
+        'platform':ABBR2PLATFORM.get(spec.platform),
+        'launchdate':spec.launchdate,
+        'mode':None if spec.mode=='none' else spec.mode,
+        'ratings':spec.ratings,
+        'genres':spec.genres,
+        'genre_match':spec.genre_match,
+        'search':None if spec.search is None else search_expression(spec.search),
+    }
 
-    if args.record>=0:
-        if args.sortby=='user':
-            review_filter = f"UserTotal >={args.record}"
-        else:
-            review_filter=f"CriticTotal >={args.record}"
-    else:
-        return [],f"invalid arguments for: -rl {args.record}"
 
+def _next_month(date):
+    return datetime.date(date.year+date.month//12,date.month%12+1,1)
 
-    if args.order=='top':
-        order='DESC'
-    elif args.order=='bottom':
-        order='ASC'
-    else:
-        return [],f"invalid arguments for: -o {args.order}"
 
-    if args.limit>0:
-        limit= f"LIMIT {args.limit}"
-    else:
-        return [],f"invalid arguments for: -l {args.limit}"
+def _split_months(launchdate):
+    '''Split a launch date range into the whole months it covers and the days of the months it covers in part
 
-    filters=[platform_filter,date_filter,mode_filter,rating_filter,review_filter]
-    filters=[x for x in filters if x]
-    if len(filters)==0:
-        filters_arg=''
-    else:
-        filters_arg='WHERE '+' AND '.join(filters)
+    Parameters
+    ----------
+    launchdate:
+        no date, one date or two dates, format: yyyy-mm-dd
 
-    query=f'''
-    SELECT GameName,Platform,MetaScore,UserScore,Developer,NumOfPlayers,Ratings,Genres,LaunchDate 
-    FROM Games
-    {filters_arg}
-    {sortby_arg} {order}
-    {limit}
+    Returns
+    -------
+    months:
+        the first whole month and, for two dates, the last whole month, format: yyyy-mm, the first comes after the
+        last if there is no whole month, None if the dates are not in the format
+    edges:
+        first and last dates of each month covered in part, at most two ranges, None if the dates are not in the
+        format
     '''
-    return query_db(query,db_path),""
+    try:
+        dates=[datetime.date.fromisoformat(date) for date in launchdate]
+    except ValueError:
+        return None,None
+    if [date.isoformat() for date in dates]!=list(launchdate):
+        return None,None
+    if len(dates)==0:
+        return [],[]
+    first=dates[0]
+    edges=[]
+    if first.day!=1:
+        month_end=_next_month(first)-datetime.timedelta(days=1)
+        edges.append((first,month_end if len(dates)==1 else min(month_end,dates[1])))
+        first=_next_month(first)
+    months=[first]
+    if len(dates)==2:
+        last=dates[1]
+        if (last+datetime.timedelta(days=1)).day!=1:
+            edge=(max(last.replace(day=1),dates[0]),last)
+            # a range inside one month is a single edge
+            if edge not in edges:
+                edges.append(edge)
+            last=last.replace(day=1)-datetime.timedelta(days=1)
+        months.append(last)
+    return [month.isoformat()[:7] for month in months],[(start.isoformat(),end.isoformat()) for start,end in edges]
 
 
-def process_query_companies(args,db_path):
-    '''Process the query for companies
+def _covers_whole_months(spec):
+    '''Whether the launch dates of a query, if any, cover whole months
 
     Parameters
     ----------
-    args:
-        parsed argument
-    db_path:
-        path to the database
+    spec:
+        the query
 
     Returns
     -------
-    result:
-        A list of query result
-    error_message:
-        error message, if is empty, the query is successful
+    bool
+        True if there is no launch date or the dates start and end on month bounds
     '''
-    if args.platform=='none':
-        platform_filter=''
-    elif args.platform in ABBR2PLATFORM:
-        platform_filter=f'Games.Platform="{ABBR2PLATFORM[args.platform]}"'
-    else:
-        return [],f"invalid arguments for: -p {args.platform}"
+    months,edges=_split_months(spec.launchdate or ())
+    return months is not None and len(edges)==0
 
-    if args.launchdate is None:
-        date_filter=''
-    elif isinstance(args.launchdate,list) and (len(args.launchdate)==1 or len(args.launchdate)==2):
-        if len(args.launchdate)==1:
-            date_filter=f'Games.LaunchDate >= "{args.launchdate[0]}"'
-        else:
-            date_filter=f'Games.LaunchDate BETWEEN "{args.launchdate[0]}" AND "{args.launchdate[1]}"'
-    else:
-        return [],f"invalid arguments for: -d {args.launchdate}"
-
-    if args.mode=='none':
-        mode_filter=''
-    elif args.mode=='online':
-        mode_filter='Games.NumOfPlayers > 0'
-    elif args.mode=='offline':
-        mode_filter='Games.NumOfPlayers = 0'
-    else:
-        return [],f"invalid arguments for: -m {args.mode}"
 
-    if args.ratings is None:
-        rating_filter=''
-    else:
-        rating_filters = []
-        for rating in args.ratings:
-            if rating in ['E','E10+','T','M']:
-                rating_filters.append(f'Games.Ratings = "{rating}"')
-            else:
-                return [],f"invalid arguments for: -r {args.ratings}"
-        rating_filter='('+' OR '.join(rating_filters)+')'
-
-    if args.sortby in ['none','meta']:
-        sortby_arg='ORDER BY [AVG(MetaScore)]'
-    elif args.sortby=='user':
-        sortby_arg='ORDER BY [AVG(UserScore)]'
-    elif args.sortby=='count':
-        sortby_arg='ORDER BY [COUNT(*)]'
-    else:
-        return [],f"invalid arguments for: -s {args.sortby}"
+def _uses_company_stats(spec):
+    '''Whether a valid company query can be answered from the per company aggregates
 
-    if args.record>=0:
-        count_filter=f"[Count(*)] >={args.record}"
-    else:
-        return [],f"invalid arguments for: -rl {args.record}"
+    The whole months come from the aggregates, the days of the months covered in part from the games.
 
+    Parameters
+    ----------
+    spec:
+        the query
 
-    if args.order=='top':
-        order='DESC'
-    elif args.order=='bottom':
-        order='ASC'
-    else:
-        return [],f"invalid arguments for: -o {args.order}"
+    Returns
+    -------
+    bool
+        True if the launch dates are in the yyyy-mm-dd format and there is no genre filter
+    '''
+    return spec.genres is None and _split_months(spec.launchdate or ())[0] is not None
+
+
+def _uses_monthly_games(spec):
+    '''Whether a valid line chart can be answered from the monthly game counts
+
+    The whole months come from the monthly game counts, the days of the months covered in part from the games.
+
+    Parameters
+    ----------
+    spec:
+        the query
+
+    Returns
+    -------
+    bool
+        True if the launch dates are in the yyyy-mm-dd format, the review filter is a bound of the review buckets
+        and there is no genre filter or search
+    '''
+    return (spec.genres is None and spec.search is None and spec.record in REVIEW_BUCKETS
+            and _split_months(spec.launchdate or ())[0] is not None)
+
+
+def _review_column(spec):
+    '''Column of the review count filter of a game query
+
+    Parameters
+    ----------
+    spec:
+        the query
+
+    Returns
+    -------
+    column: str
+        UserTotal when sorting by user score, otherwise CriticTotal
+    '''
+    return 'UserTotal' if spec.sortby=='user' else 'CriticTotal'
+
+
+def format_month(month):
+    '''Format a year and month integer like the launch dates
+
+    Parameters
+    ----------
+    month: int
+        year*100+month, None or 0 if unknown
+
+    Returns
+    -------
+    month: str
+        format: yyyy-mm, None if unknown
+    '''
+    if not month:
+        return None
+    return f"{month//100:04d}-{month%100:02d}"
 
-    if args.limit>0:
-        limit= f"LIMIT {args.limit}"
-    else:
-        return [],f"invalid arguments for: -l {args.limit}"
 
-    filters=[platform_filter,date_filter,mode_filter,rating_filter]
-    filters=[x for x in filters if x]
+def _filters(prefix,has_platform,date_count,mode,rating_count,genre_count=0,genre_match='any',has_search=False,
+             columns=GAME_COLUMNS):
+    '''Build the filters of a query shape, each value is a placeholder
+
+    Parameters
+    ----------
+    prefix: str
+        table the filtered columns belong to, e.g. "Games."
+    has_platform: bool
+        whether to filter by platform
+    date_count: int
+        number of launch dates, 0 for no date filter
+    mode: str
+        none|online|offline
+    rating_count: int
+        number of age groups, 0 for no rating filter
+    genre_count: int
+        number of genres, 0 for no genre filter, only for games
+    genre_match: str
+        any|all
+    has_search: bool
+        whether to keep the games found by the full-text search, only for games
+    columns: dict
+        names of the platform, date, mode, rating and game id columns
+
+    Returns
+    -------
+    filters: list
+        SQL of the filters
+    '''
+    filters=[]
+    if has_platform:
+        filters.append(f"{prefix}{columns['platform']}=?")
+    if date_count==1:
+        filters.append(f"{prefix}{columns['date']} >= ?")
+    elif date_count==2:
+        filters.append(f"{prefix}{columns['date']} BETWEEN ? AND ?")
+    if mode!='none':
+        filters.append(prefix+columns['mode'][mode])
+    if rating_count>0:
+        filters.append('('+' OR '.join([f"{prefix}{columns['rating']} = ?"]*rating_count)+')')
+    if genre_count>0:
+        # set operations on the sorted game ids of each genre instead of matching the Genres text
+        postings=f' {GENRE_MATCHES[genre_match]} '.join([GENRE_POSTINGS]*genre_count)
+        filters.append(f"{prefix}{columns['id']} IN ({postings})")
+    if has_search:
+        filters.append(f"{prefix}{columns['id']} IN ({GAME_SEARCH})")
+    return filters
+
+
+def _where(filters):
+    '''Join filters to a WHERE clause
+
+    Parameters
+    ----------
+    filters: list
+        SQL of the filters
+
+    Returns
+    -------
+    clause: str
+        the WHERE clause, empty if there is no filter
+    '''
     if len(filters)==0:
-        filters_arg=''
-    else:
-        filters_arg='WHERE '+' AND '.join(filters)
+        return ''
+    return 'WHERE '+' AND '.join(filters)
+
+
+def _keyset_filter(keyset,sort_column,order):
+    '''Filter keeping the games after the last game of the previous page
 
+    Parameters
+    ----------
+    keyset: str
+        after_value|after_null for the games after a score and an id, nulls|values for the games without a score or
+        with a score, used to go on once the scores after the previous page are exhausted
+    sort_column: str
+        column to sort by
+    order: str
+        ASC|DESC
+
+    Returns
+    -------
+    filter: str
+        SQL of the filter, the bound ranges of the score keep the index of the sort column usable
+    '''
+    if keyset=='after_value':
+        if order=='DESC':
+            return f"{sort_column} <=? AND ({sort_column} <? OR Id >?)"
+        return f"{sort_column} >=? AND ({sort_column} >? OR Id >?)"
+    if keyset=='after_null':
+        return f"{sort_column} IS NULL AND Id >?"
+    if keyset=='nulls':
+        return f"{sort_column} IS NULL"
+    return f"{sort_column} IS NOT NULL"
+
+
+@lru_cache(maxsize=256)
+def _games_sql(shape,review_column,sort_column,order,keyset=None):
+    '''SQL of the query for games of a shape
+
+    Parameters
+    ----------
+    shape: tuple
+        has_platform, date_count, mode, rating_count, genre_count, genre_match and has_search, see _filters
+    review_column: str
+        column of the review count filter
+    sort_column: str
+        column to sort by
+    order: str
+        ASC|DESC
+    keyset: str
+        first for the first page, or the keyset filter of a later page, see _keyset_filter. The games of a page
+        end with their id. None for a query without pages
 
-    query=f'''
+    Returns
+    -------
+    query: str
+        the query SQL
+    '''
+    filters=_filters('',*shape)+[f"{review_column} >=?"]
+    if keyset not in (None,'first'):
+        filters.append(_keyset_filter(keyset,sort_column,order))
+    # ties are listed in the order the games were added, which keeps the results stable whatever index is used
+    return f'''
+    SELECT GameName,Platform,MetaScore,UserScore,Developer,NumOfPlayers,Ratings,Genres,LaunchDate{'' if keyset is None else ',Id'}
+    FROM Games
+    {_where(filters)}
+    ORDER BY {sort_column} {order}, Id
+    LIMIT ?
+    '''
+
+
+def _edges_filter(column,edge_count):
+    '''Filter on the days of the months a launch date range covers in part
+
+    Parameters
+    ----------
+    column: str
+        launch date column
+    edge_count: int
+        number of date ranges, see _split_months
+
+    Returns
+    -------
+    filter: str
+        SQL of the filter, the first and last date of each range are placeholders
+    '''
+    return '('+' OR '.join([f"{column} BETWEEN ? AND ?"]*edge_count)+')'
+
+
+@lru_cache(maxsize=256)
+def _companies_sql(shape,by_month,sort_column,order,has_search=False,edge_count=0):
+    '''SQL of the query for companies of a shape
+
+    Parameters
+    ----------
+    shape: tuple
+        has_platform, date_count, mode, rating_count, genre_count, genre_match and has_search, see _filters
+    by_month: bool
+        whether to answer from the per company aggregates
+    sort_column: str
+        column to sort by
+    order: str
+        ASC|DESC
+    has_search: bool
+        whether to keep the companies found by the full-text search of their names
+    edge_count: int
+        number of date ranges of the months covered in part, aggregated from the games, see _split_months
+
+    Returns
+    -------
+    query: str
+        the query SQL
+    '''
+    if by_month:
+        # answer from the per company aggregates when the filters match their buckets
+        stats='CompanyStats'
+        stats_filter=_where(_filters('CompanyStats.',*shape,columns=STATS_COLUMNS)
+                            +([f"CompanyStats.CompanyId IN ({COMPANY_SEARCH})"] if has_search else []))
+        if edge_count>0:
+            # the games of the months covered in part are added to the aggregates of the whole months
+            edge_shape=(shape[0],0)+shape[2:]
+            stats=f'''(SELECT CompanyId,SUM(GameCount) AS GameCount,TOTAL(MetaScoreSum) AS MetaScoreSum,
+                    SUM(MetaScoreCount) AS MetaScoreCount,TOTAL(UserScoreSum) AS UserScoreSum,
+                    SUM(UserScoreCount) AS UserScoreCount
+                FROM CompanyStats
+                {stats_filter}
+                GROUP BY CompanyId
+                UNION ALL
+                SELECT Game2Company.CompanyId,COUNT(*),TOTAL(Games.MetaScore),COUNT(Games.MetaScore),
+                    TOTAL(ROUND(Games.UserScore*10)),COUNT(Games.UserScore)
+                FROM Game2Company
+                    JOIN Games ON Game2Company.GameId=Games.Id
+                {_where(_filters('Games.',*edge_shape)+[_edges_filter('Games.LaunchDate',edge_count)]
+                        +([f"Game2Company.CompanyId IN ({COMPANY_SEARCH})"] if has_search else []))}
+                GROUP BY Game2Company.CompanyId) AS CompanyStats'''
+            stats_filter=''
+        # user scores are summed in tenths, see database_utils.add_company_stats
+        return f'''
+        SELECT CompanyName,[Count(*)],Round([AVG(MetaScore)],1), Round([AVG(UserScore)],1)
+        From
+            (SELECT Companies.CompanyId,Companies.CompanyName,SUM(GameCount) AS [Count(*)],
+                TOTAL(MetaScoreSum)/SUM(MetaScoreCount) AS [AVG(MetaScore)],
+                TOTAL(UserScoreSum)/10/SUM(UserScoreCount) AS [AVG(UserScore)]
+            FROM {stats}
+                JOIN Companies
+                    ON CompanyStats.CompanyId=Companies.CompanyId
+            {stats_filter}
+            GROUP BY CompanyStats.CompanyId)
+        WHERE [Count(*)] >=?
+        ORDER BY {sort_column} {order}, CompanyId
+        LIMIT ?
+        '''
+
+    # user scores have one decimal, they are summed in tenths so the sum is exact whatever order the plan reads them
+    return f'''
     SELECT CompanyName,[Count(*)],Round([AVG(MetaScore)],1), Round([AVG(UserScore)],1)
     From
-        (SELECT Companies.CompanyName,Count(*),AVG(MetaScore), AVG(UserScore)
+        (SELECT Game2Company.CompanyId,Companies.CompanyName,Count(*),AVG(MetaScore),
+            TOTAL(ROUND(UserScore*10))/10/COUNT(UserScore) AS [AVG(UserScore)]
         FROM Game2Company
-            JOIN (SELECT * FROM Games {filters_arg}) AS Games
+            JOIN (SELECT * FROM Games {_where(_filters('Games.',*shape))}) AS Games
                 ON Game2Company.GameId=Games.Id
             JOIN Companies
                 ON Game2Company.CompanyId=Companies.CompanyId
+        {_where([f"Game2Company.CompanyId IN ({COMPANY_SEARCH})"] if has_search else [])}
         GROUP BY Game2Company.CompanyId)
-    WHERE {count_filter}
-    {sortby_arg} {order}
-    {limit}
+    WHERE [Count(*)] >=?
+    ORDER BY {sort_column} {order}, CompanyId
+    LIMIT ?
     '''
-    return query_db(query,db_path),""
 
-def draw_line_chart(args,data_base_path,return_html=False):
-    '''Draw the line chart according to the argument
+
+@lru_cache(maxsize=256)
+def _genres_sql(shape,sort_column,order):
+    '''SQL of the query for genres of a shape
 
     Parameters
     ----------
-    args:
-        parsed argument
-    data_base_path:
+    shape: tuple
+        has_platform, date_count, mode, rating_count, genre_count, genre_match and has_search, see _filters
+    sort_column: str
+        column to sort by
+    order: str
+        ASC|DESC
+
+    Returns
+    -------
+    query: str
+        the query SQL
+    '''
+    return f'''
+    SELECT Genre,[Count(*)],Round([AVG(MetaScore)],1), Round([AVG(UserScore)],1)
+    From
+        (SELECT Genres.GenreId,GenreNames.Genre,Count(*),AVG(MetaScore),
+            TOTAL(ROUND(UserScore*10))/10/COUNT(UserScore) AS [AVG(UserScore)]
+        FROM Genres
+            JOIN (SELECT * FROM Games {_where(_filters('Games.',*shape))}) AS Games
+                ON Genres.GameId=Games.Id
+            JOIN GenreNames
+                ON Genres.GenreId=GenreNames.GenreId
+        GROUP BY Genres.GenreId)
+    WHERE [Count(*)] >=?
+    ORDER BY {sort_column} {order}, GenreId
+    LIMIT ?
+    '''
+
+
+@lru_cache(maxsize=256)
+def _line_chart_sql(shape,review_column,by_month,edge_count=0):
+    '''SQL of the game count in each month of a shape
+
+    Parameters
+    ----------
+    shape: tuple
+        has_platform, date_count, mode, rating_count, genre_count, genre_match and has_search, see _filters
+    review_column: str
+        column of the review count filter
+    by_month: bool
+        whether to answer from the monthly game counts
+    edge_count: int
+        number of date ranges of the months covered in part, counted from the games, see _split_months
+
+    Returns
+    -------
+    query: str
+        the query SQL, the months are year*100+month
+    '''
+    if by_month:
+        filters=_filters('',*shape,columns=MONTHLY_COLUMNS)+[f"{REVIEW_BUCKET_COLUMNS[review_column]} >=?"]
+        counts=f'''MonthlyGames
+        {_where(filters)}'''
+        if edge_count>0:
+            # the games of the months covered in part are added to the counts of the whole months
+            edge_shape=(shape[0],0)+shape[2:]
+            edge_filters=_filters('',*edge_shape)+[_edges_filter('LaunchDate',edge_count),f"{review_column} >=?"]
+            counts=f'''(SELECT YearMonth,GameCount
+            FROM {counts}
+            UNION ALL
+            SELECT YearMonth,COUNT(*) AS GameCount
+            FROM Games
+            {_where(edge_filters)}
+            GROUP BY YearMonth)'''
+        return f'''
+        SELECT YearMonth,SUM(GameCount)
+        FROM {counts}
+        GROUP BY YearMonth
+        ORDER BY YearMonth
+        '''
+    filters=_filters('',*shape)+[f"{review_column} >=?"]
+    return f'''
+    SELECT YearMonth,COUNT(*)
+    FROM Games
+    {_where(filters)}
+    GROUP BY YearMonth
+    ORDER BY YearMonth
+    '''
+
+
+def compile_query(spec,kind):
+    '''Compile a query to parameterized SQL, the SQL is built once for each shape of query
+
+    Parameters
+    ----------
+    spec:
+        the query
+    kind: str
+        games|companies|genres|linechart
+
+    Returns
+    -------
+    query: str
+        the query SQL
+    params: tuple
+        values bound to the placeholders of the query
+    error_message:
+        error message, if is empty, the query is valid
+    '''
+    error_message=spec.validate(kind)
+    if error_message:
+        return '',(),error_message
+    launchdate=spec.launchdate or ()
+    ratings=spec.ratings or ()
+    genres=spec.genres or ()
+    # the search of a company query looks for company names, the other queries look for games
+    game_search=spec.search is not None and kind!='companies'
+    company_search=spec.search is not None and kind=='companies'
+    shape=(spec.platform!='none',len(launchdate),spec.mode,len(ratings),len(genres),spec.genre_match,game_search)
+    search=[search_expression(spec.search)] if spec.search is not None else []
+    # LIMIT -1 is no limit in SQLite
+    limit=-1 if spec.limit is None else spec.limit
+    params=[]
+    if spec.platform!='none':
+        params.append(ABBR2PLATFORM[spec.platform])
+    if kind=='companies' and _uses_company_stats(spec):
+        months,edges=_split_months(launchdate)
+        stats_params=params+months+list(ratings)+search
+        if edges:
+            stats_params+=params+list(ratings)+[date for edge in edges for date in edge]+search
+        query=_companies_sql(shape,True,SORT_COLUMNS[kind][spec.sortby],ORDERS[spec.order],company_search,len(edges))
+        return query,tuple(stats_params+[spec.record,limit]),""
+    if kind=='linechart' and _uses_monthly_games(spec):
+        months,edges=_split_months(launchdate)
+        count_params=params+[year_month(month+'-01') for month in months]+list(ratings)+[spec.record]
+        if edges:
+            count_params+=params+list(ratings)+[date for edge in edges for date in edge]+[spec.record]
+        return _line_chart_sql(shape,_review_column(spec),True,len(edges)),tuple(count_params),""
+    params+=launchdate
+    params+=ratings
+    params+=genres
+    params+=search
+    params.append(spec.record)
+    if kind=='companies':
+        query=_companies_sql(shape,False,SORT_COLUMNS[kind][spec.sortby],ORDERS[spec.order],company_search)
+        return query,tuple(params+[limit]),""
+    if kind=='genres':
+        query=_genres_sql(shape,SORT_COLUMNS[kind][spec.sortby],ORDERS[spec.order])
+        return query,tuple(params+[limit]),""
+    if kind=='linechart':
+        return _line_chart_sql(shape,_review_column(spec),False),tuple(params),""
+    query=_games_sql(shape,_review_column(spec),SORT_COLUMNS[kind][spec.sortby],ORDERS[spec.order])
+    return query,tuple(params+[limit]),""
+
+
+def encode_cursor(score,game_id):
+    '''Write the position of a game in the sorted games as the cursor of the next page
+
+    Parameters
+    ----------
+    score: float
+        sort score of the game, None if unknown
+    game_id: int
+        id of the game
+
+    Returns
+    -------
+    cursor: str
+        score and id, separated by a comma, the score is empty if unknown
+    '''
+    return f"{'' if score is None else score},{game_id}"
+
+
+def decode_cursor(cursor):
+    '''Read the position of a game from the cursor of a page, raises ValueError if the cursor is malformed
+
+    Parameters
+    ----------
+    cursor: str
+        see encode_cursor
+
+    Returns
+    -------
+    score: float
+        sort score of the game, None if unknown
+    game_id: int
+        id of the game
+    '''
+    score,game_id=cursor.split(',')
+    return (None if score=='' else float(score)),int(game_id)
+
+
+def compile_games_page(spec,after=None):
+    '''Compile a page of the game query to keyset queries, each page costs the same whatever its number
+
+    Parameters
+    ----------
+    spec:
+        the query, its limit is the size of the page
+    after: tuple
+        score and id of the last game of the previous page, None for the first page
+
+    Returns
+    -------
+    queries: list
+        query SQL and params of the segments of the page, read in turn until the page is full, they ask for one
+        more game than the page to know whether there is a next page
+    error_message:
+        error message, if is empty, the query is valid
+    '''
+    query,params,error_message=compile_query(spec,'games')
+    if error_message:
+        return [],error_message
+    # the params of the games query end with the review count and the limit, the keyset params go between them
+    filter_params=list(params[:-1])
+    shape=(spec.platform!='none',len(spec.launchdate or ()),spec.mode,len(spec.ratings or ()),
+           len(spec.genres or ()),spec.genre_match,spec.search is not None)
+    sort_column=SORT_COLUMNS['games'][spec.sortby]
+    order=ORDERS[spec.order]
+    if after is None:
+        return [(_games_sql(shape,_review_column(spec),sort_column,order,'first'),
+                 tuple(filter_params+[spec.limit+1]))],""
+    score,game_id=after
+    queries=[]
+    for keyset in PAGE_SEGMENTS[(order,score is None)]:
+        keyset_params={'after_value':[score,score,game_id],'after_null':[game_id]}.get(keyset,[])
+        queries.append((_games_sql(shape,_review_column(spec),sort_column,order,keyset),
+                        tuple(filter_params+keyset_params+[spec.limit+1])))
+    return queries,""
+
+
+class GamePage:
+    '''
+        A page of the game query, read lazily from SQLite so the rows can be rendered while they are fetched.
+        After the rows are iterated, next_cursor is the cursor of the next page, None if this is the last page.
+    '''
+    def __init__(self,spec,db_path,after=None):
+        '''Compile the page, raises ValueError if the query or the cursor is invalid
+
+        Parameters
+        ----------
+        spec:
+            the query, its limit is the size of the page
+        db_path:
+            path to the database
+        after: str
+            cursor of the previous page, see encode_cursor, None for the first page
+        '''
+        self.queries,error_message=compile_games_page(spec,None if after is None else decode_cursor(after))
+        if error_message:
+            raise ValueError(error_message)
+        self.db_path=db_path
+        self.limit=spec.limit
+        self.score_index=TARGET2FIELD['games'].index(SORT_COLUMNS['games'][spec.sortby])
+        self.next_cursor=None
+
+    def __iter__(self):
+        count=0
+        last=None
+        for query,params in self.queries:
+            # each segment asks for one more game than what is left of the page
+            params=params[:-1]+(self.limit-count+1,)
+            cursor=get_connection(self.db_path).execute(query,params)
+            while True:
+                rows=cursor.fetchmany(FETCH_SIZE)
+                if len(rows)==0:
+                    break
+                for row in rows:
+                    if count==self.limit:
+                        self.next_cursor=encode_cursor(last[self.score_index],last[-1])
+                        cursor.close()
+                        return
+                    count+=1
+                    last=row
+                    yield row[:-1]
+        self.next_cursor=None
+
+
+def process_query_games(spec,db_path):
+    '''Process the query for games
+
+    Parameters
+    ----------
+    spec:
+        the query
+    db_path:
         path to the database
-    return_html:
-        if true, will return the html of the graph, if false, will display the graph
+
     Returns
     -------
-    html:
-        html of the plot, used for flask
+    result:
+        A list of query result
     error_message:
         error message, if is empty, the query is successful
     '''
-    if args.platform=='none':
-        platform_filter=''
-    elif args.platform in ABBR2PLATFORM:
-        platform_filter=f'Platform="{ABBR2PLATFORM[args.platform]}"'
-    else:
-        return f"invalid arguments for: -p {args.platform}"
+    query,params,error_message=compile_query(spec,'games')
+    if error_message:
+        return [],error_message
+    engine,error_message=get_columnar_engine(spec,db_path)
+    if error_message:
+        return [],error_message
+    if engine is not None:
+        return engine.query_games(**columnar_filters(spec),
+                                  review_column=_review_column(spec),
+                                  record=spec.record,
+                                  sort_column=SORT_COLUMNS['games'][spec.sortby],
+                                  descending=spec.order=='top',
+                                  limit=spec.limit),""
+    return query_db(query,db_path,params),""
 
-    if args.launchdate is None:
-        date_filter=''
-    elif isinstance(args.launchdate,list) and (len(args.launchdate)==1 or len(args.launchdate)==2):
-        if len(args.launchdate)==1:
-            date_filter=f'LaunchDate >= "{args.launchdate[0]}"'
-        else:
-            date_filter=f'LaunchDate BETWEEN "{args.launchdate[0]}" AND "{args.launchdate[1]}"'
-    else:
-        return f"invalid arguments for: -d {args.launchdate}"
-
-    if args.mode=='none':
-        mode_filter=''
-    elif args.mode=='online':
-        mode_filter='NumOfPlayers > 0'
-    elif args.mode=='offline':
-        mode_filter='NumOfPlayers = 0'
-    else:
-        return f"invalid arguments for: -m {args.mode}"
 
-    if args.ratings is None:
-        rating_filter=''
-    else:
-        rating_filters = []
-        for rating in args.ratings:
-            if rating in ['E','E10+','T','M']:
-                rating_filters.append(f'Games.Ratings = "{rating}"')
-            else:
-                return [],f"invalid arguments for: -r {args.ratings}"
-        rating_filter='('+' OR '.join(rating_filters)+')'
+def process_query_companies(spec,db_path):
+    '''Process the query for companies
 
+    Parameters
+    ----------
+    spec:
+        the query
+    db_path:
+        path to the database
 
-    if args.record>=0:
-        if args.sortby=='user':
-            review_filter = f"UserTotal >={args.record}"
-        else:
-            review_filter=f"CriticTotal >={args.record}"
-    else:
-        return f"invalid arguments for: -rl {args.record}"
-    filters=[platform_filter,date_filter,mode_filter,rating_filter,review_filter]
-    filters=[x for x in filters if x]
-    if len(filters)==0:
-        filters_arg=''
-    else:
-        filters_arg='WHERE '+' AND '.join(filters)
+    Returns
+    -------
+    result:
+        A list of query result
+    error_message:
+        error message, if is empty, the query is successful
+    '''
+    query,params,error_message=compile_query(spec,'companies')
+    if error_message:
+        return [],error_message
+    engine,error_message=get_columnar_engine(spec,db_path)
+    if error_message:
+        return [],error_message
+    if engine is not None:
+        return engine.query_companies(**columnar_filters(spec),
+                                      record=spec.record,
+                                      sortby='meta' if spec.sortby=='none' else spec.sortby,
+                                      descending=spec.order=='top',
+                                      limit=spec.limit,
+                                      by_month=_uses_company_stats(spec) and _covers_whole_months(spec)),""
+    return query_db(query,db_path,params),""
+
+
+def process_query_genres(spec,db_path):
+    '''Process the query for genres
+
+    Parameters
+    ----------
+    spec:
+        the query
+    db_path:
+        path to the database
+
+    Returns
+    -------
+    result:
+        A list of query result
+    error_message:
+        error message, if is empty, the query is successful
+    '''
+    query,params,error_message=compile_query(spec,'genres')
+    if error_message:
+        return [],error_message
+    engine,error_message=get_columnar_engine(spec,db_path)
+    if error_message:
+        return [],error_message
+    if engine is not None:
+        return engine.query_genres(**columnar_filters(spec),
+                                   record=spec.record,
+                                   sortby='meta' if spec.sortby=='none' else spec.sortby,
+                                   descending=spec.order=='top',
+                                   limit=spec.limit),""
+    return query_db(query,db_path,params),""
+
+
+def process_query_line_chart(spec,db_path):
+    '''Process the query of the game count in each month
+
+    Parameters
+    ----------
+    spec:
+        the query
+    db_path:
+        path to the database
+
+    Returns
+    -------
+    result:
+        A list of months and game counts
+    error_message:
+        error message, if is empty, the query is successful
+    '''
+    query,params,error_message=compile_query(spec,'linechart')
+    if error_message:
+        return [],error_message
+    engine,error_message=get_columnar_engine(spec,db_path)
+    if error_message:
+        return [],error_message
+    if engine is not None:
+        return engine.query_month_counts(**columnar_filters(spec),
+                                         review_column=_review_column(spec),
+                                         record=spec.record),""
+    return [(format_month(month),count) for month,count in query_db(query,db_path,params)],""
 
-    query=f'''
-    SELECT SUBSTR(LaunchDate,1,7),COUNT(*)
-    FROM
-        (SELECT *
-        FROM Games
-        {filters_arg})
-    GROUP BY SUBSTR(LaunchDate,1,7)
+
+def search_names(text,db_path,limit=10):
+    '''Find games by their name, developers or genres and companies by their name, best matches first
+
+    The first SEARCH_CANDIDATES matches in id order are ranked, prefixes are left to autocomplete.
+
+    Parameters
+    ----------
+    text: str
+        whole words to look for
+    db_path:
+        path to the database
+    limit: int
+        number of games and of companies to return
+
+    Returns
+    -------
+    games: list
+        rows of the games, like the game query
+    companies: list
+        names and urls of the companies
+    '''
+    expression=search_expression(text,prefix=False)
+    if expression is None:
+        return [],[]
+    games=query_db(f'''
+        SELECT GameName,Platform,MetaScore,UserScore,Developer,NumOfPlayers,Ratings,Genres,LaunchDate
+        FROM (SELECT rowid FROM
+                (SELECT rowid,rank FROM GameSearch WHERE GameSearch MATCH ? LIMIT {SEARCH_CANDIDATES})
+            ORDER BY rank LIMIT ?) AS Found
+            JOIN Games ON Games.Id=Found.rowid
+    ''',db_path,(expression,limit))
+    companies=query_db(f'''
+        SELECT CompanyName,URL
+        FROM (SELECT rowid FROM
+                (SELECT rowid,rank FROM CompanySearch WHERE CompanySearch MATCH ? LIMIT {SEARCH_CANDIDATES})
+            ORDER BY rank LIMIT ?) AS Found
+            JOIN Companies ON Companies.CompanyId=Found.rowid
+    ''',db_path,(expression,limit))
+    return games,companies
+
+
+def autocomplete(text,db_path,limit=10):
+    '''Suggest game and company names containing words starting like the words of a text
+
+    Parameters
+    ----------
+    text: str
+        beginning of a name
+    db_path:
+        path to the database
+    limit: int
+        number of game names and of company names to return
+
+    Returns
+    -------
+    games: list
+        distinct game names
+    companies: list
+        company names
+    '''
+    expression=search_expression(text,columns=['GameName'])
+    if expression is None:
+        return [],[]
+    # read in index order without ranking, so a short prefix matching most of the names stays fast
+    games=query_db('SELECT DISTINCT GameName FROM GameSearch WHERE GameSearch MATCH ? LIMIT ?',db_path,
+                   (expression,limit))
+    companies=query_db('SELECT CompanyName FROM CompanySearch WHERE CompanySearch MATCH ? LIMIT ?',db_path,
+                       (search_expression(text),limit))
+    return [row[0] for row in games],[row[0] for row in companies]
+
+
+def make_line_chart(results):
+    '''Make the figure of the game count in each month
+
+    Parameters
+    ----------
+    results:
+        A list of months and game counts
+
+    Returns
+    -------
+    fig:
+        plotly figure
     '''
-    results=query_db(query, data_base_path)
     x_data=[x[0] for x in results]
     y_data=[x[1] for x in results]
     bar_data = go.Scatter(x=x_data, y=y_data)
@@ -385,19 +1294,75 @@ def draw_line_chart(args,data_base_path,return_html=False):
         xaxis_title="Time",
         yaxis_title="GameCount",
     )
+    return fig
+
+
+def draw_line_chart(spec,data_base_path,return_html=False):
+    '''Draw the line chart according to the query
+
+    Parameters
+    ----------
+    spec:
+        the query
+    data_base_path:
+        path to the database
+    return_html:
+        if true, will return the html of the graph, if false, will display the graph
+    Returns
+    -------
+    html:
+        html of the plot, used for flask
+    error_message:
+        error message, if is empty, the query is successful
+    '''
+    results,error_message=process_query_line_chart(spec,data_base_path)
+    if error_message:
+        return error_message
+    fig=make_line_chart(results)
     if return_html:
         return fig.to_html(full_html=False),""
     fig.show()
     return ""
 
 
-def process_query(args,db_path):
-    '''Process the query for companies
+def check_query_plans(db_path,arguments=PLAN_CHECK_ARGUMENTS):
+    '''Check with EXPLAIN QUERY PLAN that the generated queries use indexes instead of full table scans
+
+    Parameters
+    ----------
+    db_path:
+        path to the database
+    arguments:
+        list of query arguments to check
+
+    Returns
+    -------
+    full_scans: list
+        the arguments and plan steps scanning a whole table, empty if every query uses an index
+    '''
+    parser=get_argparser()
+    full_scans=[]
+    for argument in arguments:
+        spec=QuerySpec.from_args(parser.parse_args(argument.split(' ')))
+        query,params,error_message=compile_query(spec,'linechart' if spec.linechart else spec.target)
+        if error_message:
+            full_scans.append((argument,error_message))
+            continue
+        for row in query_db('EXPLAIN QUERY PLAN '+query,db_path,params):
+            step=row[-1]
+            match=re.match(r'SCAN (TABLE )?(\w+)',step)
+            if match and match.group(2) in TABLES and 'INDEX' not in step:
+                full_scans.append((argument,step))
+    return full_scans
+
+
+def process_query(spec,db_path):
+    '''Process the query for games, companies or genres
 
     Parameters
     ----------
-    args:
-        parsed argument
+    spec:
+        the query
     db_path:
         path to the database
 
@@ -408,53 +1373,175 @@ def process_query(args,db_path):
     error_message:
         error message, if is empty, the query is successful
     '''
-    if args.target=='games':
-        return process_query_games(args,db_path)
-    elif args.target=='companies':
-        return process_query_companies(args,db_path)
+    if spec.target=='games':
+        return process_query_games(spec,db_path)
+    elif spec.target=='companies':
+        return process_query_companies(spec,db_path)
+    elif spec.target=='genres':
+        return process_query_genres(spec,db_path)
     else:
-        return [],f"invalid arguments: -t {args.target}"
+        return [],f"invalid arguments: -t {spec.target}"
 
-def print_results(results,args):
+
+def print_results(results,spec):
     '''Pretty print query result
 
     Parameters
     ----------
     results:
         A list of query result
-    args:
-        parsed argument
+    spec:
+        the query
 
     Returns
     -------
     None
     '''
-    table=PrettyTable(field_names=TARGET2FIELD[args.target])
+    table=PrettyTable(field_names=TARGET2FIELD[spec.target])
     table.add_rows(results)
     table.float_format='.1'
     print(table)
 
-def draw_bar_chart(query_result,args,return_html=False):
-    '''Draw the bar chart for query result
+def fetch_batches(cursor,batch_size=EXPORT_BATCH_SIZE):
+    '''Read the rows of a cursor in batches, the rows are never held all at once
 
     Parameters
     ----------
-    query_result:
-        A list of query result
-    args:
-        parsed argument
-    return_html:
-        if true, will return the html of the graph, if false, will display the graph
+    cursor: sqlite3.Cursor
+        cursor of an executed query
+    batch_size: int
+        number of rows of each batch
 
     Returns
     -------
-    html:
-        html of the plot, used for flask
+    batches:
+        generator of lists of rows, the cursor is closed once they are read
+    '''
+    try:
+        while True:
+            rows=cursor.fetchmany(batch_size)
+            if len(rows)==0:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def query_batches(spec,db_path,batch_size=EXPORT_BATCH_SIZE):
+    '''Process a query for games, companies or genres and read its results in batches
+
+    Parameters
+    ----------
+    spec:
+        the query, always answered by SQLite
+    db_path:
+        path to the database
+    batch_size: int
+        number of rows of each batch
+
+    Returns
+    -------
+    batches:
+        generator of lists of rows, see fetch_batches
     error_message:
         error message, if is empty, the query is successful
     '''
-    sort_key=args.sortby
-    if args.target=='games':
+    if spec.target not in TARGET2FIELD:
+        return iter(()),f"invalid arguments: -t {spec.target}"
+    query,params,error_message=compile_query(spec,spec.target)
+    if error_message:
+        return iter(()),error_message
+    return fetch_batches(get_connection(db_path).execute(query,params),batch_size),""
+
+
+def ndjson_lines(rows,fields):
+    '''Write rows as lines of JSON objects
+
+    Parameters
+    ----------
+    rows: list
+        rows of a query result
+    fields: list
+        names of the columns
+
+    Returns
+    -------
+    lines: str
+        one JSON object per row, each ended by a newline
+    '''
+    return ''.join(json.dumps(dict(zip(fields,row)))+'\n' for row in rows)
+
+
+def export_results(spec,db_path,export_format,file_name):
+    '''Write the results of a query to a file, batch by batch in constant memory
+
+    Parameters
+    ----------
+    spec:
+        the query
+    db_path:
+        path to the database
+    export_format: str
+        csv|ndjson|parquet
+    file_name: str
+        path to the file
+
+    Returns
+    -------
+    count: int
+        number of rows written
+    error_message:
+        error message, if is empty, the export is successful
+    '''
+    if export_format not in EXPORT_FORMATS:
+        return 0,f"invalid arguments for: --export {export_format}"
+    if export_format=='parquet' and pyarrow is None:
+        return 0,"pyarrow is required for: --export parquet"
+    batches,error_message=query_batches(spec,db_path)
+    if error_message:
+        return 0,error_message
+    fields=TARGET2FIELD[spec.target]
+    count=0
+    if export_format=='parquet':
+        schema=pyarrow.schema([(field,pyarrow.type_for_alias(type_name))
+                               for field,type_name in zip(fields,TARGET2TYPE[spec.target])])
+        # one row group for each batch
+        with pyarrow.parquet.ParquetWriter(file_name,schema) as writer:
+            for rows in batches:
+                columns=[pyarrow.array(column,type=field.type) for column,field in zip(zip(*rows),schema)]
+                writer.write_table(pyarrow.Table.from_arrays(columns,schema=schema))
+                count+=len(rows)
+        return count,""
+    with open(file_name,'w',newline='',encoding='utf-8') as f:
+        if export_format=='csv':
+            writer=csv.writer(f)
+            writer.writerow(fields)
+        for rows in batches:
+            if export_format=='csv':
+                writer.writerows(rows)
+            else:
+                f.write(ndjson_lines(rows,fields))
+            count+=len(rows)
+    return count,""
+
+
+def make_bar_chart(query_result,spec):
+    '''Make the bar chart figure of a query result
+
+    Parameters
+    ----------
+    query_result:
+        A list of query result
+    spec:
+        the query
+
+    Returns
+    -------
+    fig:
+        plotly figure
+    '''
+    sort_key=spec.sortby
+    if spec.target=='games':
         if sort_key=='user':
             y_idx=3
         else:
@@ -466,7 +1553,7 @@ def draw_bar_chart(query_result,args,return_html=False):
             y_idx=2
         else:
             y_idx=1
-    if args.target=='games':
+    if spec.target=='games':
         x_data=[x[0]+' ('+x[1]+')' for x in query_result]
     else:
         x_data=[x[0] for x in query_result]
@@ -481,9 +1568,93 @@ def draw_bar_chart(query_result,args,return_html=False):
     else:
         y_title="GameCount"
     fig.update_layout(
-        xaxis_title=args.target,
+        xaxis_title=spec.target,
         yaxis_title=y_title,)
+    return fig
+
+
+def draw_bar_chart(query_result,spec,return_html=False):
+    '''Draw the bar chart for query result
+
+    Parameters
+    ----------
+    query_result:
+        A list of query result
+    spec:
+        the query
+    return_html:
+        if true, will return the html of the graph, if false, will display the graph
+
+    Returns
+    -------
+    html:
+        html of the plot, used for flask
+    error_message:
+        error message, if is empty, the query is successful
+    '''
+    fig=make_bar_chart(query_result,spec)
     if return_html:
         return fig.to_html(full_html=False),""
     fig.show()
-    return ""
\ No newline at end of file
+    return ""
+
+
+@lru_cache(maxsize=128)
+def _chart_json(kind,rows,target,sortby):
+    '''JSON of a chart, memoized on the rows it is drawn from
+
+    Parameters
+    ----------
+    kind: str
+        bar|line
+    rows: tuple
+        query result
+    target: str
+        games|companies|genres, for the bar chart
+    sortby: str
+        the sort option, for the bar chart
+
+    Returns
+    -------
+    figure: str
+        JSON figure spec
+    '''
+    if kind=='bar':
+        fig=make_bar_chart(rows,QuerySpec(target=target,sortby=sortby))
+    else:
+        fig=make_line_chart(rows)
+    return fig.to_json()
+
+
+def bar_chart_json(query_result,spec):
+    '''Get the bar chart of a query result as a JSON figure spec, drawn by plotly.js in the browser
+
+    Parameters
+    ----------
+    query_result:
+        A list of query result
+    spec:
+        the query
+
+    Returns
+    -------
+    figure: str
+        JSON figure spec
+    '''
+    return _chart_json('bar',tuple(query_result),spec.target,spec.sortby)
+
+
+def line_chart_json(results):
+    '''Get the line chart of the game count in each month as a JSON figure spec, drawn by plotly.js in the browser
+
+    Parameters
+    ----------
+    results:
+        A list of months and game counts
+
+    Returns
+    -------
+    figure: str
+        JSON figure spec
+    '''
+    return _chart_json('line',tuple(results),None,None)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    '''
+        A thread-safe LRU cache of query results with a time to live.
+        Every entry belongs to a data version of the database, all entries are dropped when the version changes.
+    '''
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        '''Get a cached result
+
+        Parameters
+        ----------
+        key: tuple
+            normalized query parameters
+        version: int
+            current data version of the database
+
+        Returns
+        -------
+        result:
+            the cached result, None if not cached or expired
+        '''
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, result):
+        '''Cache a result
+
+        Parameters
+        ----------
+        key: tuple
+            normalized query parameters
+        version: int
+            data version of the database the result was computed from
+        result:
+            the result to cache
+
+        Returns
+        -------
+        None
+        '''
+        with self.lock:
+            if version != self.version:
+                # computed from an older version of the data
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        '''Drop all cached results
+
+        Returns
+        -------
+        None
+        '''
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''Get the hit and miss counters
+
+        Returns
+        -------
+        stats: dict
+            hits, misses, number of cached results and the data version
+        '''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'version': self.version}
@@ -0,0 +1,197 @@
+import argparse
+import logging
+import signal
+import threading
+import time
+from database_utils import get_data_version, close_connections
+from query import PLAN_CHECK_ARGUMENTS, QuerySpec, get_argparser, compile_query
+import flask_app
+try:
+    from waitress.server import create_server
+except ImportError:
+    # waitress is only needed to serve the app with several threads
+    create_server = None
+
+# seconds given to the requests being served to finish when the server stops
+GRACE_PERIOD = 10
+# the default queries of the forms of the flask app, rendered into the result cache before the first request
+WARM_FORMS = {
+    '/results/games': {'platform': 'none', 'start_date': '2013-01-01', 'end_date': '2021-04-29', 'mode': 'none',
+                       'genres': '', 'genre_match': 'any', 'search': '', 'record': '5', 'sortby': 'meta',
+                       'order': 'top', 'limit': '10', 'plots': 'table'},
+    '/results/companies': {'platform': 'none', 'start_date': '2013-01-01', 'end_date': '2021-04-29', 'mode': 'none',
+                           'genres': '', 'genre_match': 'any', 'search': '', 'record': '5', 'sortby': 'meta',
+                           'order': 'top', 'limit': '10', 'plots': 'table'},
+}
+
+
+def warm_app(db_path):
+    '''Prepare the app before it serves requests: compile the SQL of the usual queries, read the data version and
+    render the default queries of the forms into the result cache
+
+    Parameters
+    ----------
+    db_path: str
+        path to the database
+
+    Returns
+    -------
+    None
+    '''
+    parser = get_argparser()
+    for argument in PLAN_CHECK_ARGUMENTS:
+        spec = QuerySpec.from_args(parser.parse_args(argument.split()))
+        compile_query(spec, spec.target)
+    if get_data_version(db_path) is None:
+        return
+    client = flask_app.app.test_client()
+    for url, form in WARM_FORMS.items():
+        # the streamed pages are only cached once their body is read
+        with client.post(url, data=form) as response:
+            response.get_data()
+
+
+class WarmTask:
+    '''
+        A task of the waitress thread pool opening the connection of its thread to the database. Each one waits for
+        the others, so every thread of the pool takes exactly one.
+    '''
+    def __init__(self, db_path, barrier):
+        self.db_path = db_path
+        self.barrier = barrier
+
+    def service(self):
+        # reading the data version opens the connection of the thread
+        get_data_version(self.db_path)
+        try:
+            self.barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+
+    def cancel(self):
+        self.barrier.abort()
+
+
+class GameServer:
+    '''
+        The flask app served by a pool of waitress threads, in the foreground or in a background thread.
+        Stopping the server lets the requests being served finish, then closes the connections to the database.
+    '''
+    def __init__(self, db_path, host='127.0.0.1', port=5000, threads=8, grace_period=GRACE_PERIOD):
+        '''Configure the app for the database, warm it and listen on the port, raises RuntimeError without waitress
+
+        Parameters
+        ----------
+        db_path: str
+            path to the database
+        host: str
+            address to listen on
+        port: int
+            port to listen on, 0 for any free port
+        threads: int
+            number of requests served at the same time
+        grace_period: float
+            seconds given to the requests being served to finish when the server stops
+        '''
+        if create_server is None:
+            raise RuntimeError("waitress is required to serve the flask app")
+        flask_app.DB_PATH = db_path
+        self.db_path = db_path
+        self.grace_period = grace_period
+        warm_app(db_path)
+        self.server = create_server(flask_app.app, host=host, port=port, threads=threads)
+        # the threads of the pool are already started, each one opens its connection before the first request
+        barrier = threading.Barrier(threads + 1, timeout=grace_period)
+        # the threads starting count as busy, so waitress would warn that the warm tasks are queued
+        queue_logger = logging.getLogger('waitress.queue')
+        level = queue_logger.level
+        queue_logger.setLevel(logging.ERROR)
+        try:
+            for _ in range(threads):
+                self.server.add_task(WarmTask(db_path, barrier))
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        finally:
+            queue_logger.setLevel(level)
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.server.effective_host}:{self.server.effective_port}"
+
+    def start(self):
+        '''Serve in a background thread
+
+        Returns
+        -------
+        None
+        '''
+        self.thread = threading.Thread(target=self._serve, name='waitress-server', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        '''Serve until the process is interrupted or terminated, then stop gracefully
+
+        Returns
+        -------
+        None
+        '''
+        if threading.current_thread() is threading.main_thread():
+            # terminate like Ctrl-C
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.start()
+        try:
+            while self.thread.is_alive():
+                self.thread.join(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            # the answers are flushed by the server loop, which the process must outlive
+            self.thread.join(max(self.deadline - time.monotonic(), 0))
+
+    def stop(self):
+        '''Let the requests being served finish for up to the grace period, then stop taking connections and close
+
+        Returns
+        -------
+        None
+        '''
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.deadline = time.monotonic() + self.grace_period
+        # the threads of the pool exit once their request is answered, the requests still queued are cancelled
+        self.server.task_dispatcher.shutdown(cancel_pending=True, timeout=self.grace_period)
+        # the server loop keeps flushing the answers and ends once the clients close their connections
+        self.server.close()
+        close_connections(self.db_path)
+
+    def _serve(self):
+        while True:
+            try:
+                self.server.run()
+                return
+            except OSError:
+                # the sockets closed by stop fail the select of the loop, which goes on with the connections left
+                if not self.stopped.is_set():
+                    raise
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the flask app with a pool of threads')
+    parser.add_argument('--db', default=flask_app.DB_PATH, help='path to the database')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', default=5000, type=int, help='port to listen on')
+    parser.add_argument('--threads', default=8, type=int, help='number of requests served at the same time')
+    parser.add_argument('--grace-period', default=GRACE_PERIOD, type=float,
+                        help='seconds given to the requests being served to finish on shutdown')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    server = GameServer(args.db, args.host, args.port, args.threads, args.grace_period)
+    print(f"Serving {args.db} on {server.url} with {args.threads} threads, "
+          f"warmed in {time.perf_counter() - start:.2f}s")
+    server.run()
+    print("Stopped")
@@ -0,0 +1,164 @@
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from page_cache import PageCache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+
+def load_pages(cache_files):
+    '''Load saved pages from cache files, keyed by the path of their url
+
+    Parameters
+    ----------
+    cache_files: list
+        paths to the cache files, json or sqlite
+
+    Returns
+    -------
+    pages: dict
+        path and query of the url to html
+    '''
+    pages = {}
+    for cache_file in cache_files:
+        if cache_file.endswith('.json'):
+            with open(cache_file) as f:
+                saved = json.load(f).items()
+        else:
+            saved = PageCache(cache_file).items()
+        for url, html in saved:
+            parsed = urlparse(url)
+            path = parsed.path + ('?' + parsed.query if parsed.query else '')
+            pages[path] = html
+    return pages
+
+
+def make_handler(pages, delay, error_rate=0.0, last_modified=None, failures=0, retry_after='0', delays=None):
+    '''Make a request handler serving the saved pages
+
+    Pages are served over keep-alive connections with an ETag and a Last-Modified, conditional requests get a 304
+    and gzip is used if the client accepts it.
+
+    Parameters
+    ----------
+    pages: dict
+        path and query of the url to html
+    delay: float
+        seconds to wait before answering, to simulate a slow link
+    error_rate: float
+        ratio of the requests answered with a 429 or a 503, to exercise the retries of the crawler
+    last_modified: float
+        timestamp sent as Last-Modified of every page, the start of the server if None
+    failures: int
+        number of the first requests of each page answered with a 429 then 503s, for repeatable retries
+    retry_after: str
+        Retry-After sent with the 429 and 503 answers
+    delays: dict
+        path and query of some urls to the seconds to wait before answering them, instead of delay
+
+    Returns
+    -------
+    handler:
+        request handler class, its statuses counter counts the sent statuses, its attempts counter the requests of
+        each path and its conditions list keeps the path, If-None-Match and If-Modified-Since of every request
+    '''
+    last_modified = formatdate(time.time() if last_modified is None else last_modified, usegmt=True)
+    etags = {path: '"' + hashlib.md5(html.encode('utf-8')).hexdigest() + '"' for path, html in pages.items()}
+    delays = delays or {}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        statuses = Counter()
+        attempts = Counter()
+        conditions = []
+
+        def send_status(self, status):
+            self.statuses[status] += 1
+            self.send_response(status)
+
+        def not_modified(self, etag):
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match is not None:
+                return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+            if_modified_since = self.headers.get('If-Modified-Since')
+            if if_modified_since is not None:
+                try:
+                    return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+        def do_GET(self):
+            with lock:
+                self.attempts[self.path] += 1
+                attempt = self.attempts[self.path]
+            self.conditions.append((self.path, self.headers.get('If-None-Match'),
+                                    self.headers.get('If-Modified-Since')))
+            time.sleep(delays.get(self.path, delay))
+            status = None
+            if attempt <= failures:
+                status = 429 if attempt == 1 else 503
+            elif random.random() < error_rate:
+                status = random.choice([429, 503])
+            if status is not None:
+                self.send_status(status)
+                self.send_header('Retry-After', retry_after)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            html = pages.get(self.path)
+            if html is None:
+                self.statuses[404] += 1
+                self.send_error(404)
+                return
+            etag = etags[self.path]
+            if self.not_modified(etag):
+                self.send_status(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                return
+            body = html.encode('utf-8')
+            self.send_status(200)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+if __name__ == '__main__':
+    # a local stand-in for metacritic serving pages saved in cache files, point the crawler to it
+    # through cache_data.BASE_URL and cache_data.GAME_BASE_URL, e.g. http://127.0.0.1:8000
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cache_files', nargs='+', help='cache files with the pages to serve')
+    parser.add_argument('--port', default=8000, type=int, help='port to listen on')
+    parser.add_argument('--delay', default=0.0, type=float, help='seconds to wait before each response')
+    parser.add_argument('--error-rate', default=0.0, type=float,
+                        help='ratio of the requests answered with a 429 or a 503')
+    args = parser.parse_args()
+    handler = make_handler(load_pages(args.cache_files), args.delay, args.error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), handler)
+    print(f"Serving {', '.join(args.cache_files)} on port {args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print("Responses:", dict(sorted(handler.statuses.items())))
@@ -0,0 +1,414 @@
+import argparse
+import datetime
+import html
+import os
+import random
+import re
+import time
+from cache_data import BASE_URL, GAME_BASE_URL, WRITE_BATCH_SIZE, batched
+from page_cache import PageCache
+
+PLATFORMS = {
+    'ps4': "PlayStation 4",
+    'ps5': "PlayStation 5",
+    'switch': 'Switch',
+    'xboxone': 'Xbox One',
+    'xbox-series-x': 'Xbox Series X'
+}
+RATINGS = ['E', 'E10+', 'T', 'M', None]
+GENRES = ['Action', 'Adventure', 'Role-Playing', 'Strategy', 'Puzzle', 'Sports', 'Racing', 'Shooter', 'Simulation',
+          'Platformer', 'Fighting', "Shoot-'Em-Up", 'Action RPG', 'Turn-Based', 'Open-World', 'Party']
+PLAYERS = [None, 0, 2, 4, 8, 64]
+# words of the game and company names, so searches match a realistic share of the games
+ADJECTIVES = ['Crimson', 'Silent', 'Eternal', 'Hidden', 'Broken', 'Golden', 'Lost', 'Savage', 'Iron', 'Frozen',
+              'Wild', 'Dark', 'Final', 'Ancient', 'Neon', 'Hollow', 'Royal', 'Shattered', 'Little', 'Super']
+NOUNS = ['Dragon', 'Kingdom', 'Legend', 'Tower', 'Knight', 'Odyssey', 'Empire', 'Frontier', 'Shadow', 'Quest',
+         'Racer', 'Island', 'Galaxy', 'Dungeon', 'Warrior', 'Garden', 'Station', 'Hunter', 'Chronicle', 'Arena']
+STUDIO_WORDS = ['Studios', 'Games', 'Interactive', 'Entertainment', 'Software', 'Works', 'Digital', 'Labs']
+# listing pages of metacritic hold 100 games
+GAMES_PER_PAGE = 100
+FIRST_DAY = datetime.date(2013, 1, 1)
+LAST_DAY = datetime.date(2021, 4, 30)
+
+
+def default_companies(num_games):
+    '''Number of companies of a corpus, about one company for every 50 games
+
+    Parameters
+    ----------
+    num_games: int
+        number of games
+
+    Returns
+    -------
+    num_companies: int
+        number of companies
+    '''
+    return max(10, num_games // 50)
+
+
+def slug(name):
+    return re.sub('[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def make_companies(num_companies, seed=0):
+    '''Make the companies of a corpus
+
+    Parameters
+    ----------
+    num_companies: int
+        number of companies
+    seed: int
+        random seed
+
+    Returns
+    -------
+    companies: list
+        name, url and review count of each company
+    '''
+    rng = random.Random(f"{seed}-companies")
+    companies = []
+    for i in range(num_companies):
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(STUDIO_WORDS)} {i}"
+        url = GAME_BASE_URL + '/company/' + slug(name)
+        companies.append((name, url, rng.randint(1, 5000)))
+    return companies
+
+
+def make_game(rng, index, platform, num_companies):
+    '''Make a game
+
+    Parameters
+    ----------
+    rng: random.Random
+        random generator of the platform
+    index: int
+        index of the game on its platform, keeps the names unique
+    platform: str
+        platform abbreviation
+    num_companies: int
+        number of companies, the first ones develop most of the games
+
+    Returns
+    -------
+    game: dict
+        the fields shown on the listing and detail pages of the game
+    '''
+    name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index}"
+    critic_counts = None if rng.random() < 0.2 else [rng.randint(1, 80), rng.randint(0, 20), rng.randint(0, 10)]
+    user_counts = None if rng.random() < 0.2 else [rng.randint(1, 5000), rng.randint(0, 800), rng.randint(0, 800)]
+    return {
+        'name': name,
+        'url': f"/game/{platform}/{slug(name)}",
+        'platform': PLATFORMS[platform],
+        'date': FIRST_DAY + datetime.timedelta(days=rng.randrange((LAST_DAY - FIRST_DAY).days)),
+        'meta': None if rng.random() < 0.3 else rng.randint(20, 99),
+        'user': None if rng.random() < 0.3 else rng.randint(10, 99) / 10,
+        # skewed towards the first companies, like the big publishers
+        'developers': sorted({int(num_companies * rng.random() ** 3) for _ in range(rng.choice([0, 1, 1, 1, 2]))}),
+        'genres': rng.sample(GENRES, rng.randint(0, 3)),
+        'players': rng.choice(PLAYERS),
+        'rating': rng.choice(RATINGS),
+        'critic_counts': critic_counts,
+        'user_counts': user_counts,
+    }
+
+
+def iter_games(platform, num_games, num_companies, seed=0):
+    '''Make the games of a platform
+
+    Parameters
+    ----------
+    platform: str
+        platform abbreviation
+    num_games: int
+        number of games on the platform
+    num_companies: int
+        number of companies
+    seed: int
+        random seed
+
+    Returns
+    -------
+    games: generator
+        games in the order of the listing pages
+    '''
+    rng = random.Random(f"{seed}-{platform}")
+    for index in range(num_games):
+        yield make_game(rng, index, platform, num_companies)
+
+
+def split_games(num_games, platforms):
+    '''Split the games of a corpus between the platforms
+
+    Parameters
+    ----------
+    num_games: int
+        number of games in total
+    platforms: list
+        platform abbreviations
+
+    Returns
+    -------
+    counts: dict
+        number of games of each platform
+    '''
+    share, extra = divmod(num_games, len(platforms))
+    return {platform: share + (i < extra) for i, platform in enumerate(platforms)}
+
+
+def game_info(game, companies):
+    '''The record the crawler makes of a game from its listing and detail pages
+
+    Parameters
+    ----------
+    game: dict
+        the game
+    companies: list
+        the companies of the corpus
+
+    Returns
+    -------
+    game_info: list
+        game info in the format of write_to_data_base
+    '''
+    critic_total = critic_ratio = user_total = user_ratio = None
+    if game['critic_counts'] is not None:
+        critic_total = sum(game['critic_counts'])
+        critic_ratio = game['critic_counts'][0] / critic_total
+    if game['user_counts'] is not None:
+        user_total = sum(game['user_counts'])
+        user_ratio = game['user_counts'][0] / user_total
+    return [game['name'], game['date'], game['platform'], game['meta'], game['user'],
+            [companies[i][0] for i in game['developers']], game['players'], game['rating'],
+            critic_total, critic_ratio, user_total, user_ratio, game['genres']]
+
+
+def iter_records(num_games, num_companies=None, seed=0, platforms=tuple(PLATFORMS), batch_size=WRITE_BATCH_SIZE):
+    '''Make the records of a corpus in batches, the same records crawling its pages gives
+
+    Parameters
+    ----------
+    num_games: int
+        number of games
+    num_companies: int
+        number of companies, default_companies if None
+    seed: int
+        random seed
+    platforms: list
+        platform abbreviations
+    batch_size: int
+        number of games in each batch
+
+    Returns
+    -------
+    batches: generator
+        company infos first seen in the batch and game infos of each batch, for write_to_data_base
+    '''
+    if num_companies is None:
+        num_companies = default_companies(num_games)
+    companies = make_companies(num_companies, seed)
+    seen = set()
+    for platform, count in split_games(num_games, platforms).items():
+        for games in batched(iter_games(platform, count, num_companies, seed), batch_size):
+            new = sorted({i for game in games for i in game['developers']} - seen)
+            seen.update(new)
+            yield [list(companies[i]) for i in new], [game_info(game, companies) for game in games]
+
+
+def format_date(date):
+    return f"{date:%B} {date.day}, {date.year}"
+
+
+def listing_page(games, pages):
+    '''Html of a listing page, as read by get_games_single_page and get_page_count
+
+    Parameters
+    ----------
+    games: list
+        games on the page
+    pages: int
+        number of listing pages of the platform
+
+    Returns
+    -------
+    html: str
+        html of the page
+    '''
+    rows = []
+    for game in games:
+        meta = 'tbd' if game['meta'] is None else game['meta']
+        user = 'tbd' if game['user'] is None else game['user']
+        rows.append(f'''<tr><td class="clamp-summary-wrap">
+<a href="{game['url']}" class="metascore_anchor"><div class="metascore_w large game positive">{meta}</div></a>
+<a href="{game['url']}" class="title"><h3>{html.escape(game['name'])}</h3></a>
+<div class="clamp-details"><div class="platform"><span class="label">Platform:</span><span class="data">
+ {game['platform']} </span></div><span>{format_date(game['date'])}</span></div>
+<div class="clamp-score-wrap"><div class="metascore_w user large game positive">{user}</div></div>
+</td></tr>''')
+    pager = ''
+    if pages > 1:
+        pager = (f'<ul class="pages"><li class="page last_page"><span class="page_nav_spacer">…</span>'
+                 f'<a class="page_num" href="?page={pages - 1}">{pages}</a></li></ul>')
+    return f'<html><body><table class="clamp-list">{"".join(rows)}</table>{pager}</body></html>'
+
+
+def detail_page(game, companies):
+    '''Html of a game page, as read by get_game_detail_info
+
+    Parameters
+    ----------
+    game: dict
+        the game
+    companies: list
+        the companies of the corpus
+
+    Returns
+    -------
+    html: str
+        html of the page
+    '''
+    developers = ', '.join(f'<a class="button" href="{companies[i][1][len(GAME_BASE_URL):]}">'
+                           f'{html.escape(companies[i][0])}</a>' for i in game['developers'])
+    details = [f'<li class="summary_detail developer"><span class="label">Developer:</span>'
+               f'<span class="data">{developers}</span></li>',
+               '<li class="summary_detail product_genre"><span class="label">Genre(s):</span>'
+               + ', '.join(f'<span class="data">{html.escape(genre)}</span>' for genre in game['genres'])
+               + '</li>']
+    if game['players'] is not None:
+        players = 'No Online Multiplayer' if game['players'] == 0 else f"Up to {game['players']}"
+        details.append(f'<li class="summary_detail product_players"><span class="label"># of players:</span>'
+                       f'<span class="data">{players}</span></li>')
+    if game['rating'] is not None:
+        details.append(f'<li class="summary_detail product_rating"><span class="label">Rating:</span>'
+                       f'<span class="data">{game["rating"]}</span></li>')
+    modules = []
+    for kind, counts in (('critic', game['critic_counts']), ('user', game['user_counts'])):
+        if counts is not None:
+            modules.append(f'<div class="module reviews_module {kind}_reviews_module"><ol class="score_counts">'
+                           + ''.join(f'<li class="score_count"><span class="label">{label}:</span>'
+                                     f'<span class="count">{count:,}</span></li>'
+                                     for label, count in zip(('Positive', 'Mixed', 'Negative'), counts))
+                           + '</ol></div>')
+    return (f'<html><body><div class="product_title"><h1>{html.escape(game["name"])}</h1></div>'
+            f'<ul class="summary_details">{"".join(details)}</ul>{"".join(modules)}</body></html>')
+
+
+def company_page(company):
+    '''Html of a developer page, as read by get_company_review_count
+
+    Parameters
+    ----------
+    company: tuple
+        name, url and review count of the company
+
+    Returns
+    -------
+    html: str
+        html of the page
+    '''
+    return (f'<html><body><h1 class="company_title">{html.escape(company[0])}</h1>'
+            f'<div class="reviews_total"><span class="label">Reviews:</span>'
+            f'<span class="count">{company[2]:,}</span></div></body></html>')
+
+
+def iter_pages(num_games, num_companies=None, seed=0, platforms=tuple(PLATFORMS), games_per_page=GAMES_PER_PAGE):
+    '''Make the pages of a corpus one at a time, so any number of games fits in memory
+
+    Parameters
+    ----------
+    num_games: int
+        number of games
+    num_companies: int
+        number of companies, default_companies if None
+    seed: int
+        random seed
+    platforms: list
+        platform abbreviations
+    games_per_page: int
+        number of games on each listing page
+
+    Returns
+    -------
+    pages: generator
+        platform, kind (listing|detail|company), url and html of each page, a platform's developer pages follow
+        its games
+    '''
+    if num_companies is None:
+        num_companies = default_companies(num_games)
+    companies = make_companies(num_companies, seed)
+    for platform, count in split_games(num_games, platforms).items():
+        url = BASE_URL.format(platform)
+        pages = max(1, -(-count // games_per_page))
+        developers = set()
+        games = iter_games(platform, count, num_companies, seed)
+        for page in range(pages):
+            page_games = [next(games) for _ in range(min(games_per_page, count - page * games_per_page))]
+            listing = listing_page(page_games, pages)
+            yield platform, 'listing', f"{url}?page={page}", listing
+            if page == 0:
+                # the crawler reads the page count from the bare url
+                yield platform, 'listing', url, listing
+            for game in page_games:
+                developers.update(game['developers'])
+                yield platform, 'detail', GAME_BASE_URL + game['url'], detail_page(game, companies)
+        for i in sorted(developers):
+            yield platform, 'company', companies[i][1], company_page(companies[i])
+
+
+def write_corpus(cache_dir, num_games, num_companies=None, seed=0, platforms=tuple(PLATFORMS),
+                 batch_size=WRITE_BATCH_SIZE):
+    '''Write the pages of a corpus into cache_<platform>.sqlite page caches, which the crawler and stub_server.py read
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory of the cache files
+    num_games: int
+        number of games
+    num_companies: int
+        number of companies, default_companies if None
+    seed: int
+        random seed
+    platforms: list
+        platform abbreviations
+    batch_size: int
+        number of pages stored in each transaction
+
+    Returns
+    -------
+    counts: dict
+        number of pages of each kind
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    caches = {}
+    counts = {'listing': 0, 'detail': 0, 'company': 0}
+    try:
+        for batch in batched(iter_pages(num_games, num_companies, seed, platforms), batch_size):
+            for platform in {page[0] for page in batch}:
+                if platform not in caches:
+                    caches[platform] = PageCache(os.path.join(cache_dir, f'cache_{platform}.sqlite'))
+                    caches[platform].clear()
+                caches[platform].update((url, page) for page_platform, _, url, page in batch
+                                        if page_platform == platform)
+            for _, kind, _, _ in batch:
+                counts[kind] += 1
+    finally:
+        for cache in caches.values():
+            cache.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic corpus of metacritic pages into page caches')
+    parser.add_argument('cache_dir', help='directory of the cache files')
+    parser.add_argument('--games', default=10000, type=int, help='number of games, 1k to 1M')
+    parser.add_argument('--companies', default=None, type=int, help='number of companies, one per 50 games if unset')
+    parser.add_argument('--seed', default=0, type=int, help='random seed')
+    parser.add_argument('--platforms', default=list(PLATFORMS), nargs='+', choices=list(PLATFORMS),
+                        help='platforms of the games')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    counts = write_corpus(args.cache_dir, args.games, args.companies, args.seed, args.platforms)
+    print(f"Wrote {counts['listing']} listing, {counts['detail']} game and {counts['company']} developer pages "
+          f"in {time.perf_counter() - start:.1f}s")
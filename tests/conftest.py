@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+
+# the modules of the project sit at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_utils import create_tables, write_to_data_base, close_connections  # noqa: E402
+from stub_server import make_handler  # noqa: E402
+from synthetic_corpus import iter_records  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    '''A database of a small synthetic corpus'''
+    db_path = str(tmp_path / 'games.sqlite')
+    create_tables(db_path)
+    for company_infos, game_infos in iter_records(500, seed=0):
+        write_to_data_base(company_infos, game_infos, db_path)
+    yield db_path
+    close_connections(db_path)
+
+
+@pytest.fixture
+def stub_server():
+    '''Start stub_server.py handlers on free ports, gives the url of each server and its handler class'''
+    servers = []
+
+    def start(pages, delay=0.0, **options):
+        handler = make_handler(pages, delay, **options)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}', handler
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
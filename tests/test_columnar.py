@@ -0,0 +1,18 @@
+import sqlite3
+import pytest
+
+np = pytest.importorskip('numpy')
+from columnar import round_like_sqlite  # noqa: E402
+
+
+def test_round_like_sqlite():
+    # the averages of meta scores and of user scores summed in tenths, with every half of small counts
+    values = np.concatenate([np.arange(100 * count + 1) / scale / count
+                             for count in range(1, 101) for scale in (1, 10)] + [np.array([np.nan])])
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE Scores (Score REAL)')
+    connection.executemany('INSERT INTO Scores VALUES (?)',
+                           ((None if np.isnan(value) else float(value),) for value in values))
+    expected = [row[0] for row in connection.execute('SELECT ROUND(Score, 1) FROM Scores ORDER BY rowid')]
+    rounded = [None if np.isnan(value) else float(value) for value in round_like_sqlite(values)]
+    assert rounded == expected
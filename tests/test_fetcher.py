@@ -0,0 +1,76 @@
+import time
+import pytest
+import requests
+import cache_data
+from cache_data import Fetcher, RateLimiter, fetch_urls_using_cache
+from page_cache import PageCache
+
+PAGES = {f'/game/{i}': f'<html>game {i}</html>' for i in range(8)}
+
+
+@pytest.fixture
+def fetcher():
+    # no backoff and no rate limit, the tests only wait for what the server asks
+    fetcher = Fetcher(limiter=RateLimiter(0), backoff=0)
+    yield fetcher
+    fetcher.close()
+
+
+def test_fetch(stub_server, fetcher):
+    url, handler = stub_server(PAGES)
+    html, etag, last_modified = fetcher.fetch(url + '/game/1')
+    assert html == PAGES['/game/1']
+    assert etag is not None and last_modified is not None
+    assert handler.statuses == {200: 1}
+
+
+def test_retries_throttled_and_failing_requests(stub_server, fetcher):
+    url, handler = stub_server(PAGES, failures=2)
+    html, _, _ = fetcher.fetch(url + '/game/1')
+    assert html == PAGES['/game/1']
+    assert handler.statuses == {429: 1, 503: 1, 200: 1}
+
+
+def test_gives_up_after_the_retries(stub_server, fetcher):
+    url, handler = stub_server(PAGES, failures=fetcher.retries + 1)
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch(url + '/game/1')
+    assert handler.attempts['/game/1'] == fetcher.retries + 1
+
+
+def test_honours_retry_after(stub_server, fetcher):
+    url, handler = stub_server(PAGES, failures=1, retry_after='1')
+    start = time.monotonic()
+    html, _, _ = fetcher.fetch(url + '/game/1')
+    assert html == PAGES['/game/1']
+    assert time.monotonic() - start >= 1
+    assert handler.statuses == {429: 1, 200: 1}
+
+
+def test_rate_limit_spaces_requests_to_a_host(stub_server):
+    url, handler = stub_server(PAGES)
+    fetcher = Fetcher(limiter=RateLimiter(0.1), backoff=0)
+    try:
+        start = time.monotonic()
+        for path in list(PAGES)[:4]:
+            fetcher.fetch(url + path)
+        assert time.monotonic() - start >= 0.3
+    finally:
+        fetcher.close()
+
+
+def test_concurrent_fetches_keep_the_order_of_the_urls(stub_server, fetcher, monkeypatch, tmp_path):
+    # the first urls answer last
+    paths = list(PAGES)
+    url, handler = stub_server(PAGES, delays={path: 0.05 * (len(paths) - i) for i, path in enumerate(paths)},
+                               failures=1)
+    monkeypatch.setattr(cache_data, 'fetcher', fetcher)
+    cache = PageCache(str(tmp_path / 'cache.sqlite'))
+    try:
+        urls = [url + path for path in paths + paths[:1]]
+        pages = fetch_urls_using_cache(urls, cache, workers=len(paths))
+    finally:
+        cache.close()
+    assert pages == [PAGES[path] for path in paths + paths[:1]]
+    # every url is fetched once, after its 429
+    assert handler.statuses == {429: len(paths), 200: len(paths)}
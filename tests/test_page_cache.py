@@ -0,0 +1,50 @@
+import pytest
+import cache_data
+from cache_data import Fetcher, RateLimiter, fetch_urls_using_cache
+from page_cache import PageCache
+
+PAGES = {'/game/1': '<html>game 1</html>', '/game/2': '<html>game 2</html>'}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    fetcher = Fetcher(limiter=RateLimiter(0), backoff=0)
+    monkeypatch.setattr(cache_data, 'fetcher', fetcher)
+    cache = PageCache(str(tmp_path / 'cache.sqlite'))
+    yield cache
+    cache.close()
+    fetcher.close()
+
+
+def test_refresh_revalidates_with_the_stored_validators(stub_server, cache):
+    url, handler = stub_server(PAGES)
+    urls = [url + path for path in PAGES]
+    assert fetch_urls_using_cache(urls, cache) == list(PAGES.values())
+    validators = {path: cache.validators(url + path) for path in PAGES}
+    assert all(etag and last_modified for etag, last_modified in validators.values())
+    # the cached body is what comes back when the server answers 304
+    cache.store(urls[0], 'cached body', *validators['/game/1'])
+    assert fetch_urls_using_cache(urls, cache, refresh=True) == ['cached body', PAGES['/game/2']]
+    assert handler.statuses == {200: 2, 304: 2}
+    refetches = handler.conditions[len(PAGES):]
+    assert sorted(refetches) == sorted((path,) + validators[path] for path in PAGES)
+    assert cache.validators(urls[0]) == validators['/game/1']
+
+
+def test_refresh_with_only_last_modified(stub_server, cache):
+    url, handler = stub_server(PAGES)
+    fetch_urls_using_cache([url + '/game/1'], cache)
+    _, last_modified = cache.validators(url + '/game/1')
+    cache.store(url + '/game/1', 'cached body', None, last_modified)
+    assert fetch_urls_using_cache([url + '/game/1'], cache, refresh=True) == ['cached body']
+    assert handler.conditions[-1] == ('/game/1', None, last_modified)
+    assert handler.statuses[304] == 1
+
+
+def test_refresh_replaces_a_changed_page(stub_server, cache):
+    url, handler = stub_server(PAGES)
+    cache.store(url + '/game/1', 'old body', '"old"', None)
+    assert fetch_urls_using_cache([url + '/game/1'], cache, refresh=True) == [PAGES['/game/1']]
+    assert handler.conditions == [('/game/1', '"old"', None)]
+    assert handler.statuses == {200: 1}
+    assert cache.validators(url + '/game/1')[0] != '"old"'
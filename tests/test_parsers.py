@@ -0,0 +1,49 @@
+import datetime
+import json
+import os
+import pytest
+from cache_data import get_parsers
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parsers')
+# golden pages written with synthetic_corpus, with names, counts and missing fields the parsers have to handle
+DETAIL_PAGES = 5
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='module')
+def expected():
+    return json.loads(read_fixture('expected.json'))
+
+
+@pytest.fixture(params=['bs4', 'lxml'])
+def parsers(request):
+    try:
+        return get_parsers(request.param)
+    except ValueError as e:
+        pytest.skip(str(e))
+
+
+def test_page_count(parsers, expected):
+    assert parsers['page_count'](read_fixture('listing.html')) == expected['page_count']
+
+
+def test_listing(parsers, expected):
+    games, urls = parsers['listing'](read_fixture('listing.html'))
+    assert games == [[name, datetime.date.fromisoformat(date), platform, meta_score, user_score]
+                     for name, date, platform, meta_score, user_score in expected['listing']]
+    assert urls == expected['listing_urls']
+
+
+@pytest.mark.parametrize('index', range(DETAIL_PAGES))
+def test_detail(parsers, expected, index):
+    attributes, developers = parsers['detail'](read_fixture(f'detail_{index}.html'))
+    assert attributes == expected['detail'][index]['attributes']
+    assert developers == expected['detail'][index]['developers']
+
+
+def test_company(parsers, expected):
+    assert parsers['company'](read_fixture('company.html')) == expected['company']
@@ -0,0 +1,17 @@
+from werkzeug.datastructures import MultiDict
+import flask_app
+from database_utils import get_data_version
+from query import QuerySpec
+from serve import WARM_FORMS, warm_app
+
+
+def test_warm_app_caches_the_default_forms(database, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DB_PATH', database)
+    flask_app.result_cache.clear()
+    warm_app(database)
+    version = get_data_version(database)
+    games = QuerySpec.from_form('games', MultiDict(WARM_FORMS['/results/games']))
+    companies = QuerySpec.from_form('companies', MultiDict(WARM_FORMS['/results/companies']))
+    # the games page is streamed, the key carries the page it starts after
+    assert flask_app.result_cache.get(flask_app.query_key(games) + (None,), version) is not None
+    assert flask_app.result_cache.get(flask_app.query_key(companies), version) is not None